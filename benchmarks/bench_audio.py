@@ -0,0 +1,342 @@
+"""Benchmark the audio processing stages on synthetic episodes.
+
+Generates MP3s of tones and noise with NumPy and ffmpeg, then runs each
+stage of ad removal on them: split, transcribe and annotate (with the OpenAI
+client stubbed out, so only local work such as building the upload copy is
+measured), trim with each engine, and join. Every stage runs in a fresh
+process, so that its peak RSS is its own. Wall time, CPU time and peak RSS
+of the stage and of the ffmpeg processes it started are written as JSON.
+
+    python benchmarks/bench_audio.py --minutes 10 60 240 --output results.json
+    python benchmarks/bench_audio.py compare baseline.json results.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import numpy as np
+from openai.types.audio.transcription_verbose import TranscriptionVerbose
+from openai.types.chat.parsed_chat_completion import ParsedChatCompletion
+
+from ad_begone.ffmpeg import encode_mp3
+from ad_begone.models import SegmentAnnotation, TrimEngine
+from ad_begone.mp3_frames import read_frame_index
+from ad_begone.utils import (
+    UPLOAD_BITRATE_KBPS,
+    OpenAITranscriber,
+    _merged_completion,
+    _remove_ads,
+    cached_annotate_transcription,
+    cached_transcription,
+    find_ad_time_windows,
+    get_ordered_annotations,
+    join_files,
+    split_file,
+)
+
+SAMPLE_RATE = 44100
+CHANNELS = 2
+# Synthetic transcripts have a segment every few seconds, and a one minute
+# ad every ten minutes.
+SEGMENT_SECONDS = 6.0
+AD_EVERY_SECONDS = 600.0
+AD_SECONDS = 60.0
+ENGINES: tuple[TrimEngine, ...] = ("pydub", "frames", "stream")
+
+
+def generate_episode(file_name: str, minutes: float, seed: int = 0) -> None:
+    """Encode ``minutes`` of drifting tones over noise to an MP3, a minute at a time."""
+    rng = np.random.default_rng(seed)
+    proc = encode_mp3(file_name, SAMPLE_RATE, CHANNELS)
+    t = np.arange(SAMPLE_RATE * 60) / SAMPLE_RATE
+    for minute in range(int(np.ceil(minutes))):
+        seconds = min(60.0, minutes * 60 - minute * 60)
+        n = int(seconds * SAMPLE_RATE)
+        freq = 220.0 * 2 ** (rng.integers(0, 24) / 12)
+        tone = 0.3 * np.sin(2 * np.pi * freq * t[:n])
+        noise = 0.05 * rng.standard_normal((n, CHANNELS))
+        pcm = np.clip(tone[:, None] + noise, -1, 1)
+        proc.stdin.write((pcm * 32767).astype("<i2").tobytes())
+    proc.stdin.close()
+    if proc.wait() != 0:
+        raise RuntimeError(f"ffmpeg failed to encode {file_name}: {proc.stderr.read().decode()}")
+
+
+def _stub_transcription(file_name: str) -> TranscriptionVerbose:
+    duration = read_frame_index(file_name).duration()
+    starts = np.arange(0.0, duration, SEGMENT_SECONDS)
+    segments = []
+    for i, start in enumerate(starts):
+        ad = start % AD_EVERY_SECONDS >= AD_EVERY_SECONDS - AD_SECONDS
+        segments.append({
+            "id": i, "seek": 0, "start": float(start), "end": float(min(start + SEGMENT_SECONDS, duration)),
+            "text": " This episode is sponsored by Acme, use code BENCH." if ad else " And so the story goes on.",
+            "tokens": [1], "temperature": 0.0, "avg_logprob": -0.2,
+            "compression_ratio": 1.5, "no_speech_prob": 0.001,
+        })
+    return TranscriptionVerbose.model_validate({
+        "duration": duration, "language": "english", "text": "", "segments": segments,
+    })
+
+
+def _stub_chat(**request) -> ParsedChatCompletion:
+    annotations = []
+    for line in request["messages"][1]["content"].splitlines():
+        if not line.startswith("Segment "):
+            continue
+        index, text = line[len("Segment "):].split(":", 1)
+        label = "ad" if "sponsored" in text else "content"
+        if not annotations or annotations[-1].segment_type != label:
+            annotations.append(SegmentAnnotation(segment_type=label, segment_index=int(index)))
+    return _merged_completion([], annotations, model=request["model"])
+
+
+class StubClient:
+    """Answers transcription and chat calls locally, in place of the OpenAI client."""
+
+    def __init__(self, parts: list[str]):
+        # Uploads are named after the part they were made from.
+        self._parts = {Path(part).name: part for part in parts}
+        self.audio = SimpleNamespace(transcriptions=SimpleNamespace(create=self._transcribe))
+        self.beta = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(parse=_stub_chat)))
+
+    def _transcribe(self, file, **kwargs) -> TranscriptionVerbose:
+        name = file[0] if isinstance(file, tuple) else Path(file.name).name
+        return _stub_transcription(self._parts[name])
+
+    def __call__(self, kind: str = "chat") -> "StubClient":
+        return self
+
+
+def _stage_split(episode: str, work_dir: str) -> list[str]:
+    copy = Path(work_dir) / Path(episode).name
+    shutil.copyfile(episode, copy)
+    return split_file(str(copy), upload_bitrate_kbps=UPLOAD_BITRATE_KBPS, run_id="bench")
+
+
+def _stage_transcribe(parts: list[str]) -> None:
+    with patch("ad_begone.utils._get_client", StubClient(parts)):
+        for part in parts:
+            cached_transcription(
+                part,
+                file_transcription=part + ".transcription.json",
+                transcriber=OpenAITranscriber(),
+            )
+
+
+def _stage_annotate(parts: list[str]) -> None:
+    with patch("ad_begone.utils._get_client", StubClient(parts)):
+        for part in parts:
+            transcription = cached_transcription(part, file_transcription=part + ".transcription.json")
+            cached_annotate_transcription(
+                transcription,
+                file_name=part + ".segments.json",
+                model="bench",
+                encoding="segment",
+            )
+
+
+def _stage_trim(parts: list[str], engine: TrimEngine) -> None:
+    for part in parts:
+        transcription = cached_transcription(part, file_transcription=part + ".transcription.json")
+        completion = cached_annotate_transcription(transcription, file_name=part + ".segments.json", model="bench")
+        windows = find_ad_time_windows(transcription, get_ordered_annotations(completion))
+        _remove_ads(
+            part,
+            transcription=transcription,
+            windows=windows,
+            out_name=part.replace("part_", f"trimmed_{engine}_part_"),
+            engine=engine,
+        )
+
+
+def _stage_join(episode: str, parts: list[str]) -> None:
+    copies = []
+    for part in parts:
+        copy = part.replace("part_", "join_part_")
+        shutil.copyfile(part, copy)
+        copies.append(copy)
+    join_files(episode, overwrite=False, file_parts=copies)
+
+
+_STAGES = {
+    "generate": generate_episode,
+    "split": _stage_split,
+    "transcribe": _stage_transcribe,
+    "annotate": _stage_annotate,
+    "trim": _stage_trim,
+    "join": _stage_join,
+}
+
+
+def _reset_peak_rss() -> None:
+    # A spawned process starts with its parent's peak RSS on Linux, which
+    # writing 5 to clear_refs resets.
+    try:
+        Path("/proc/self/clear_refs").write_text("5")
+    except OSError:
+        pass
+
+
+def _peak_rss_mb() -> float:
+    try:
+        for line in Path("/proc/self/status").read_text().splitlines():
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss is in KiB on Linux and bytes on macOS.
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+
+def _measure(stage: str, *args) -> dict:
+    """Run a stage in this (fresh) process and report what it cost."""
+    _reset_peak_rss()
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    result = _STAGES[stage](*args)
+    wall = time.perf_counter() - wall
+    cpu = time.process_time() - cpu
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return dict(
+        wall_s=round(wall, 3),
+        cpu_s=round(cpu, 3),
+        children_cpu_s=round(children.ru_utime + children.ru_stime, 3),
+        peak_rss_mb=round(_peak_rss_mb(), 1),
+        children_peak_rss_mb=round(children.ru_maxrss / scale, 1),
+        result=result,
+    )
+
+
+def run_stage(stage: str, *args) -> dict:
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+        return pool.submit(_measure, stage, *args).result()
+
+
+def _git_revision() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True, cwd=Path(__file__).parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(minutes: list[float], engines: list[TrimEngine], work_dir: str) -> dict:
+    results = []
+    work = Path(work_dir)
+    work.mkdir(parents=True, exist_ok=True)
+    for length in minutes:
+        episode = work / f"episode_{length:g}min.mp3"
+        if not episode.exists():
+            print(f"Generating {length:g} minute episode", file=sys.stderr)
+            # In its own process, so that this one stays small for the
+            # stages it spawns.
+            run_stage("generate", str(episode), length)
+        run_dir = work / f"run_{length:g}min"
+        shutil.rmtree(run_dir, ignore_errors=True)
+        run_dir.mkdir()
+
+        def _record(stage: str, measured: dict, engine: str | None = None) -> None:
+            measured.pop("result", None)
+            row = dict(minutes=length, stage=stage, engine=engine, input_mb=round(episode.stat().st_size / 1024 / 1024, 1))
+            row.update(measured)
+            results.append(row)
+            print(
+                f"{length:>5g} min  {stage + (f' ({engine})' if engine else ''):<16} "
+                f"wall {row['wall_s']:>8.2f}s  cpu {row['cpu_s'] + row['children_cpu_s']:>8.2f}s  "
+                f"rss {max(row['peak_rss_mb'], row['children_peak_rss_mb']):>8.1f} MB",
+                file=sys.stderr,
+            )
+
+        measured = run_stage("split", str(episode), str(run_dir))
+        parts = measured["result"]
+        _record("split", measured)
+        _record("transcribe", run_stage("transcribe", parts))
+        _record("annotate", run_stage("annotate", parts))
+        for engine in engines:
+            _record("trim", run_stage("trim", parts, engine), engine)
+        _record("join", run_stage("join", str(run_dir / episode.name), parts))
+        shutil.rmtree(run_dir, ignore_errors=True)
+
+    return dict(
+        revision=_git_revision(),
+        timestamp=datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        python=platform.python_version(),
+        platform=platform.platform(),
+        cpu_count=os.cpu_count(),
+        results=results,
+    )
+
+
+def compare(baseline: dict, current: dict) -> list[tuple[str, float, float, float]]:
+    """Return ``(name, wall ratio, cpu ratio, rss ratio)`` for stages present in both runs."""
+
+    def _key(row: dict) -> str:
+        return f"{row['minutes']:g} min {row['stage']}" + (f" ({row['engine']})" if row["engine"] else "")
+
+    def _cpu(row: dict) -> float:
+        return row["cpu_s"] + row["children_cpu_s"]
+
+    def _rss(row: dict) -> float:
+        return max(row["peak_rss_mb"], row["children_peak_rss_mb"])
+
+    before = {_key(row): row for row in baseline["results"]}
+    rows = []
+    for row in current["results"]:
+        old = before.get(_key(row))
+        if old is None:
+            continue
+        rows.append((
+            _key(row),
+            row["wall_s"] / old["wall_s"] if old["wall_s"] else float("nan"),
+            _cpu(row) / _cpu(old) if _cpu(old) else float("nan"),
+            _rss(row) / _rss(old) if _rss(old) else float("nan"),
+        ))
+    return rows
+
+
+def main() -> None:
+    if len(sys.argv) > 1 and sys.argv[1] == "compare":
+        parser = argparse.ArgumentParser(description="Compare two benchmark results.")
+        parser.add_argument("baseline")
+        parser.add_argument("current")
+        args = parser.parse_args(sys.argv[2:])
+        rows = compare(json.loads(Path(args.baseline).read_text()), json.loads(Path(args.current).read_text()))
+        print(f"{'stage':<28} {'wall':>7} {'cpu':>7} {'rss':>7}")
+        for name, wall, cpu, rss in rows:
+            print(f"{name:<28} {wall:>6.2f}x {cpu:>6.2f}x {rss:>6.2f}x")
+        return
+
+    parser = argparse.ArgumentParser(description="Benchmark the audio processing stages on synthetic episodes.")
+    parser.add_argument("--minutes", type=float, nargs="+", default=[10, 60, 240])
+    parser.add_argument("--engines", nargs="+", choices=ENGINES, default=list(ENGINES))
+    parser.add_argument("--work-dir", default=".bench", help="Where synthetic episodes are generated and kept.")
+    parser.add_argument("--output", help="File to write the JSON results to (default: stdout).")
+    args = parser.parse_args()
+
+    report = run(args.minutes, args.engines, args.work_dir)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,22 @@
 import logging
+import os
+from typing import Any, Callable
 
 from openai.types.audio.transcription_verbose import TranscriptionVerbose
 from openai.types.chat.parsed_chat_completion import ParsedChatCompletion
 
-from .models import Window
+from .fingerprint import (
+    MAX_AD_SECONDS,
+    MIN_AD_SECONDS,
+    Fingerprint,
+    FingerprintMatch,
+    fingerprint_file,
+    get_fingerprint_index,
+    known_ad_segments,
+    overlay_matches,
+)
+from .models import SegmentAnnotation, TrimEngine, Window
+from .shingles import get_shingle_index
 from .utils import (
     cached_annotate_transcription,
     cached_transcription,
@@ -17,43 +30,172 @@ from .notif_path import NOTIF_PATH
 logger = logging.getLogger(__name__)
 
 
+def _mtime_ns(path: str) -> int | None:
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
 class AdTrimmer:
 
-    def __init__(self, file_name: str, model: str | None = None):
+    def __init__(
+        self,
+        file_name: str,
+        model: str | None = None,
+        engine: TrimEngine = "pydub",
+    ):
         self.file_name = file_name
         self.model = model
+        self.engine = engine
         if not file_name.endswith(".mp3"):
             logger.error("Invalid file extension for AdTrimmer: %s", file_name)
             raise ValueError("File name must end with .mp3")
         self.transcription_cache_file = file_name + ".transcription.json"
         self.segments_cache_file = file_name + ".segments.json"
+        # Loaded artifacts, each with the mtimes of the cache files it came from.
+        self._memo: dict[str, tuple[tuple[int | None, ...], Any]] = {}
+
+    def _memoized(self, name: str, paths: tuple[str, ...], load: Callable[[], Any]) -> Any:
+        """Return ``load()``, reusing the last result while ``paths`` are unchanged."""
+        cached = self._memo.get(name)
+        if cached is not None and cached[0] == tuple(_mtime_ns(p) for p in paths):
+            return cached[1]
+        value = load()
+        # Stamp after loading, since a cache miss writes the backing file.
+        self._memo[name] = (tuple(_mtime_ns(p) for p in paths), value)
+        return value
 
     def transcription(self) -> TranscriptionVerbose:
-        return cached_transcription(
-            file_name=self.file_name,
-            file_transcription=self.transcription_cache_file,
+        return self._memoized(
+            "transcription",
+            (self.transcription_cache_file,),
+            lambda: cached_transcription(
+                file_name=self.file_name,
+                file_transcription=self.transcription_cache_file,
+            ),
         )
 
+    def fingerprint(self) -> Fingerprint:
+        return self._memoized("fingerprint", (self.file_name,), lambda: fingerprint_file(self.file_name))
+
+    def fingerprint_matches(self) -> list[FingerprintMatch]:
+        """Find ads from the fingerprint index in this file, if an index is configured."""
+        index = get_fingerprint_index()
+        if index is None or not len(index):
+            return []
+
+        def _match():
+            matches = index.match(self.fingerprint())
+            if matches:
+                logger.info("Recognised %d known ad(s) in %s", len(matches), self.file_name)
+            return matches
+
+        return self._memoized("matches", (self.file_name,), _match)
+
+    def transcript_matches(self) -> set[int]:
+        """Find segments that repeat a known ad read, if a shingle index is configured."""
+        index = get_shingle_index()
+        if index is None or not len(index):
+            return set()
+
+        def _match():
+            known = index.known_segments([seg.text for seg in self.transcription().segments])
+            if known:
+                logger.info("Recognised %d segment(s) of known ad reads in %s", len(known), self.file_name)
+            return known
+
+        return self._memoized("transcript_matches", (self.transcription_cache_file,), _match)
+
+    def known_ads(self) -> set[int] | None:
+        """Return the segments recognised as known ads by the configured indexes, if any."""
+        matches = self.fingerprint_matches()
+        known = self.transcript_matches()
+        if matches:
+            known = known | known_ad_segments(self.transcription(), matches)
+        return known or None
+
     def segments_completion(self) -> ParsedChatCompletion:
-        return cached_annotate_transcription(
-            transcription=self.transcription(),
-            file_name=self.segments_cache_file,
-            model=self.model,
+        def _annotate():
+            return cached_annotate_transcription(
+                transcription=self.transcription(),
+                file_name=self.segments_cache_file,
+                model=self.model,
+                known_ad_segments=self.known_ads(),
+            )
+
+        return self._memoized(
+            "completion",
+            (self.transcription_cache_file, self.segments_cache_file),
+            _annotate,
+        )
+
+    def annotations(self) -> list[SegmentAnnotation]:
+        return self._memoized(
+            "annotations",
+            (self.transcription_cache_file, self.segments_cache_file),
+            lambda: get_ordered_annotations(self.segments_completion()),
         )
 
     def get_time_windows(self) -> list[Window]:
-        annotations = get_ordered_annotations(self.segments_completion())
-        return find_ad_time_windows(self.transcription(), annotations)
+        return self._memoized(
+            "windows",
+            (self.transcription_cache_file, self.segments_cache_file),
+            lambda: overlay_matches(
+                find_ad_time_windows(self.transcription(), self.annotations()),
+                self.fingerprint_matches(),
+            ),
+        )
+
+    def index_ads(self, windows: list[Window], audio: bool = True, transcript: bool = True) -> int:
+        """Add newly found ads to the configured indexes; return how many were added.
+
+        ``audio`` and ``transcript`` select which of the two indexes to update.
+        """
+        fingerprints = get_fingerprint_index() if audio else None
+        shingles = get_shingle_index() if transcript else None
+        if fingerprints is None and shingles is None:
+            return 0
+        added = 0
+        for window in windows:
+            if window.segment_type != "ad" or not MIN_AD_SECONDS <= window.duration() <= MAX_AD_SECONDS:
+                continue
+            new = False
+            if fingerprints is not None and not any(
+                m.start < window.end and window.start < m.end for m in self.fingerprint_matches()
+            ):
+                fingerprints.add(self.fingerprint().window(window.start, window.end), source=self.file_name)
+                new = True
+            if shingles is not None:
+                segments = [
+                    i for i, seg in enumerate(self.transcription().segments)
+                    if window.start <= (seg.start + seg.end) / 2 < window.end
+                ]
+                if segments and not set(segments) <= self.transcript_matches():
+                    text = " ".join(self.transcription().segments[i].text for i in segments)
+                    new = shingles.add(text, source=self.file_name) is not None or new
+            added += new
+        return added
 
     def remove_ads(
         self,
         out_name: str | None = None,
         notif_name: str = NOTIF_PATH,
-    ):
-        _remove_ads(
+    ) -> list[Window]:
+        windows = self.get_time_windows()
+        # Fingerprint before trimming, which may overwrite the file. The
+        # transcripts are only indexed once the trim has succeeded.
+        self.index_ads(windows, transcript=False)
+        windows = _remove_ads(
             file_name=self.file_name,
+            transcription=self.transcription(),
+            windows=windows,
             out_name=out_name,
             notif_name=notif_name,
             file_name_transcription_cache=self.transcription_cache_file,
+            file_name_segments_cache=self.segments_cache_file,
             model=self.model,
+            engine=self.engine,
         )
+        self.index_ads(windows, audio=False)
+        return windows
@@ -0,0 +1,157 @@
+"""Content-addressed cache for transcriptions and annotations.
+
+Results are stored under a hash of what produced them rather than under the
+name of the file they came from, so identical audio anywhere in the library,
+such as a re-download or an episode cross-posted to two feeds, is only sent
+to the API once. The store is enabled by pointing ``AD_BEGONE_CACHE_DIR`` at
+a directory; ``AD_BEGONE_CACHE_MAX_MB`` bounds its size, evicting the least
+recently used artifacts first.
+"""
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+from pathlib import Path
+
+from .mp3_frames import read_frame_index
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR_ENV = "AD_BEGONE_CACHE_DIR"
+CACHE_MAX_MB_ENV = "AD_BEGONE_CACHE_MAX_MB"
+
+_CHUNK_SIZE = 1024 * 1024
+
+
+def audio_digest(file_name: str) -> str:
+    """Hash the audio frames of an MP3, ignoring ID3 and other tags.
+
+    Files that cannot be indexed as MP3 are hashed whole.
+    """
+    digest = hashlib.sha256()
+    try:
+        index = read_frame_index(file_name)
+    except ValueError:
+        start, end = 0, os.path.getsize(file_name)
+    else:
+        start, end = index.byte_range(0, len(index))
+
+    with open(file_name, "rb") as f:
+        f.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            chunk = f.read(min(_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            digest.update(chunk)
+            remaining -= len(chunk)
+    return digest.hexdigest()
+
+
+def artifact_key(*parts: str) -> str:
+    """Combine the inputs that determine an artifact into one key."""
+    return hashlib.sha256("\0".join(parts).encode()).hexdigest()
+
+
+class ArtifactStore:
+
+    def __init__(self, root: str, max_bytes: int | None = None):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self._size: int | None = None
+        self._lock = threading.Lock()
+
+    def path(self, kind: str, key: str) -> Path:
+        return self.root / kind / key[:2] / f"{key}.json"
+
+    def get(self, kind: str, key: str) -> str | None:
+        path = self.path(kind, key)
+        try:
+            text = path.read_text(encoding="utf-8")
+        except FileNotFoundError:
+            return None
+        # The mtime doubles as the last-used time for eviction.
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        logger.debug("Artifact cache hit for %s %s", kind, key)
+        return text
+
+    def put(self, kind: str, key: str, text: str) -> None:
+        path = self.path(kind, key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Write to a temporary file first so readers never see partial JSON.
+        fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(text)
+            os.replace(tmp_name, path)
+        except BaseException:
+            if os.path.exists(tmp_name):
+                os.remove(tmp_name)
+            raise
+
+        if self.max_bytes is not None:
+            with self._lock:
+                if self._size is None:
+                    self._size = sum(size for _, size, _ in self._entries())
+                else:
+                    self._size += os.path.getsize(path)
+                over_budget = self._size > self.max_bytes
+            if over_budget:
+                self.evict()
+
+    def _entries(self) -> list[tuple[float, int, Path]]:
+        entries = []
+        for path in self.root.glob("*/*/*.json"):
+            try:
+                st = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def evict(self, max_bytes: int | None = None) -> int:
+        """Delete least recently used artifacts until the store fits the budget.
+
+        Returns the number of bytes freed.
+        """
+        budget = self.max_bytes if max_bytes is None else max_bytes
+        with self._lock:
+            entries = sorted(self._entries())
+            total = sum(size for _, size, _ in entries)
+            freed = 0
+            if budget is not None:
+                for _, size, path in entries:
+                    if total - freed <= budget:
+                        break
+                    try:
+                        path.unlink()
+                    except FileNotFoundError:
+                        pass
+                    freed += size
+            self._size = total - freed
+        if freed:
+            logger.info("Evicted %.1f MB from artifact cache %s", freed / 1024 / 1024, self.root)
+        return freed
+
+
+_STORES: dict[str, ArtifactStore] = {}
+_STORES_LOCK = threading.Lock()
+
+
+def get_artifact_store() -> ArtifactStore | None:
+    """Return the store configured by ``AD_BEGONE_CACHE_DIR``, if any."""
+    root = os.environ.get(CACHE_DIR_ENV)
+    if not root:
+        return None
+    max_mb = os.environ.get(CACHE_MAX_MB_ENV)
+    with _STORES_LOCK:
+        if root not in _STORES:
+            _STORES[root] = ArtifactStore(
+                root,
+                max_bytes=int(float(max_mb) * 1024 * 1024) if max_mb else None,
+            )
+        return _STORES[root]
@@ -0,0 +1,406 @@
+"""Annotation through the OpenAI Batch API, for working through backlogs.
+
+Batch requests cost less than interactive ones but may take up to a day to
+complete, which suits archive episodes that nobody is waiting for. Episodes
+are split and transcribed as usual, but instead of annotating each part
+straight away, the chat requests :func:`~ad_begone.utils.cached_annotate_transcription`
+would send are queued, written to a JSONL file and submitted as a batch.
+Batches are polled, and each merged completion is written to its part's
+normal ``.segments.json`` sidecar and to the artifact store. Once every part
+of an episode has its sidecar, the episode is trimmed from its existing parts
+without any further requests.
+
+Queued jobs, submitted batches and waiting episodes are kept as JSON files in
+a work directory, so that a restart picks up where it left off.
+"""
+import json
+import logging
+import os
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+from openai.types.audio.transcription_verbose import TranscriptionVerbose
+from openai.types.chat.parsed_chat_completion import ParsedChatCompletion
+
+from .ad_trimmer import AdTrimmer
+from .artifacts import get_artifact_store
+from .client import _get_client
+from .metrics import record_usage
+from .models import SegmentAnnotation, TrimEngine
+from .state import StateStore
+from .utils import (
+    ANNOTATION_CHUNK_TOKENS,
+    ANNOTATION_ENCODING,
+    ANNOTATION_OVERLAP_TOKENS,
+    ANNOTATION_PREFILTER,
+    UPLOAD_BITRATE_KBPS,
+    _get_model,
+    annotation_request,
+    episode_run_id,
+    merge_annotations,
+    plan_annotation,
+    split_file,
+)
+
+logger = logging.getLogger(__name__)
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+BATCH_COMPLETION_WINDOW = "24h"
+# The Batch API accepts at most this many requests per input file.
+BATCH_MAX_REQUESTS = 50_000
+# Jobs whose batch fails or expires this many times are dropped, and the
+# episode falls back to interactive annotation when it is trimmed.
+BATCH_MAX_ATTEMPTS = 3
+BATCH_POLL_INTERVAL = 300
+# The watcher's default work directory, inside the podcast directory.
+BATCH_DIR_NAME = ".ad-begone-batch"
+
+_TERMINAL = ("completed", "failed", "expired", "cancelled")
+
+
+def _write_json(path: Path, data) -> None:
+    """Write ``data`` to ``path`` atomically."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+def _read_json(path: Path, default):
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        return default
+
+
+def parse_batch_output(text: str) -> dict[str, ParsedChatCompletion]:
+    """Map the custom id of each successful request in a batch output file to its completion."""
+    completions = {}
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        result = json.loads(line)
+        response = result.get("response") or {}
+        if result.get("error") or response.get("status_code") != 200:
+            logger.warning("Batch request %s failed: %s", result.get("custom_id"), result.get("error") or response)
+            continue
+        completion = ParsedChatCompletion.model_validate(response["body"])
+        for tool_call in completion.choices[0].message.tool_calls or []:
+            if tool_call.function.name == "SegmentAnnotation":
+                tool_call.function.parsed_arguments = SegmentAnnotation.model_validate_json(
+                    tool_call.function.arguments
+                )
+        completions[result["custom_id"]] = completion
+    return completions
+
+
+class BatchAnnotator:
+    """Annotation jobs, submitted and collected through the Batch API.
+
+    A job is one transcript, annotated by one or more chat requests as
+    planned by :func:`~ad_begone.utils.plan_annotation`. Jobs are keyed by
+    the artifact store key of their result, so identical transcripts queued
+    for several files share their requests.
+    """
+
+    def __init__(self, work_dir: str, client=None, max_requests: int = BATCH_MAX_REQUESTS):
+        self.work_dir = Path(work_dir)
+        self.max_requests = max_requests
+        self._client = client
+        self._jobs_dir = self.work_dir / "jobs"
+        self._batches_file = self.work_dir / "batches.json"
+        self._jobs: dict[str, dict] = {
+            path.stem: json.loads(path.read_text(encoding="utf-8"))
+            for path in sorted(self._jobs_dir.glob("*.json"))
+        }
+        # Batch id to the keys of the jobs it carries.
+        self._batches: dict[str, list[str]] = _read_json(self._batches_file, {})
+
+    @property
+    def client(self):
+        return self._client if self._client is not None else _get_client("batch")
+
+    def __len__(self) -> int:
+        return len(self._jobs)
+
+    def queued(self, file_name: str) -> bool:
+        """Check whether an annotation for ``file_name`` is still outstanding."""
+        return any(file_name in job["file_names"] for job in self._jobs.values())
+
+    def _plan(self, job: dict):
+        return plan_annotation(
+            TranscriptionVerbose.model_validate(job["transcription"]),
+            job["model"],
+            chunk_tokens=job["chunk_tokens"],
+            overlap_tokens=job["overlap_tokens"],
+            encoding=job["encoding"],
+            prefilter=job["prefilter"],
+            known_ad_segments=set(job["known_ad_segments"]),
+        )
+
+    def _save_job(self, key: str) -> None:
+        _write_json(self._jobs_dir / f"{key}.json", self._jobs[key])
+
+    def _finish(self, key: str, completion: ParsedChatCompletion | None) -> list[str]:
+        """Write a job's completion to the store and its cache files, and forget it."""
+        job = self._jobs.pop(key)
+        (self._jobs_dir / f"{key}.json").unlink(missing_ok=True)
+        if completion is None:
+            return []
+        text = completion.model_dump_json()
+        store = get_artifact_store()
+        if store is not None:
+            store.put("annotation", key, text)
+        for file_name in job["file_names"]:
+            with open(file_name, "w", encoding="utf-8") as f:
+                f.write(text)
+        return job["file_names"]
+
+    def add(
+        self,
+        transcription: TranscriptionVerbose,
+        file_name: str,
+        model: str | None = None,
+        known_ad_segments: set[int] | None = None,
+    ) -> bool:
+        """Queue the annotation of ``transcription``, to be written to ``file_name``.
+
+        Returns ``False`` if nothing needs to be sent, because ``file_name``
+        or the artifact store already has the annotation.
+        """
+        if os.path.isfile(file_name):
+            return False
+        if model is None:
+            model = _get_model()
+
+        plan = plan_annotation(transcription, model, known_ad_segments=known_ad_segments)
+        store = get_artifact_store()
+        cached = store.get("annotation", plan.key) if store is not None else None
+        if cached is not None:
+            logger.info("Reusing cached annotations for %s", file_name)
+            with open(file_name, "w", encoding="utf-8") as f:
+                f.write(cached)
+            return False
+
+        if not plan.chunks:
+            # Nothing to send, e.g. the pre-filter found no ad candidates.
+            text = merge_annotations(plan, []).model_dump_json()
+            if store is not None:
+                store.put("annotation", plan.key, text)
+            with open(file_name, "w", encoding="utf-8") as f:
+                f.write(text)
+            return False
+
+        job = self._jobs.get(plan.key)
+        if job is None:
+            job = self._jobs[plan.key] = dict(
+                model=model,
+                chunk_tokens=ANNOTATION_CHUNK_TOKENS,
+                overlap_tokens=ANNOTATION_OVERLAP_TOKENS,
+                encoding=ANNOTATION_ENCODING,
+                prefilter=ANNOTATION_PREFILTER,
+                known_ad_segments=sorted(known_ad_segments or ()),
+                transcription=transcription.model_dump(mode="json"),
+                file_names=[],
+                batch=None,
+                attempts=0,
+            )
+        if file_name not in job["file_names"]:
+            job["file_names"].append(file_name)
+        self._save_job(plan.key)
+        logger.info("Queued annotation of %s in %d request(s)", file_name, len(plan.chunks))
+        return True
+
+    def submit(self) -> list[str]:
+        """Submit the jobs not yet in a batch, and return the new batch ids."""
+        groups: list[list[tuple[str, list[dict]]]] = [[]]
+        size = 0
+        for key, job in self._jobs.items():
+            if job["batch"] is not None:
+                continue
+            plan = self._plan(job)
+            requests = [
+                {
+                    "custom_id": f"{key}:{i}",
+                    "method": "POST",
+                    "url": BATCH_ENDPOINT,
+                    "body": annotation_request(plan.encoded, plan.model, start, end),
+                }
+                for i, (start, end) in enumerate(plan.chunks)
+            ]
+            # A job's requests stay in one batch, so that it completes at once.
+            if groups[-1] and size + len(requests) > self.max_requests:
+                groups.append([])
+                size = 0
+            groups[-1].append((key, requests))
+            size += len(requests)
+
+        batch_ids = []
+        for group in filter(None, groups):
+            input_path = self.work_dir / f"input-{uuid.uuid4().hex[:8]}.jsonl"
+            input_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(input_path, "w", encoding="utf-8") as f:
+                for _, requests in group:
+                    for request in requests:
+                        f.write(json.dumps(request) + "\n")
+            try:
+                with open(input_path, "rb") as f:
+                    input_file = self.client.files.create(file=f, purpose="batch")
+                batch = self.client.batches.create(
+                    input_file_id=input_file.id,
+                    endpoint=BATCH_ENDPOINT,
+                    completion_window=BATCH_COMPLETION_WINDOW,
+                )
+            finally:
+                input_path.unlink(missing_ok=True)
+
+            self._batches[batch.id] = [key for key, _ in group]
+            _write_json(self._batches_file, self._batches)
+            for key, _ in group:
+                self._jobs[key]["batch"] = batch.id
+                self._save_job(key)
+            batch_ids.append(batch.id)
+            logger.info(
+                "Submitted batch %s with %d request(s) for %d transcript(s)",
+                batch.id, sum(len(requests) for _, requests in group), len(group),
+            )
+        return batch_ids
+
+    def poll(self) -> list[str]:
+        """Collect the results of finished batches, and return the cache files written.
+
+        Jobs whose requests did not all succeed are queued again, up to
+        ``BATCH_MAX_ATTEMPTS`` times.
+        """
+        written = []
+        for batch_id, keys in list(self._batches.items()):
+            batch = self.client.batches.retrieve(batch_id)
+            if batch.status not in _TERMINAL:
+                logger.debug("Batch %s is %s", batch_id, batch.status)
+                continue
+
+            logger.info("Batch %s %s", batch_id, batch.status)
+            completions = {}
+            if batch.output_file_id:
+                completions = parse_batch_output(self.client.files.content(batch.output_file_id).text)
+                for completion in completions.values():
+                    record_usage(completion.usage)
+
+            for key in keys:
+                job = self._jobs.get(key)
+                if job is None:
+                    continue
+                plan = self._plan(job)
+                results = [completions.get(f"{key}:{i}") for i in range(len(plan.chunks))]
+                if all(result is not None for result in results):
+                    written.extend(self._finish(key, merge_annotations(plan, results)))
+                    continue
+
+                job["attempts"] += 1
+                if job["attempts"] >= BATCH_MAX_ATTEMPTS:
+                    logger.error("Giving up batch annotation of %s", ", ".join(job["file_names"]))
+                    self._finish(key, None)
+                else:
+                    logger.warning("Batch annotation of %s failed, queueing it again", ", ".join(job["file_names"]))
+                    job["batch"] = None
+                    self._save_job(key)
+
+            del self._batches[batch_id]
+            _write_json(self._batches_file, self._batches)
+        return written
+
+
+class Backlog:
+    """Episodes split and transcribed, waiting on batch annotation of their parts."""
+
+    def __init__(
+        self,
+        work_dir: str,
+        client=None,
+        model: str | None = None,
+        engine: TrimEngine = "pydub",
+        poll_interval: float = BATCH_POLL_INTERVAL,
+    ):
+        self.annotator = BatchAnnotator(work_dir, client=client)
+        self.model = model
+        self.engine = engine
+        self.poll_interval = poll_interval
+        self._episodes_file = Path(work_dir) / "episodes.json"
+        # Episode path to the paths of its parts.
+        self._episodes: dict[str, list[str]] = _read_json(self._episodes_file, {})
+        self._last_poll: float | None = None
+
+    def __len__(self) -> int:
+        return len(self._episodes)
+
+    def __contains__(self, path: str) -> bool:
+        """Check whether ``path`` is a part, or a sidecar of a part, of a waiting episode."""
+        return any(
+            path in (part, part + ".transcription.json", part + ".segments.json")
+            for parts in self._episodes.values()
+            for part in parts
+        )
+
+    def files(self) -> set[str]:
+        """Return the absolute paths of the parts of waiting episodes and of their sidecars."""
+        return {
+            os.path.abspath(part + suffix)
+            for parts in self._episodes.values()
+            for part in parts
+            for suffix in ("", ".transcription.json", ".segments.json")
+        }
+
+    def _split(self, file_name: str) -> list[str]:
+        parts = split_file(file_name, upload_bitrate_kbps=UPLOAD_BITRATE_KBPS, run_id=episode_run_id(file_name))
+        for part in parts:
+            trimmer = AdTrimmer(part, model=self.model, engine=self.engine)
+            self.annotator.add(
+                trimmer.transcription(),
+                trimmer.segments_cache_file,
+                model=self.model,
+                known_ad_segments=trimmer.known_ads(),
+            )
+        return parts
+
+    def enqueue(self, paths: list[str], state: StateStore | None = None) -> None:
+        """Split and transcribe episodes, and submit the annotation of their parts."""
+        for path in map(str, paths):
+            if path in self._episodes:
+                continue
+            logger.info("Queueing %s for batch annotation", path)
+            try:
+                self._episodes[path] = self._split(path)
+            except Exception as error:
+                logger.error("Failed to queue podcast %s: %s", path, error, exc_info=error)
+                if state is not None:
+                    state.mark_failed(path, repr(error))
+                continue
+            _write_json(self._episodes_file, self._episodes)
+            if state is not None:
+                state.mark_queued(path)
+        self.annotator.submit()
+
+    def ready(self) -> dict[str, list[str]]:
+        """Return the episodes whose parts are all annotated, with their parts.
+
+        Finished batches are collected at most every ``poll_interval`` seconds.
+        """
+        if len(self.annotator) and (self._last_poll is None or time.monotonic() - self._last_poll >= self.poll_interval):
+            self._last_poll = time.monotonic()
+            self.annotator.poll()
+            # Resubmit jobs from failed batches.
+            self.annotator.submit()
+        return {
+            path: parts
+            for path, parts in self._episodes.items()
+            if not any(self.annotator.queued(part + ".segments.json") for part in parts)
+        }
+
+    def done(self, paths: list[str]) -> None:
+        """Forget episodes that have been trimmed, or have failed."""
+        for path in paths:
+            self._episodes.pop(path, None)
+        _write_json(self._episodes_file, self._episodes)
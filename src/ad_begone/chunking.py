@@ -0,0 +1,102 @@
+"""Splitting long transcripts into overlapping chunks for annotation.
+
+Each chunk is annotated on its own, so the merged result has to reconcile
+the overlaps. The model only marks where each ad or content block begins,
+so the labels are first expanded to one per segment. Where two chunks
+overlap, each chunk's labels are trusted up to the middle of the overlap,
+where both have the most context, and the merged labels are then compressed
+back into block starts.
+"""
+from typing import Callable, Literal
+
+from .models import SegmentAnnotation
+
+SegmentType = Literal["ad", "content"]
+
+
+def plan_chunks(
+    lines: list[str],
+    max_tokens: int,
+    overlap_tokens: int,
+    count_tokens: Callable[[str], int],
+) -> list[tuple[int, int]]:
+    """Group consecutive lines into ``[start, end)`` ranges of at most ``max_tokens``.
+
+    Consecutive ranges share about ``overlap_tokens`` worth of lines. A single
+    line longer than the budget gets a chunk of its own.
+    """
+    tokens = [count_tokens(line) for line in lines]
+    chunks: list[tuple[int, int]] = []
+    start = 0
+    while start < len(lines):
+        end, total = start, 0
+        while end < len(lines) and (end == start or total + tokens[end] <= max_tokens):
+            total += tokens[end]
+            end += 1
+        chunks.append((start, end))
+        if end == len(lines):
+            break
+
+        next_start, overlap = end, 0
+        while next_start - 1 > start and overlap + tokens[next_start - 1] <= overlap_tokens:
+            next_start -= 1
+            overlap += tokens[next_start]
+        start = next_start
+    return chunks
+
+
+def segment_labels(
+    annotations: list[SegmentAnnotation],
+    start: int,
+    end: int,
+) -> list[SegmentType | None]:
+    """Expand block-start annotations into one label per segment in ``[start, end)``.
+
+    Segments before the chunk's first annotation are unknown (``None``).
+    """
+    labels: list[SegmentType | None] = [None] * (end - start)
+    for ann in sorted(annotations, key=lambda a: a.segment_index):
+        if start <= ann.segment_index < end:
+            for i in range(ann.segment_index - start, end - start):
+                labels[i] = ann.segment_type
+    return labels
+
+
+def merge_chunk_labels(
+    chunks: list[tuple[int, int]],
+    labels: list[list[SegmentType | None]],
+) -> list[SegmentType]:
+    """Combine per-chunk labels, splitting each overlap at its midpoint."""
+    n_segments = chunks[-1][1] if chunks else 0
+    merged: list[SegmentType | None] = [None] * n_segments
+    for k, ((start, end), chunk_labels) in enumerate(zip(chunks, labels)):
+        # This chunk owns its range between the midpoints of its overlaps.
+        own_start = start
+        if k > 0:
+            own_start = (start + chunks[k - 1][1]) // 2
+        own_end = end
+        if k + 1 < len(chunks):
+            own_end = (chunks[k + 1][0] + end) // 2
+        for i in range(start, end):
+            label = chunk_labels[i - start]
+            if label is None:
+                continue
+            if own_start <= i < own_end or merged[i] is None:
+                merged[i] = label
+
+    # Segments no chunk labelled continue the previous block.
+    previous: SegmentType = "content"
+    result: list[SegmentType] = []
+    for label in merged:
+        previous = label or previous
+        result.append(previous)
+    return result
+
+
+def labels_to_annotations(labels: list[SegmentType]) -> list[SegmentAnnotation]:
+    """Compress per-segment labels into annotations at the start of each block."""
+    return [
+        SegmentAnnotation(segment_type=label, segment_index=i)
+        for i, label in enumerate(labels)
+        if i == 0 or label != labels[i - 1]
+    ]
@@ -0,0 +1,199 @@
+"""Garbage collection of files left behind in the podcast library.
+
+Crashed or interrupted runs leave ``part_*`` files and temporary outputs
+next to the episodes, and deleted episodes leave their cache sidecars. These
+are removed here, together with enforcing the artifact cache's size budget.
+"""
+import logging
+import os
+import re
+import time
+from collections.abc import Container
+from dataclasses import dataclass
+
+from .artifacts import ArtifactStore, get_artifact_store
+from .batch import BATCH_DIR_NAME, Backlog
+from .utils import PART_NAME_RE
+
+logger = logging.getLogger(__name__)
+
+# Temporary outputs of splice_windows, stream_trim, the artifact store and
+# the batch work files, as named by tempfile.mkstemp: a hidden prefix, eight
+# random characters, then the suffix. Anything else hidden in the library,
+# such as a podcast client's own files, is left alone.
+_TEMP_RE = re.compile(
+    r"\.(?:.+\.(?:mp3|json)\.)?[a-z0-9_]{8}\.tmp"
+    r"|\..+\.mp3\.[a-z0-9_]{8}\.mp3"
+)
+_SIDECAR_SUFFIXES = (".mp3.transcription.json", ".mp3.segments.json")
+
+
+@dataclass
+class GcStats:
+
+    parts: int = 0
+    temp_files: int = 0
+    sidecars: int = 0
+    bytes_freed: int = 0
+
+
+def _source_audio(name: str) -> str | None:
+    """Return the name of the audio a cache sidecar was made from, if it is one."""
+    for suffix in _SIDECAR_SUFFIXES:
+        if name.endswith(suffix):
+            return name[:-len(suffix)] + ".mp3"
+    # cached_transcription's default sidecar; only trusted for parts, since
+    # other JSON files next to episodes may belong to the podcast client.
+    if PART_NAME_RE.match(name) and name.endswith(".json"):
+        return name[:-len(".json")] + ".mp3"
+    return None
+
+
+def collect_garbage(
+    directory: str,
+    min_age: float = 24 * 60 * 60,
+    store: ArtifactStore | None = None,
+    dry_run: bool = False,
+    keep: Container[str] = (),
+) -> GcStats:
+    """Remove orphaned parts, stale temporary files and orphaned sidecars.
+
+    Files are only removed once they are ``min_age`` seconds old, so that
+    runs in progress, and retries of failed ones, are left alone. Paths in ``keep``,
+    such as the parts of episodes waiting on batch annotation, are never
+    removed. If ``store`` is given, it is also trimmed to its byte budget.
+    """
+    stats = GcStats()
+    cutoff = time.time() - min_age
+
+    def _remove(path: str, size: int) -> None:
+        logger.debug("Removing %s", path)
+        if not dry_run:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                return
+        stats.bytes_freed += size
+
+    for dirpath, _, filenames in os.walk(directory):
+        names = set(filenames)
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            if path in keep:
+                continue
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+
+            source = _source_audio(name)
+            if source is not None:
+                # A failed run deletes its parts but keeps their sidecars for the retry.
+                if source not in names and st.st_mtime < cutoff:
+                    _remove(path, st.st_size)
+                    stats.sidecars += 1
+            elif st.st_mtime < cutoff:
+                if PART_NAME_RE.match(name) and name.endswith(".mp3"):
+                    _remove(path, st.st_size)
+                    stats.parts += 1
+                elif _TEMP_RE.fullmatch(name):
+                    _remove(path, st.st_size)
+                    stats.temp_files += 1
+
+    if store is not None and not dry_run:
+        stats.bytes_freed += store.evict()
+
+    logger.info(
+        "Garbage collection %sremoved %d part(s), %d temporary file(s) and %d sidecar(s), %.1f MB",
+        "would have " if dry_run else "",
+        stats.parts, stats.temp_files, stats.sidecars, stats.bytes_freed / 1024 / 1024,
+    )
+    return stats
+
+
+def waiting_files(directory: str, batch_dir: str | None = None) -> set[str]:
+    """Return the parts of episodes waiting on batch annotation, with their sidecars.
+
+    Paths are absolute. ``batch_dir`` defaults to the watcher's batch directory inside
+    ``directory``, if there is one.
+    """
+    if batch_dir is None:
+        batch_dir = os.path.join(directory, BATCH_DIR_NAME)
+        if not os.path.isdir(batch_dir):
+            return set()
+    return Backlog(batch_dir).files()
+
+
+class GarbageCollector:
+    """Run :func:`collect_garbage` at most once every ``interval`` seconds."""
+
+    def __init__(
+        self,
+        directory: str,
+        interval: float,
+        min_age: float = 24 * 60 * 60,
+        keep: Container[str] = (),
+    ):
+        self.directory = directory
+        self.interval = interval
+        self.min_age = min_age
+        self.keep = keep
+        self._last_run: float | None = None
+
+    def maybe_run(self) -> GcStats | None:
+        now = time.monotonic()
+        if self.interval <= 0 or (self._last_run is not None and now - self._last_run < self.interval):
+            return None
+        self._last_run = now
+        try:
+            return collect_garbage(self.directory, min_age=self.min_age, store=get_artifact_store(), keep=self.keep)
+        except OSError:
+            logger.exception("Garbage collection failed for %s", self.directory)
+            return None
+
+
+if __name__ == "__main__":
+    from typing import Optional
+
+    import pydantic.v1 as pydantic
+    import pydantic_argparse
+
+    from .logging import setup_logging
+
+    class CleanupArgs(pydantic.BaseModel):
+        directory: str = pydantic.Field(
+            default=".",
+            description="Path to the podcast directory.",
+        )
+        min_age_hours: float = pydantic.Field(
+            default=24.0,
+            ge=0,
+            description="Only remove files older than this.",
+        )
+        batch_dir: Optional[str] = pydantic.Field(
+            default=None,
+            description=(
+                "Directory for queued batch jobs, whose parts are kept "
+                f"(default: DIRECTORY/{BATCH_DIR_NAME}, if it exists)."
+            ),
+        )
+        dry_run: bool = pydantic.Field(
+            default=False,
+            description="Report what would be removed without deleting anything.",
+        )
+
+    setup_logging()
+    parser = pydantic_argparse.ArgumentParser(
+        model=CleanupArgs,
+        description="Remove files left behind by interrupted runs and deleted episodes.",
+    )
+    args = parser.parse_typed_args()
+
+    # The backlog's parts are matched by their absolute paths.
+    collect_garbage(
+        os.path.abspath(args.directory),
+        min_age=args.min_age_hours * 60 * 60,
+        store=get_artifact_store(),
+        dry_run=args.dry_run,
+        keep=waiting_files(args.directory, args.batch_dir),
+    )
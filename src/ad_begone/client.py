@@ -0,0 +1,109 @@
+"""The OpenAI client shared by every API call in a process.
+
+One client, and so one HTTP connection pool, is created per process on first
+use. Concurrent transcription and annotation threads then reuse kept-alive
+connections instead of opening a new TLS connection per request. The pool
+holds ``AD_BEGONE_HTTP_POOL_SIZE`` connections, which the CLI sizes to the
+number of calls that can be in flight at once. Transcription uploads and chat
+calls get separate read timeouts, from ``OPENAI_<KIND>_TIMEOUT``.
+
+``OPENAI_BASE_URL`` points the client at any OpenAI-compatible server, such
+as a local inference server. Such servers usually need no API key.
+
+A forked child process never reuses its parent's client, since the two would
+otherwise share sockets.
+"""
+import logging
+import os
+import threading
+
+import httpx
+from openai import DefaultHttpxClient, OpenAI
+
+logger = logging.getLogger(__name__)
+
+BASE_URL_ENV = "OPENAI_BASE_URL"
+POOL_SIZE_ENV = "AD_BEGONE_HTTP_POOL_SIZE"
+
+DEFAULT_POOL_SIZE = 16
+# Idle connections are kept this long, which outlasts the gaps between the
+# calls of one episode.
+KEEPALIVE_EXPIRY = 60.0
+CONNECT_TIMEOUT = 10.0
+# Read timeouts by kind of call. Transcription uploads a whole part and
+# waits for it to be processed, so it gets much longer than a chat call.
+DEFAULT_TIMEOUTS = {
+    "transcription": 600.0,
+    "batch": 600.0,
+    "chat": 120.0,
+}
+
+_CLIENT: OpenAI | None = None
+_CLIENTS: dict[str, OpenAI] = {}
+_CLIENT_LOCK = threading.Lock()
+
+
+def _reset_after_fork() -> None:
+    global _CLIENT, _CLIENT_LOCK
+    _CLIENT = None
+    _CLIENTS.clear()
+    # Another thread may have held the lock at the time of the fork.
+    _CLIENT_LOCK = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _env_float(name: str) -> float | None:
+    value = os.environ.get(name)
+    return float(value) if value else None
+
+
+def pool_size() -> int:
+    """Return the number of connections the pool keeps, from ``AD_BEGONE_HTTP_POOL_SIZE``."""
+    return int(_env_float(POOL_SIZE_ENV) or DEFAULT_POOL_SIZE)
+
+
+def timeout(kind: str) -> httpx.Timeout:
+    """Return the timeouts for one kind of call, overridable with ``OPENAI_<KIND>_TIMEOUT``."""
+    read = _env_float(f"OPENAI_{kind.upper()}_TIMEOUT") or DEFAULT_TIMEOUTS.get(kind, DEFAULT_TIMEOUTS["chat"])
+    return httpx.Timeout(read, connect=CONNECT_TIMEOUT)
+
+
+def _build_client() -> OpenAI:
+    size = pool_size()
+    base_url = os.environ.get(BASE_URL_ENV) or None
+    logger.debug("Creating OpenAI client for %s with %d connections", base_url or "api.openai.com", size)
+    return OpenAI(
+        # OpenAI-compatible local servers usually accept any key.
+        api_key=os.environ.get("OPENAI_API_KEY") or ("unused" if base_url else None),
+        base_url=base_url,
+        # Retries are handled by the shared rate limiter instead.
+        max_retries=0,
+        timeout=timeout("chat"),
+        http_client=DefaultHttpxClient(
+            limits=httpx.Limits(
+                max_connections=size,
+                max_keepalive_connections=size,
+                keepalive_expiry=KEEPALIVE_EXPIRY,
+            ),
+            timeout=timeout("chat"),
+        ),
+    )
+
+
+def _get_client(kind: str = "chat") -> OpenAI:
+    """Return this process's client, with the timeouts for ``kind`` of call.
+
+    Clients for every kind share one connection pool.
+    """
+    global _CLIENT
+    client = _CLIENTS.get(kind)
+    if client is not None:
+        return client
+    with _CLIENT_LOCK:
+        if _CLIENT is None:
+            _CLIENT = _build_client()
+        if kind not in _CLIENTS:
+            _CLIENTS[kind] = _CLIENT.with_options(timeout=timeout(kind))
+        return _CLIENTS[kind]
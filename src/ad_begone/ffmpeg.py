@@ -0,0 +1,83 @@
+"""Thin wrappers around ffmpeg subprocesses that stream raw PCM."""
+import logging
+import subprocess
+
+from pydub import AudioSegment
+
+logger = logging.getLogger(__name__)
+
+PCM_SAMPLE_WIDTH = 2
+
+
+def decode_pcm(
+    file_name: str,
+    sample_rate: int,
+    channels: int,
+) -> subprocess.Popen:
+    """Start an ffmpeg process that writes signed 16-bit PCM to its stdout."""
+    return subprocess.Popen(
+        [
+            AudioSegment.converter,
+            "-nostdin", "-v", "error",
+            "-i", file_name,
+            "-f", "s16le", "-acodec", "pcm_s16le",
+            "-ar", str(sample_rate), "-ac", str(channels),
+            "pipe:1",
+        ],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+
+
+def encode_mp3(
+    out_name: str,
+    sample_rate: int,
+    channels: int,
+) -> subprocess.Popen:
+    """Start an ffmpeg process that encodes signed 16-bit PCM from its stdin."""
+    return subprocess.Popen(
+        [
+            AudioSegment.converter,
+            "-y", "-v", "error",
+            "-f", "s16le", "-ar", str(sample_rate), "-ac", str(channels),
+            "-i", "pipe:0",
+            "-f", "mp3",
+            out_name,
+        ],
+        stdin=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+
+
+def read_pcm(file_name: str, sample_rate: int, channels: int) -> bytes:
+    """Decode a (short) file to signed 16-bit PCM in memory."""
+    proc = decode_pcm(file_name, sample_rate, channels)
+    data, stderr = proc.communicate()
+    check_returncode(proc, stderr, file_name)
+    return data
+
+
+def compact_mp3(file_name: str, sample_rate: int, bitrate_kbps: int) -> bytes:
+    """Transcode a file to a small mono MP3 in memory."""
+    proc = subprocess.Popen(
+        [
+            AudioSegment.converter,
+            "-nostdin", "-v", "error",
+            "-i", file_name,
+            "-vn", "-ac", "1", "-ar", str(sample_rate), "-b:a", f"{bitrate_kbps}k",
+            "-f", "mp3",
+            "pipe:1",
+        ],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    data, stderr = proc.communicate()
+    check_returncode(proc, stderr, file_name)
+    return data
+
+
+def check_returncode(proc: subprocess.Popen, stderr: bytes, file_name: str) -> None:
+    if proc.returncode != 0:
+        message = stderr.decode(errors="replace").strip()
+        logger.error("ffmpeg failed for %s: %s", file_name, message)
+        raise RuntimeError(f"ffmpeg failed for {file_name}: {message}")
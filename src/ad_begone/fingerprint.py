@@ -0,0 +1,335 @@
+"""Audio fingerprints of removed ads, for recognising them in other episodes.
+
+Dynamically inserted ads are the same recording in every episode they run
+in. Each removed ad is fingerprinted with spectral landmark hashing: peaks
+of the spectrogram are paired up, and each pair is hashed from the two
+frequencies and the time between them. The hashes are stored in a SQLite
+index. A new episode is fingerprinted the same way, and an ad matches where
+many of its hashes line up at the same time offset, which also gives the
+ad's exact start and end in the episode.
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from openai.types.audio.transcription_verbose import TranscriptionVerbose
+
+from .models import Window
+
+logger = logging.getLogger(__name__)
+
+FINGERPRINT_DB_ENV = "AD_BEGONE_FINGERPRINT_DB"
+
+SAMPLE_RATE = 8000
+N_FFT = 1024
+HOP = 256
+# A peak must be the loudest point within this many frames and bins...
+PEAK_FRAMES = 10
+PEAK_BINS = 10
+# ...and this many dB above the median of its block.
+PEAK_MIN_DB = 10.0
+# Each peak is paired with the next FAN_OUT peaks at most MAX_DT frames later.
+FAN_OUT = 5
+MAX_DT = 63
+# Frames per block when computing the spectrogram, to bound memory use.
+BLOCK_FRAMES = 4096
+
+# An ad matches where at least MIN_HITS of its hashes, and MIN_RATIO of all
+# its hashes, line up at the same offset.
+MIN_HITS = 20
+MIN_RATIO = 0.05
+# Only ads of a plausible length are added to the index.
+MIN_AD_SECONDS = 5.0
+MAX_AD_SECONDS = 180.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS ads (
+    id INTEGER PRIMARY KEY,
+    duration REAL NOT NULL,
+    hash_count INTEGER NOT NULL,
+    source TEXT,
+    added_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS hashes (
+    hash INTEGER NOT NULL,
+    ad_id INTEGER NOT NULL,
+    offset INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS hashes_hash ON hashes (hash);
+"""
+
+
+@dataclass
+class Fingerprint:
+
+    hashes: np.ndarray
+    # Frame of each hash's first peak.
+    offsets: np.ndarray
+    duration: float
+
+    def window(self, start: float, end: float) -> "Fingerprint":
+        """Return the hashes between ``start`` and ``end`` seconds, offset from ``start``."""
+        first = int(start * SAMPLE_RATE / HOP)
+        last = int(end * SAMPLE_RATE / HOP)
+        keep = (self.offsets >= first) & (self.offsets < last)
+        return Fingerprint(
+            hashes=self.hashes[keep],
+            offsets=self.offsets[keep] - first,
+            duration=min(end, self.duration) - start,
+        )
+
+
+@dataclass
+class FingerprintMatch:
+
+    ad_id: int
+    start: float
+    end: float
+    hits: int
+
+
+def _max_filter(values: np.ndarray, size: int, axis: int) -> np.ndarray:
+    pad = [(0, 0)] * values.ndim
+    pad[axis] = (size, size)
+    padded = np.pad(values, pad, mode="constant", constant_values=-np.inf)
+    return sliding_window_view(padded, 2 * size + 1, axis=axis).max(axis=-1)
+
+
+def _peaks(samples: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Return the ``(frames, bins)`` of the spectrogram's local peaks."""
+    n_frames = max(0, 1 + (len(samples) - N_FFT) // HOP)
+    window = np.hanning(N_FFT).astype(np.float32)
+    frames_out, bins_out = [], []
+    for block_start in range(0, n_frames, BLOCK_FRAMES):
+        # Extend each block by the peak neighbourhood so that peaks near its
+        # edges are compared against the neighbouring blocks too.
+        lo = max(0, block_start - PEAK_FRAMES)
+        hi = min(n_frames, block_start + BLOCK_FRAMES + PEAK_FRAMES)
+        chunk = samples[lo * HOP:(hi - 1) * HOP + N_FFT]
+        spec = np.abs(np.fft.rfft(sliding_window_view(chunk, N_FFT)[::HOP] * window, axis=1))
+        spec = 20 * np.log10(spec + 1e-6)
+
+        local_max = _max_filter(_max_filter(spec, PEAK_FRAMES, axis=0), PEAK_BINS, axis=1)
+        is_peak = (spec == local_max) & (spec > np.median(spec) + PEAK_MIN_DB)
+        frames, bins = np.nonzero(is_peak)
+        frames += lo
+        own = (frames >= block_start) & (frames < block_start + BLOCK_FRAMES)
+        frames_out.append(frames[own])
+        bins_out.append(bins[own])
+    if not frames_out:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    return np.concatenate(frames_out), np.concatenate(bins_out)
+
+
+def fingerprint(samples: np.ndarray) -> Fingerprint:
+    """Fingerprint mono audio sampled at :data:`SAMPLE_RATE`."""
+    samples = np.asarray(samples, dtype=np.float32)
+    frames, bins = _peaks(samples)
+    order = np.lexsort((bins, frames))
+    frames, bins = frames[order].astype(np.int64), bins[order].astype(np.int64)
+
+    hashes, offsets = [], []
+    for k in range(1, FAN_OUT + 1):
+        dt = frames[k:] - frames[:-k]
+        keep = (dt > 0) & (dt <= MAX_DT)
+        # 10 bits per frequency bin and 6 bits for the time difference.
+        hashes.append((bins[:-k][keep] << 16) | (bins[k:][keep] << 6) | dt[keep])
+        offsets.append(frames[:-k][keep])
+    return Fingerprint(
+        hashes=np.concatenate(hashes) if hashes else np.zeros(0, dtype=np.int64),
+        offsets=np.concatenate(offsets) if offsets else np.zeros(0, dtype=np.int64),
+        duration=len(samples) / SAMPLE_RATE,
+    )
+
+
+def fingerprint_file(file_name: str) -> Fingerprint:
+    from pydub import AudioSegment
+
+    from .pcm import PcmBuffer
+
+    audio = AudioSegment.from_file(file_name).set_channels(1).set_frame_rate(SAMPLE_RATE)
+    return fingerprint(PcmBuffer.from_segment(audio).samples[:, 0])
+
+
+class FingerprintIndex:
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM ads").fetchone()[0]
+
+    def add(self, fp: Fingerprint, source: str | None = None) -> int:
+        """Store an ad's fingerprint and return its id."""
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN")
+            cursor = self._conn.execute(
+                "INSERT INTO ads (duration, hash_count, source, added_at) VALUES (?, ?, ?, ?)",
+                (fp.duration, len(fp.hashes), source, time.time()),
+            )
+            ad_id = cursor.lastrowid
+            self._conn.executemany(
+                "INSERT INTO hashes (hash, ad_id, offset) VALUES (?, ?, ?)",
+                ((int(h), ad_id, int(o)) for h, o in zip(fp.hashes, fp.offsets)),
+            )
+        logger.debug("Indexed ad %d from %s (%.1fs, %d hashes)", ad_id, source, fp.duration, len(fp.hashes))
+        return ad_id
+
+    def entries(self) -> list[tuple[int, str | None, float, float]]:
+        """Return ``(id, source, added_at, duration)`` for every stored ad."""
+        with self._lock:
+            return self._conn.execute("SELECT id, source, added_at, duration FROM ads ORDER BY id").fetchall()
+
+    def remove(self, ad_id: int) -> bool:
+        """Forget an ad, such as a recurring intro that was taken for one; return whether it was stored."""
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN")
+            self._conn.execute("DELETE FROM hashes WHERE ad_id = ?", (ad_id,))
+            removed = self._conn.execute("DELETE FROM ads WHERE id = ?", (ad_id,)).rowcount > 0
+        if removed:
+            logger.info("Removed ad %d from %s", ad_id, self.path)
+        return removed
+
+    def _lookup(self, hashes: np.ndarray) -> np.ndarray:
+        """Return ``(hash, ad_id, offset)`` rows for the given hashes."""
+        rows = []
+        unique = np.unique(hashes).tolist()
+        with self._lock:
+            # Stay below SQLite's limit on query parameters.
+            for i in range(0, len(unique), 900):
+                batch = unique[i:i + 900]
+                rows.extend(self._conn.execute(
+                    f"SELECT hash, ad_id, offset FROM hashes WHERE hash IN ({','.join('?' * len(batch))})",
+                    batch,
+                ))
+        return np.array(rows, dtype=np.int64).reshape(-1, 3)
+
+    def match(
+        self,
+        fp: Fingerprint,
+        min_hits: int = MIN_HITS,
+        min_ratio: float = MIN_RATIO,
+    ) -> list[FingerprintMatch]:
+        """Find the indexed ads that occur in ``fp``, sorted by start."""
+        if not len(fp.hashes):
+            return []
+        rows = self._lookup(fp.hashes)
+        if not len(rows):
+            return []
+
+        # Pair every query hash with every stored occurrence of it.
+        order = np.argsort(fp.hashes, kind="stable")
+        sorted_hashes = fp.hashes[order]
+        lo = np.searchsorted(sorted_hashes, rows[:, 0], side="left")
+        hi = np.searchsorted(sorted_hashes, rows[:, 0], side="right")
+        counts = hi - lo
+        row_idx = np.repeat(np.arange(len(rows)), counts)
+        query_idx = order[np.concatenate([np.arange(a, b) for a, b in zip(lo, hi)])]
+        ad_ids = rows[row_idx, 1]
+        deltas = fp.offsets[query_idx] - rows[row_idx, 2]
+
+        candidates = np.unique(ad_ids).tolist()
+        with self._lock:
+            ads = {
+                ad_id: (duration, hash_count)
+                for ad_id, duration, hash_count in self._conn.execute(
+                    f"SELECT id, duration, hash_count FROM ads WHERE id IN ({','.join('?' * len(candidates))})",
+                    candidates,
+                )
+            }
+
+        matches = []
+        for ad_id in candidates:
+            duration, hash_count = ads[ad_id]
+            offsets, hits = np.unique(deltas[ad_ids == ad_id], return_counts=True)
+            # Allow for the peaks drifting by a frame between recordings.
+            hits_by_offset = dict(zip(offsets.tolist(), hits.tolist()))
+            smoothed = hits + np.array([
+                hits_by_offset.get(o - 1, 0) + hits_by_offset.get(o + 1, 0) for o in offsets.tolist()
+            ])
+            needed = max(min_hits, min_ratio * hash_count)
+            accepted: list[int] = []
+            for i in np.argsort(-smoothed, kind="stable"):
+                if smoothed[i] < needed:
+                    break
+                # The same ad can run more than once, but not overlapping itself.
+                offset = int(offsets[i])
+                if any(abs(offset - other) * HOP / SAMPLE_RATE < duration for other in accepted):
+                    continue
+                accepted.append(offset)
+                start = max(0.0, offset * HOP / SAMPLE_RATE)
+                matches.append(FingerprintMatch(
+                    ad_id=ad_id,
+                    start=start,
+                    end=min(fp.duration, offset * HOP / SAMPLE_RATE + duration),
+                    hits=int(smoothed[i]),
+                ))
+        return sorted(matches, key=lambda m: m.start)
+
+
+_INDEXES: dict[str, FingerprintIndex] = {}
+_INDEXES_LOCK = threading.Lock()
+
+
+def get_fingerprint_index() -> FingerprintIndex | None:
+    """Return the index configured by ``AD_BEGONE_FINGERPRINT_DB``, if any."""
+    path = os.environ.get(FINGERPRINT_DB_ENV)
+    if not path:
+        return None
+    with _INDEXES_LOCK:
+        if path not in _INDEXES:
+            _INDEXES[path] = FingerprintIndex(path)
+        return _INDEXES[path]
+
+
+def known_ad_segments(transcription: TranscriptionVerbose, matches: list[FingerprintMatch]) -> set[int]:
+    """Return the indices of the segments that lie entirely inside a matched ad."""
+    return {
+        i
+        for i, seg in enumerate(transcription.segments)
+        if any(m.start <= seg.start and seg.end <= m.end for m in matches)
+    }
+
+
+def _subtract(start: float, end: float, cuts: list[FingerprintMatch]) -> list[tuple[float, float]]:
+    pieces = [(start, end)]
+    for cut in cuts:
+        pieces = [
+            piece
+            for s, e in pieces
+            for piece in ((s, min(e, cut.start)), (max(s, cut.end), e))
+            if piece[1] > piece[0]
+        ]
+    return pieces
+
+
+def overlay_matches(windows: list[Window], matches: list[FingerprintMatch]) -> list[Window]:
+    """Replace whatever ``windows`` say about the matched spans with exact ad windows."""
+    if not matches:
+        return windows
+    pieces = [
+        Window(start=s, end=e, segment_type=window.segment_type)
+        for window in windows
+        for s, e in _subtract(window.start, window.end, matches)
+    ]
+    result: list[Window] = []
+    exact = [Window(start=m.start, end=m.end, segment_type="ad") for m in matches]
+    for window in sorted(pieces + exact, key=lambda w: w.start):
+        if result and result[-1].segment_type == window.segment_type and window.start <= result[-1].end:
+            result[-1].end = max(result[-1].end, window.end)
+        else:
+            result.append(window)
+    return result
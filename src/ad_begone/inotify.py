@@ -0,0 +1,164 @@
+"""Event-driven directory watching with Linux inotify.
+
+Uses the inotify syscalls directly through ctypes, so no extra dependency is
+needed. New MP3s are reported once their ``IN_CLOSE_WRITE`` or
+``IN_MOVED_TO`` event has been quiet for the debounce period.
+"""
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import time
+from pathlib import Path
+from typing import NamedTuple
+
+logger = logging.getLogger(__name__)
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+_WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE_SELF
+_EVENT_HEADER = struct.Struct("iIII")
+_READ_SIZE = 64 * 1024
+
+
+class InotifyEvent(NamedTuple):
+
+    wd: int
+    mask: int
+    cookie: int
+    name: str
+
+
+def parse_events(buf: bytes) -> list[InotifyEvent]:
+    """Decode a buffer of ``struct inotify_event`` records."""
+    events = []
+    pos = 0
+    while pos + _EVENT_HEADER.size <= len(buf):
+        wd, mask, cookie, length = _EVENT_HEADER.unpack_from(buf, pos)
+        pos += _EVENT_HEADER.size
+        name = buf[pos:pos + length].split(b"\0", 1)[0].decode(errors="surrogateescape")
+        pos += length
+        events.append(InotifyEvent(wd, mask, cookie, name))
+    return events
+
+
+def _libc():
+    libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    if not hasattr(libc, "inotify_init1"):
+        raise OSError("inotify is not available on this platform")
+    return libc
+
+
+class InotifyWatcher:
+
+    def __init__(
+        self,
+        directory: str,
+        debounce: float = 5.0,
+        suffix: str = ".mp3",
+    ):
+        self.directory = Path(directory)
+        self.debounce = debounce
+        self.suffix = suffix
+        self.overflowed = False
+        self._libc = _libc()
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        self._dirs: dict[int, Path] = {}
+        self._pending: dict[Path, float] = {}
+        self._watch_tree(self.directory)
+        logger.info("Watching %d directories under %s", len(self._dirs), self.directory)
+
+    def close(self) -> None:
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+    def __enter__(self) -> "InotifyWatcher":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _add_watch(self, path: Path) -> None:
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), _WATCH_MASK)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            logger.warning("Could not watch %s: %s", path, os.strerror(errno))
+            return
+        self._dirs[wd] = path
+
+    def _watch_tree(self, root: Path, queue_existing: bool = False) -> None:
+        for dirpath, _, filenames in os.walk(root):
+            self._add_watch(Path(dirpath))
+            if queue_existing:
+                # Files may have landed before the new directory was watched.
+                for name in filenames:
+                    self._queue(Path(dirpath) / name)
+
+    def _queue(self, path: Path) -> None:
+        if path.suffix == self.suffix:
+            self._pending[path] = time.monotonic()
+
+    def _handle(self, event: InotifyEvent) -> None:
+        if event.mask & IN_Q_OVERFLOW:
+            logger.warning("inotify event queue overflowed")
+            self.overflowed = True
+            return
+        if event.mask & IN_IGNORED:
+            self._dirs.pop(event.wd, None)
+            return
+
+        parent = self._dirs.get(event.wd)
+        if parent is None or not event.name:
+            return
+        path = parent / event.name
+
+        if event.mask & IN_ISDIR:
+            if event.mask & (IN_CREATE | IN_MOVED_TO):
+                self._watch_tree(path, queue_existing=True)
+        elif event.mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+            self._queue(path)
+
+    def poll(self, timeout: float) -> list[Path]:
+        """Wait up to ``timeout`` seconds and return files that have settled."""
+        deadline = time.monotonic() + timeout
+        while True:
+            ready = self._ready()
+            remaining = deadline - time.monotonic()
+            if ready or remaining <= 0:
+                return ready
+            wait = remaining
+            if self._pending:
+                wait = min(wait, max(0.0, min(self._pending.values()) + self.debounce - time.monotonic()))
+            readable, _, _ = select.select([self._fd], [], [], wait)
+            if readable:
+                self._read()
+
+    def _read(self) -> None:
+        try:
+            buf = os.read(self._fd, _READ_SIZE)
+        except BlockingIOError:
+            return
+        for event in parse_events(buf):
+            self._handle(event)
+
+    def _ready(self) -> list[Path]:
+        now = time.monotonic()
+        ready = [p for p, t in self._pending.items() if now - t >= self.debounce]
+        for path in ready:
+            del self._pending[path]
+        return sorted(ready)
@@ -0,0 +1,83 @@
+"""Listing and pruning the indexes of known ads.
+
+Ads recognised through :mod:`ad_begone.fingerprint` or
+:mod:`ad_begone.shingles` are cut without asking the model, so a recurring
+intro or theme that was once taken for an ad is cut from every later
+episode. Such entries can be found by their source here and removed.
+"""
+import time
+
+from .fingerprint import FingerprintIndex
+from .shingles import ShingleIndex
+
+
+def format_entries(index: FingerprintIndex | ShingleIndex) -> list[str]:
+    """Describe each ad stored in ``index`` on one line."""
+    unit = "s" if isinstance(index, FingerprintIndex) else " words"
+    return [
+        f"{ad_id:>6}  {time.strftime('%Y-%m-%d %H:%M', time.localtime(added_at))}  "
+        f"{size:g}{unit}  {source or '-'}"
+        for ad_id, source, added_at, size in index.entries()
+    ]
+
+
+def remove_entries(index: FingerprintIndex | ShingleIndex, ad_ids: list[int]) -> list[int]:
+    """Remove the ads ``ad_ids`` from ``index`` and return the ids that were not stored."""
+    return [ad_id for ad_id in ad_ids if not index.remove(ad_id)]
+
+
+if __name__ == "__main__":
+    import os
+    from typing import List, Optional
+
+    import pydantic.v1 as pydantic
+    import pydantic_argparse
+
+    from .fingerprint import FINGERPRINT_DB_ENV
+    from .logging import setup_logging
+    from .shingles import SHINGLE_DB_ENV
+
+    class KnownAdsArgs(pydantic.BaseModel):
+        fingerprint_db: Optional[str] = pydantic.Field(
+            default=os.environ.get(FINGERPRINT_DB_ENV),
+            description=f"SQLite index of ad fingerprints (default: ${FINGERPRINT_DB_ENV}).",
+        )
+        shingle_db: Optional[str] = pydantic.Field(
+            default=os.environ.get(SHINGLE_DB_ENV),
+            description=f"SQLite index of ad transcripts (default: ${SHINGLE_DB_ENV}).",
+        )
+        remove_fingerprint: List[int] = pydantic.Field(
+            default=[],
+            description="Ids of fingerprinted ads to remove.",
+        )
+        remove_shingle: List[int] = pydantic.Field(
+            default=[],
+            description="Ids of ad transcripts to remove.",
+        )
+
+    setup_logging()
+    parser = pydantic_argparse.ArgumentParser(
+        model=KnownAdsArgs,
+        description="List the known ads, or remove ones that are not ads.",
+    )
+    args = parser.parse_typed_args()
+
+    for path, index_class, ad_ids, option in (
+        (args.fingerprint_db, FingerprintIndex, args.remove_fingerprint, "fingerprint"),
+        (args.shingle_db, ShingleIndex, args.remove_shingle, "shingle"),
+    ):
+        if not path:
+            if ad_ids:
+                parser.error(f"--remove-{option} needs --{option}-db")
+            continue
+        index = index_class(path)
+        if ad_ids:
+            missing = remove_entries(index, ad_ids)
+            print(f"{path}: removed {len(ad_ids) - len(missing)} ad(s)")
+            if missing:
+                print(f"{path}: no ad(s) {', '.join(map(str, missing))}")
+        else:
+            print(f"{path}:")
+            for line in format_entries(index):
+                print(line)
+        index.close()
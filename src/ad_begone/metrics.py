@@ -0,0 +1,306 @@
+"""Process metrics in the Prometheus text format.
+
+Stage latencies, episode outcomes, ad time removed and API tokens are
+recorded in module-level metrics as work happens. :func:`start_http_server`
+serves them on ``/metrics`` for Prometheus to scrape, which the watcher does
+with ``--metrics-port``.
+
+Metrics live in the process that records them. Episodes processed in worker
+processes send what they recorded back with their result, see
+:func:`drain` and :func:`merge`, so that the watcher's endpoint covers them
+too.
+"""
+import contextlib
+import logging
+import os
+import resource
+import sys
+import threading
+import time
+from abc import ABC, abstractmethod
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Iterator
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Stage latencies range from milliseconds (splitting a part by copying
+# frames) to many minutes (transcribing an hour of audio on the CPU).
+STAGE_BUCKETS = (0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0, 3600.0)
+
+_Labels = tuple[tuple[str, str], ...]
+
+
+def _labels(labels: dict[str, str]) -> _Labels:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format_labels(labels: _Labels) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        (name, value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'))
+        for name, value in labels
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Metric(ABC):
+    """A metric family, with one value per combination of labels."""
+
+    type: str
+
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self._lock = threading.Lock()
+
+    @abstractmethod
+    def samples(self) -> Iterator[tuple[str, _Labels, float]]:
+        """Yield the name, labels and value of each sample."""
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for name, labels, value in self.samples():
+            lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+class Counter(Metric):
+
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str):
+        super().__init__(name, documentation)
+        self._values: dict[_Labels, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        if amount < 0:
+            logger.error("Counter %s cannot decrease by %s", self.name, amount)
+            raise ValueError("Counters can only increase")
+        key = _labels(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(_labels(labels), 0.0)
+
+    def samples(self) -> Iterator[tuple[str, _Labels, float]]:
+        with self._lock:
+            values = dict(self._values)
+        for labels, value in sorted(values.items()):
+            yield self.name, labels, value
+
+    def drain(self) -> dict:
+        with self._lock:
+            values, self._values = self._values, {}
+        return values
+
+    def merge(self, values: dict) -> None:
+        with self._lock:
+            for key, value in values.items():
+                self._values[key] = self._values.get(key, 0.0) + value
+
+
+class Gauge(Metric):
+    """A value that goes up and down, or is read from ``function`` when scraped."""
+
+    type = "gauge"
+
+    def __init__(self, name: str, documentation: str, function: Callable[[], float] | None = None):
+        super().__init__(name, documentation)
+        self._values: dict[_Labels, float] = {}
+        self._function = function
+
+    def set(self, value: float, **labels: str) -> None:
+        with self._lock:
+            self._values[_labels(labels)] = value
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = _labels(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def value(self, **labels: str) -> float:
+        if self._function is not None:
+            return self._function()
+        return self._values.get(_labels(labels), 0.0)
+
+    def samples(self) -> Iterator[tuple[str, _Labels, float]]:
+        if self._function is not None:
+            yield self.name, (), self._function()
+            return
+        with self._lock:
+            values = dict(self._values)
+        for labels, value in sorted(values.items()):
+            yield self.name, labels, value
+
+
+class Histogram(Metric):
+
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, buckets: tuple[float, ...] = STAGE_BUCKETS):
+        super().__init__(name, documentation)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # Per label set: a count for each bucket (not cumulative), then the sum.
+        self._values: dict[_Labels, list[float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = _labels(labels)
+        with self._lock:
+            counts = self._values.setdefault(key, [0.0] * (len(self.buckets) + 1))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            counts[-1] += value
+
+    @contextlib.contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        """Observe how long the block, or the decorated function, takes."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels: str) -> int:
+        counts = self._values.get(_labels(labels))
+        return int(sum(counts[:-1])) if counts else 0
+
+    def samples(self) -> Iterator[tuple[str, _Labels, float]]:
+        with self._lock:
+            values = {key: list(counts) for key, counts in self._values.items()}
+        for labels, counts in sorted(values.items()):
+            cumulative = 0.0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                yield f"{self.name}_bucket", labels + (("le", _format_value(bound)),), cumulative
+            yield f"{self.name}_sum", labels, counts[-1]
+            yield f"{self.name}_count", labels, cumulative
+
+    def drain(self) -> dict:
+        with self._lock:
+            values, self._values = self._values, {}
+        return values
+
+    def merge(self, values: dict) -> None:
+        with self._lock:
+            for key, counts in values.items():
+                current = self._values.setdefault(key, [0.0] * (len(self.buckets) + 1))
+                for i, count in enumerate(counts):
+                    current[i] += count
+
+
+def _rss_bytes() -> float:
+    try:
+        with open("/proc/self/statm", encoding="ascii") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return _peak_rss_bytes()
+
+
+def _peak_rss_bytes() -> float:
+    # ru_maxrss is in KiB on Linux and bytes on macOS.
+    scale = 1 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+STAGE_SECONDS = Histogram(
+    "ad_begone_stage_duration_seconds",
+    "Time spent in each processing stage, per part or episode.",
+)
+QUEUE_DEPTH = Gauge(
+    "ad_begone_queue_depth",
+    "Episodes waiting to be processed, or waiting on batch annotation.",
+)
+EPISODES = Counter(
+    "ad_begone_episodes_total",
+    "Episodes processed, by outcome.",
+)
+AD_SECONDS = Counter(
+    "ad_begone_ad_seconds_removed_total",
+    "Seconds of ads removed from episodes.",
+)
+API_TOKENS = Counter(
+    "ad_begone_api_tokens_total",
+    "Tokens used by chat API calls, by kind.",
+)
+RESIDENT_MEMORY = Gauge(
+    "process_resident_memory_bytes",
+    "Resident memory size of this process in bytes.",
+    function=_rss_bytes,
+)
+PEAK_RESIDENT_MEMORY = Gauge(
+    "ad_begone_peak_resident_memory_bytes",
+    "Peak resident memory size of this process in bytes.",
+    function=_peak_rss_bytes,
+)
+
+REGISTRY: list[Metric] = [
+    STAGE_SECONDS, QUEUE_DEPTH, EPISODES, AD_SECONDS, API_TOKENS, RESIDENT_MEMORY, PEAK_RESIDENT_MEMORY,
+]
+# Metrics a worker process hands back to its parent.
+_SHIPPED: list[Counter | Histogram] = [STAGE_SECONDS, EPISODES, AD_SECONDS, API_TOKENS]
+
+
+def render() -> str:
+    """Return every metric in the Prometheus text format."""
+    return "".join(metric.render() for metric in REGISTRY)
+
+
+def record_usage(usage) -> None:
+    """Count the tokens of a chat completion's ``usage``, if it has any."""
+    if usage is None:
+        return
+    API_TOKENS.inc(usage.prompt_tokens, kind="prompt")
+    API_TOKENS.inc(usage.completion_tokens, kind="completion")
+
+
+def drain() -> dict[str, dict]:
+    """Return and reset what this process recorded, to be passed to :func:`merge`."""
+    return {metric.name: metric.drain() for metric in _SHIPPED}
+
+
+def merge(snapshot: dict[str, dict]) -> None:
+    """Add what another process recorded, from :func:`drain`, to this process's metrics."""
+    for metric in _SHIPPED:
+        metric.merge(snapshot.get(metric.name, {}))
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    def do_GET(self) -> None:
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:
+        logger.debug("Metrics request from %s: " + format, self.address_string(), *args)
+
+
+def start_http_server(port: int, addr: str = "") -> ThreadingHTTPServer:
+    """Serve the metrics on ``http://addr:port/metrics`` from a background thread."""
+    server = ThreadingHTTPServer((addr, port), _Handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name="metrics", daemon=True)
+    thread.start()
+    logger.info("Serving metrics on port %d", server.server_address[1])
+    return server
@@ -3,6 +3,10 @@ from typing import Literal
 
 from pydantic import BaseModel
 
+TrimEngine = Literal["pydub", "frames", "stream"]
+PromptEncoding = Literal["segment", "compact", "blocks"]
+TranscriberName = Literal["openai", "local"]
+
 
 class SegmentAnnotation(BaseModel):
 
@@ -27,3 +31,12 @@ class Window:
 
     def __repr__(self) -> str:
         return f"Window({self.start}-{self.end}, {self.segment_type})"
+
+
+@dataclass
+class EpisodeResult:
+
+    file_name: str
+    elapsed: float
+    ad_seconds: float
+    model: str | None = None
@@ -0,0 +1,356 @@
+"""Frame-level MP3 parsing and splicing.
+
+MPEG audio is a sequence of self-describing frames, so an episode can be cut
+by copying whole frames between the ad boundaries instead of decoding to PCM
+and re-encoding. Only MPEG-1/2/2.5 Layer III streams are supported, which
+covers practically every podcast feed.
+"""
+import logging
+import mmap
+import os
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+
+from .models import Window
+
+logger = logging.getLogger(__name__)
+
+# Bitrates in kbps indexed by the 4-bit bitrate field, for Layer III.
+_BITRATES_V1 = (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 0)
+_BITRATES_V2 = (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160, 0)
+
+# Sample rates indexed by the 2-bit version field, then the sample rate field.
+_SAMPLE_RATES = {
+    0b11: (44100, 48000, 32000),  # MPEG-1
+    0b10: (22050, 24000, 16000),  # MPEG-2
+    0b00: (11025, 12000, 8000),  # MPEG-2.5
+}
+
+_COPY_CHUNK_SIZE = 1024 * 1024
+_PROBE_SIZE = 64 * 1024
+
+
+@dataclass(frozen=True)
+class FrameHeader:
+
+    version: int
+    sample_rate: int
+    channels: int
+    frame_size: int
+    samples: int
+    side_info_size: int
+    protected: bool
+
+
+def parse_frame_header(header: bytes) -> FrameHeader | None:
+    """Decode a 4-byte Layer III frame header, or return None if invalid."""
+    if len(header) < 4 or header[0] != 0xFF or (header[1] & 0xE0) != 0xE0:
+        return None
+
+    version = (header[1] >> 3) & 0b11
+    layer = (header[1] >> 1) & 0b11
+    protected = not (header[1] & 0b1)
+    bitrate_index = header[2] >> 4
+    sample_rate_index = (header[2] >> 2) & 0b11
+    padding = (header[2] >> 1) & 0b1
+    channel_mode = header[3] >> 6
+
+    if version not in _SAMPLE_RATES or layer != 0b01 or sample_rate_index == 0b11:
+        return None
+    if bitrate_index in (0, 15):
+        return None
+
+    mpeg1 = version == 0b11
+    bitrate = (_BITRATES_V1 if mpeg1 else _BITRATES_V2)[bitrate_index] * 1000
+    sample_rate = _SAMPLE_RATES[version][sample_rate_index]
+    channels = 1 if channel_mode == 0b11 else 2
+
+    if mpeg1:
+        frame_size = 144 * bitrate // sample_rate + padding
+        side_info_size = 17 if channels == 1 else 32
+    else:
+        frame_size = 72 * bitrate // sample_rate + padding
+        side_info_size = 9 if channels == 1 else 17
+
+    return FrameHeader(
+        version=version,
+        sample_rate=sample_rate,
+        channels=channels,
+        frame_size=frame_size,
+        samples=1152 if mpeg1 else 576,
+        side_info_size=side_info_size,
+        protected=protected,
+    )
+
+
+def _id3v2_size(buf) -> int:
+    """Return the size of a leading ID3v2 tag in bytes, or 0 if there is none."""
+    if len(buf) < 10 or buf[:3] != b"ID3":
+        return 0
+    size = 0
+    for b in buf[6:10]:
+        size = (size << 7) | (b & 0x7F)
+    has_footer = buf[5] & 0x10
+    return 10 + size + (10 if has_footer else 0)
+
+
+def _is_info_frame(buf, offset: int, header: FrameHeader) -> bool:
+    """Check whether the frame at offset is a Xing/Info/VBRI metadata frame."""
+    xing_at = offset + 4 + (2 if header.protected else 0) + header.side_info_size
+    if buf[xing_at:xing_at + 4] in (b"Xing", b"Info"):
+        return True
+    return buf[offset + 36:offset + 40] == b"VBRI"
+
+
+@dataclass
+class FrameIndex:
+    """Byte offsets and timestamps of every audio frame in an MP3 stream.
+
+    ``times`` has one more entry than there are frames: ``times[i]`` is the
+    start time of frame ``i`` and ``times[-1]`` is the total duration.
+    """
+
+    offsets: np.ndarray
+    sizes: np.ndarray
+    times: np.ndarray
+    sample_rate: int
+    channels: int
+    tag: bytes = b""
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def duration(self) -> float:
+        return float(self.times[-1])
+
+    def audio_bytes(self) -> int:
+        return int(self.sizes.sum())
+
+    def nearest_boundary(self, seconds: float) -> int:
+        """Return the index of the frame boundary closest to ``seconds``."""
+        i = int(np.searchsorted(self.times, seconds))
+        if i == 0:
+            return 0
+        if i >= len(self.times):
+            return len(self.times) - 1
+        if seconds - self.times[i - 1] <= self.times[i] - seconds:
+            return i - 1
+        return i
+
+    def byte_range(self, first: int, last: int) -> tuple[int, int]:
+        """Return the ``[start, end)`` byte range covering frames ``first`` to ``last - 1``."""
+        if last <= first:
+            return 0, 0
+        return int(self.offsets[first]), int(self.offsets[last - 1] + self.sizes[last - 1])
+
+
+def index_frames(buf) -> FrameIndex:
+    """Build a :class:`FrameIndex` from an in-memory or memory-mapped MP3."""
+    tag_size = _id3v2_size(buf)
+    offsets: list[int] = []
+    sizes: list[int] = []
+    samples: list[int] = []
+    sample_rate = None
+    channels = None
+
+    pos = tag_size
+    end = len(buf)
+    while pos + 4 <= end:
+        header = parse_frame_header(buf[pos:pos + 4])
+        if header is None or pos + header.frame_size > end:
+            if buf[pos:pos + 3] == b"TAG" or buf[pos:pos + 8] == b"APETAGEX":
+                break
+            # Lost sync; scan forward for the next plausible frame header.
+            pos = buf.find(b"\xff", pos + 1)
+            if pos == -1:
+                break
+            continue
+
+        if sample_rate is None:
+            if _is_info_frame(buf, pos, header):
+                pos += header.frame_size
+                continue
+            sample_rate = header.sample_rate
+            channels = header.channels
+        elif header.sample_rate != sample_rate:
+            # A single false sync in the middle of audio data; skip a byte.
+            pos += 1
+            continue
+
+        offsets.append(pos)
+        sizes.append(header.frame_size)
+        samples.append(header.samples)
+        pos += header.frame_size
+
+    if not offsets:
+        logger.error("No MPEG Layer III frames found")
+        raise ValueError("No MPEG Layer III frames found")
+
+    times = np.zeros(len(offsets) + 1, dtype=np.float64)
+    np.cumsum(np.asarray(samples, dtype=np.float64) / sample_rate, out=times[1:])
+
+    return FrameIndex(
+        offsets=np.asarray(offsets, dtype=np.int64),
+        sizes=np.asarray(sizes, dtype=np.int64),
+        times=times,
+        sample_rate=sample_rate,
+        channels=channels,
+        tag=bytes(buf[:tag_size]),
+    )
+
+
+def read_frame_index(file_name: str) -> FrameIndex:
+    """Build a :class:`FrameIndex` for an MP3 file without decoding it."""
+    with open(file_name, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            logger.error("Cannot index empty file: %s", file_name)
+            raise ValueError(f"Empty file: {file_name}")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            try:
+                return index_frames(buf)
+            except ValueError:
+                logger.error("Could not index MP3 frames in %s", file_name)
+                raise
+
+
+def probe_stream(file_name: str) -> tuple[int, int]:
+    """Return ``(sample_rate, channels)`` from the first audio frames of a file."""
+    with open(file_name, "rb") as f:
+        f.seek(_id3v2_size(f.read(10)))
+        index = index_frames(f.read(_PROBE_SIZE))
+    return index.sample_rate, index.channels
+
+
+def read_id3v2_tag(file_name: str) -> bytes:
+    """Return the raw leading ID3v2 tag of a file, or ``b""`` if it has none."""
+    with open(file_name, "rb") as f:
+        size = _id3v2_size(f.read(10))
+        if size == 0:
+            return b""
+        f.seek(0)
+        return f.read(size)
+
+
+def _copy_range(src, dst, start: int, end: int) -> None:
+    src.seek(start)
+    remaining = end - start
+    while remaining > 0:
+        chunk = src.read(min(_COPY_CHUNK_SIZE, remaining))
+        if not chunk:
+            break
+        dst.write(chunk)
+        remaining -= len(chunk)
+
+
+_NOTIF_FRAMES: dict[tuple[str, int, int], bytes] = {}
+
+
+def _notif_frames(notif_name: str, sample_rate: int, channels: int) -> bytes:
+    """Return the notification's raw frames in the given stream format.
+
+    The notification is only re-encoded when its format does not match the
+    episode, and the result is cached for the life of the process.
+    """
+    key = (notif_name, sample_rate, channels)
+    if key in _NOTIF_FRAMES:
+        return _NOTIF_FRAMES[key]
+
+    with open(notif_name, "rb") as f:
+        data = f.read()
+    index = index_frames(data)
+
+    if index.sample_rate != sample_rate or index.channels != channels:
+        from pydub import AudioSegment
+
+        logger.info(
+            "Re-encoding notification to %d Hz, %d channel(s)", sample_rate, channels
+        )
+        notif = AudioSegment.from_mp3(notif_name)
+        notif = notif.set_frame_rate(sample_rate).set_channels(channels)
+        with tempfile.SpooledTemporaryFile() as f:
+            notif.export(f, format="mp3")
+            f.seek(0)
+            data = f.read()
+        index = index_frames(data)
+
+    start, end = index.byte_range(0, len(index))
+    _NOTIF_FRAMES[key] = data[start:end]
+    return _NOTIF_FRAMES[key]
+
+
+def concat_frames(
+    sources: list[tuple[str, FrameIndex, int, int]],
+    out_name: str,
+    tag: bytes = b"",
+    inserts: dict[int, bytes] | None = None,
+) -> str:
+    """Write frame ranges from one or more MP3 files into ``out_name``.
+
+    Each source is ``(file_name, index, first_frame, last_frame)``. ``inserts``
+    maps a position in ``sources`` to raw frames written before that source.
+    The output is written to a temporary file and moved into place, so
+    ``out_name`` may be one of the sources.
+    """
+    inserts = inserts or {}
+    out_path = Path(out_name)
+    fd, tmp_name = tempfile.mkstemp(
+        prefix=f".{out_path.name}.", suffix=".tmp", dir=out_path.parent
+    )
+    try:
+        with os.fdopen(fd, "wb") as dst:
+            dst.write(tag)
+            handles = {}
+            try:
+                for i, (file_name, index, first, last) in enumerate(sources):
+                    if i in inserts:
+                        dst.write(inserts[i])
+                    if file_name not in handles:
+                        handles[file_name] = open(file_name, "rb")
+                    start, end = index.byte_range(first, last)
+                    _copy_range(handles[file_name], dst, start, end)
+                if len(sources) in inserts:
+                    dst.write(inserts[len(sources)])
+            finally:
+                for handle in handles.values():
+                    handle.close()
+        os.replace(tmp_name, out_name)
+    except BaseException:
+        if os.path.exists(tmp_name):
+            os.remove(tmp_name)
+        raise
+    return out_name
+
+
+def splice_windows(
+    file_name: str,
+    windows: list[Window],
+    out_name: str,
+    notif_name: str,
+) -> str:
+    """Keep content windows and replace ad windows with the notification.
+
+    Window edges are snapped to the nearest frame boundary. Because Layer III
+    frames may borrow bits from earlier frames, the first frame after a cut
+    can decode with a few milliseconds of noise; this is far less audible
+    than a full decode/encode generation loss.
+    """
+    index = read_frame_index(file_name)
+    notif = None
+
+    sources = []
+    inserts: dict[int, bytes] = {}
+    for window in windows:
+        if window.segment_type == "content":
+            first = index.nearest_boundary(window.start)
+            last = index.nearest_boundary(window.end)
+            if last > first:
+                sources.append((file_name, index, first, last))
+        elif window.segment_type == "ad":
+            if notif is None:
+                notif = _notif_frames(notif_name, index.sample_rate, index.channels)
+            inserts[len(sources)] = inserts.get(len(sources), b"") + notif
+
+    return concat_frames(sources, out_name, tag=index.tag, inserts=inserts)
@@ -0,0 +1,67 @@
+from dataclasses import dataclass
+
+import numpy as np
+from pydub import AudioSegment
+
+_DTYPES = {1: np.int8, 2: np.int16, 4: np.int32}
+
+
+@dataclass
+class PcmBuffer:
+    """Decoded audio as a ``(frames, channels)`` NumPy array.
+
+    Slicing with :meth:`window` returns views into the same memory, and
+    :meth:`concatenate` copies each piece exactly once into a preallocated
+    array, so trimming an episode never holds more than the decoded input
+    and the assembled output at the same time.
+    """
+
+    samples: np.ndarray
+    frame_rate: int
+
+    @classmethod
+    def from_segment(cls, segment: AudioSegment) -> "PcmBuffer":
+        samples = np.frombuffer(segment.raw_data, dtype=_DTYPES[segment.sample_width])
+        return cls(samples=samples.reshape(-1, segment.channels), frame_rate=segment.frame_rate)
+
+    @classmethod
+    def concatenate(cls, buffers: list["PcmBuffer"]) -> "PcmBuffer":
+        if not buffers:
+            raise ValueError("Cannot concatenate an empty list of buffers")
+        first = buffers[0]
+        out = np.empty(
+            (sum(len(b) for b in buffers), first.channels),
+            dtype=first.samples.dtype,
+        )
+        pos = 0
+        for buffer in buffers:
+            out[pos:pos + len(buffer)] = buffer.samples
+            pos += len(buffer)
+        return cls(samples=out, frame_rate=first.frame_rate)
+
+    @property
+    def channels(self) -> int:
+        return self.samples.shape[1]
+
+    @property
+    def sample_width(self) -> int:
+        return self.samples.dtype.itemsize
+
+    def __len__(self) -> int:
+        return self.samples.shape[0]
+
+    def window(self, start: float, end: float) -> "PcmBuffer":
+        """Return a view of the audio between ``start`` and ``end`` seconds."""
+        first = int(start * self.frame_rate)
+        last = int(end * self.frame_rate)
+        return PcmBuffer(samples=self.samples[first:last], frame_rate=self.frame_rate)
+
+    def to_segment(self) -> AudioSegment:
+        """Wrap the buffer in an ``AudioSegment`` without copying it."""
+        data = np.ascontiguousarray(self.samples).reshape(-1).view(np.uint8).data
+        return AudioSegment(
+            data=data,
+            sample_width=self.sample_width,
+            frame_rate=self.frame_rate,
+            channels=self.channels,
+        )
@@ -0,0 +1,249 @@
+"""Staged processing of many episodes at once.
+
+Each step of ad removal runs as its own stage with a bounded worker pool,
+connected by bounded queues, so that while one episode is being encoded the
+next can already be transcribing or waiting on the chat model.
+"""
+import logging
+import os
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable
+
+from . import metrics
+from .ad_trimmer import AdTrimmer
+from .models import EpisodeResult, TrimEngine
+from .notif_path import NOTIF_PATH
+from .utils import (
+    UPLOAD_BITRATE_KBPS,
+    episode_run_id,
+    join_files,
+    resolved_model,
+    split_file,
+)
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+@dataclass
+class StageLimits:
+
+    split: int = 1
+    transcribe: int = 4
+    annotate: int = 4
+    trim: int = max(1, (os.cpu_count() or 1) // 2)
+
+
+@dataclass
+class Episode:
+
+    file_name: str
+    parts: list[str] = field(default_factory=list)
+    trimmers: list[AdTrimmer] = field(default_factory=list)
+    start_time: float = field(default_factory=time.monotonic)
+    # Set when a stage fails for this episode.
+    error: Exception | None = None
+
+
+class Stage:
+
+    def __init__(
+        self,
+        name: str,
+        fn: Callable[[Episode], Episode],
+        workers: int,
+        queue_size: int,
+    ):
+        self.name = name
+        self.fn = fn
+        self.workers = max(1, workers)
+        self.inbox: queue.Queue = queue.Queue(maxsize=queue_size)
+        self.next_stage: "Stage | None" = None
+        self.on_failure: Callable[[Episode], None] | None = None
+        self.processed = 0
+        self.failed = 0
+        self.busy = 0
+        self._alive = 0
+        self._lock = threading.Lock()
+        self._threads: list[threading.Thread] = []
+
+    def start(self) -> None:
+        self._alive = self.workers
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"{self.name}-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self) -> None:
+        """Ask every worker to exit once the queue ahead of it drains."""
+        for _ in range(self.workers):
+            self.inbox.put(_STOP)
+
+    def join(self) -> None:
+        for thread in self._threads:
+            thread.join()
+
+    def _run(self) -> None:
+        while True:
+            episode = self.inbox.get()
+            if episode is _STOP:
+                break
+            with self._lock:
+                self.busy += 1
+            try:
+                episode = self.fn(episode)
+            except Exception as error:
+                logger.exception("Stage %s failed for %s", self.name, episode.file_name)
+                episode.error = error
+                with self._lock:
+                    self.failed += 1
+                if self.on_failure is not None:
+                    try:
+                        self.on_failure(episode)
+                    except Exception:
+                        # Keep the worker alive, so that later stages are still stopped.
+                        logger.exception("Cleanup after stage %s failed for %s", self.name, episode.file_name)
+            else:
+                with self._lock:
+                    self.processed += 1
+                if self.next_stage is not None:
+                    self.next_stage.inbox.put(episode)
+            finally:
+                with self._lock:
+                    self.busy -= 1
+
+        with self._lock:
+            self._alive -= 1
+            last = self._alive == 0
+        if last and self.next_stage is not None:
+            self.next_stage.stop()
+
+
+def _log_progress(stages: list[Stage], started: float) -> None:
+    minutes = max(time.monotonic() - started, 1e-9) / 60
+    logger.info(
+        "Pipeline: %s",
+        " | ".join(
+            f"{s.name} queued={s.inbox.qsize()} busy={s.busy}/{s.workers} "
+            f"done={s.processed} failed={s.failed} ({s.processed / minutes:.1f}/min)"
+            for s in stages
+        ),
+    )
+
+
+def run_pipeline(
+    file_names: list[str],
+    model: str | None = None,
+    engine: TrimEngine = "pydub",
+    notif_name: str = NOTIF_PATH,
+    limits: StageLimits | None = None,
+    queue_size: int = 2,
+    report_interval: float = 60.0,
+    hit_marker: bool = True,
+) -> tuple[list[EpisodeResult], list[tuple[str, Exception]]]:
+    """Remove ads from many episodes with overlapping stages.
+
+    Returns the results of the episodes that were processed, and the file
+    names of those that failed together with the error they failed with.
+    """
+    limits = limits or StageLimits()
+    done: list[EpisodeResult] = []
+    failed: list[tuple[str, Exception]] = []
+    results_lock = threading.Lock()
+
+    def _split(episode: Episode) -> Episode:
+        logger.info("Removing ads from %s", episode.file_name)
+        episode.parts = split_file(
+            episode.file_name,
+            upload_bitrate_kbps=UPLOAD_BITRATE_KBPS,
+            run_id=episode_run_id(episode.file_name),
+        )
+        episode.trimmers = [AdTrimmer(part, model=model, engine=engine) for part in episode.parts]
+        return episode
+
+    def _transcribe(episode: Episode) -> Episode:
+        for trimmer in episode.trimmers:
+            trimmer.transcription()
+        return episode
+
+    def _annotate(episode: Episode) -> Episode:
+        for trimmer in episode.trimmers:
+            trimmer.segments_completion()
+        return episode
+
+    def _trim(episode: Episode) -> Episode:
+        ad_seconds = 0.0
+        for trimmer in episode.trimmers:
+            windows = trimmer.remove_ads(notif_name=notif_name)
+            ad_seconds += sum(w.duration() for w in windows if w.segment_type == "ad")
+        join_files(episode.file_name, file_parts=episode.parts)
+
+        if hit_marker:
+            path = Path(episode.file_name)
+            (path.parent / f".hit.{path.name}.txt").write_text("")
+        elapsed = time.monotonic() - episode.start_time
+        minutes, seconds = divmod(elapsed, 60)
+        logger.info(
+            "Done processing %s (elapsed: %dm %ds)", episode.file_name, int(minutes), int(seconds)
+        )
+        result = EpisodeResult(
+            file_name=episode.file_name,
+            elapsed=elapsed,
+            ad_seconds=ad_seconds,
+            model=resolved_model(model),
+        )
+        with results_lock:
+            done.append(result)
+        metrics.QUEUE_DEPTH.dec(queue="episodes")
+        metrics.EPISODES.inc(outcome="done")
+        metrics.AD_SECONDS.inc(ad_seconds)
+        return episode
+
+    def _cleanup(episode: Episode) -> None:
+        for part in episode.parts:
+            if os.path.exists(part):
+                os.remove(part)
+        with results_lock:
+            failed.append((episode.file_name, episode.error))
+        metrics.QUEUE_DEPTH.dec(queue="episodes")
+        metrics.EPISODES.inc(outcome="failed")
+
+    stages = [
+        Stage("split", _split, limits.split, queue_size),
+        Stage("transcribe", _transcribe, limits.transcribe, queue_size),
+        Stage("annotate", _annotate, limits.annotate, queue_size),
+        Stage("trim", _trim, limits.trim, queue_size),
+    ]
+    for stage, next_stage in zip(stages, stages[1:]):
+        stage.next_stage = next_stage
+    for stage in stages:
+        stage.on_failure = _cleanup
+        stage.start()
+
+    started = time.monotonic()
+    finished = threading.Event()
+
+    def _report() -> None:
+        while not finished.wait(report_interval):
+            _log_progress(stages, started)
+
+    reporter = threading.Thread(target=_report, name="pipeline-report", daemon=True)
+    reporter.start()
+
+    logger.info("Pipeline processing %d podcast(s)", len(file_names))
+    metrics.QUEUE_DEPTH.inc(len(file_names), queue="episodes")
+    for file_name in file_names:
+        stages[0].inbox.put(Episode(file_name=file_name))
+    stages[0].stop()
+    for stage in stages:
+        stage.join()
+
+    finished.set()
+    reporter.join()
+    _log_progress(stages, started)
+    return done, failed
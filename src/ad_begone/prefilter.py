@@ -0,0 +1,133 @@
+"""Cheap local scoring of transcript lines to find ad candidates.
+
+Ads cluster around sponsor phrases ("brought to you by", "use code",
+"dot com", ...). Each line is scored against a small set of weighted
+patterns, the scores are smoothed over neighbouring lines, and lines above
+the threshold are padded into candidate regions. Only those regions need to
+be sent to the chat model; everything else is taken to be content.
+"""
+import re
+from pathlib import Path
+
+import numpy as np
+
+# (pattern, weight); matched case-insensitively against each line.
+AD_PATTERNS: list[tuple[str, float]] = [
+    (r"\bsponsor(ed|s|ing)?\b", 2.0),
+    (r"\bbrought to you by\b", 2.0),
+    (r"\b(promo|coupon|discount|offer) code\b|\buse (the )?code\b", 2.0),
+    (r"\bdot com\b|\bdot co\b|\.com\b|https?://|\bwww\.", 1.5),
+    (r"\bpercent off\b|%\s*off\b|\bfree (trial|shipping)\b", 1.5),
+    (r"\b(a word from|message from|after the break|right back after)\b", 1.5),
+    (r"\b(get yours|order now|sign up|first (order|bag|box|month))\b", 1.0),
+    (r"\b(visit|head to|go to|available at)\b", 0.5),
+    (r"\b(speaking of|let me tell you about)\b", 0.5),
+]
+
+DEFAULT_THRESHOLD = 1.5
+# Lines of context kept on each side of a candidate line.
+DEFAULT_PADDING = 3
+
+_COMPILED = [(re.compile(pattern, re.IGNORECASE), weight) for pattern, weight in AD_PATTERNS]
+_WEIGHTS = np.array([weight for _, weight in AD_PATTERNS])
+# A line's score also counts half of each neighbour's, so that spread-out
+# sponsor reads add up.
+_SMOOTHING = np.array([0.5, 1.0, 0.5])
+
+
+def _convolve_same(values: np.ndarray, kernel: np.ndarray) -> np.ndarray:
+    """Convolve with an odd-length kernel, keeping one output per value.
+
+    ``np.convolve(..., mode="same")`` returns as many values as the longer
+    input, so it would misalign transcripts shorter than the kernel.
+    """
+    return np.convolve(np.pad(values, len(kernel) // 2), kernel, mode="valid")
+
+
+def score_lines(lines: list[str]) -> np.ndarray:
+    """Score each line by the weighted sponsor patterns it and its neighbours match."""
+    if not lines:
+        return np.zeros(0)
+    hits = np.array(
+        [[bool(regex.search(line)) for regex, _ in _COMPILED] for line in lines],
+        dtype=float,
+    )
+    return _convolve_same(hits @ _WEIGHTS, _SMOOTHING)
+
+
+def candidate_mask(
+    scores: np.ndarray,
+    threshold: float = DEFAULT_THRESHOLD,
+    padding: int = DEFAULT_PADDING,
+) -> np.ndarray:
+    """Mark lines scoring at least ``threshold``, widened by ``padding`` on each side."""
+    flagged = (scores >= threshold).astype(float)
+    if padding <= 0 or not flagged.size:
+        return flagged > 0
+    return _convolve_same(flagged, np.ones(2 * padding + 1)) > 0
+
+
+def mask_to_regions(mask: np.ndarray) -> list[tuple[int, int]]:
+    """Turn a boolean mask into ``[start, end)`` ranges of consecutive ``True``."""
+    edges = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    return [(int(start), int(end)) for start, end in zip(starts, ends)]
+
+
+def candidate_regions(
+    lines: list[str],
+    threshold: float = DEFAULT_THRESHOLD,
+    padding: int = DEFAULT_PADDING,
+) -> list[tuple[int, int]]:
+    """Return the ``[start, end)`` ranges of ``lines`` that may contain ads."""
+    return mask_to_regions(candidate_mask(score_lines(lines), threshold, padding))
+
+
+def prefilter_report(
+    fixtures_dir: str,
+    threshold: float = DEFAULT_THRESHOLD,
+    padding: int = DEFAULT_PADDING,
+) -> list[tuple[str, float, float]]:
+    """Measure, per fixture, the share of prompt tokens saved and the ad recall kept.
+
+    Recall is that of a perfect annotator that only sees the candidate
+    regions, so it is the most the pre-filter allows the chat model to reach.
+    """
+    import json
+
+    from openai.types.audio.transcription_verbose import TranscriptionVerbose
+
+    from .accuracy import compute_accuracy, expand_annotations
+    from .chunking import labels_to_annotations
+    from .models import SegmentAnnotation
+    from .prompt import encode_transcript, estimate_tokens
+
+    rows = []
+    for fixture in sorted(Path(fixtures_dir).glob("*/transcription.json")):
+        transcription = TranscriptionVerbose.model_validate_json(fixture.read_text())
+        ground_truth = [
+            SegmentAnnotation.model_validate(item)
+            for item in json.loads((fixture.parent / "ground_truth.json").read_text())
+        ]
+        lines = encode_transcript(transcription).lines
+        mask = candidate_mask(score_lines(lines), threshold, padding)
+
+        total = sum(estimate_tokens(line) for line in lines)
+        sent = sum(estimate_tokens(line) for line, keep in zip(lines, mask) if keep)
+        truth = expand_annotations(ground_truth, len(lines))
+        predicted = labels_to_annotations([
+            label if keep else "content" for label, keep in zip(truth, mask)
+        ])
+        report = compute_accuracy(predicted, ground_truth, transcription)
+        rows.append((fixture.parent.name, 1 - sent / total if total else 0.0, report.segment_recall))
+    return rows
+
+
+if __name__ == "__main__":
+    import sys
+
+    fixtures_dir = sys.argv[1] if len(sys.argv) > 1 else "test/fixtures"
+    print(f"{'fixture':<20} {'saved':>7} {'recall':>7}")
+    for name, saved, recall in prefilter_report(fixtures_dir):
+        print(f"{name:<20} {saved:>7.1%} {recall:>7.1%}")
@@ -0,0 +1,140 @@
+"""Encoding transcripts into annotation prompts.
+
+Three encodings are available:
+
+- ``"segment"``: one ``Segment {i}: text`` line per Whisper segment, the
+  original format.
+- ``"compact"``: one ``[i] text`` line per segment, dropping the repeated
+  ``Segment`` prefix.
+- ``"blocks"``: like ``"compact"``, but runs of short segments are merged
+  into numbered blocks of at least ``min_words`` words. Block indices are
+  mapped back to the first segment of each block, so ad boundaries can only
+  fall on block starts.
+"""
+import logging
+from dataclasses import dataclass
+from pathlib import Path
+
+from openai.types.audio.transcription_verbose import TranscriptionVerbose
+
+from .models import PromptEncoding, SegmentAnnotation
+
+logger = logging.getLogger(__name__)
+
+SYSTEM_PROMPT = """You are a helpful assistant.
+        You help users identify segments in a transcription that are ads or content.
+        You will be given a transcription and asked to annotate the segments as either ads or content.
+        You ONLY need to provide annotations for the segments at the beginning of each ad or content block.
+        """
+
+_USER_PROMPTS: dict[str, str] = {
+    "segment": "Please annotate following transcription with the segments that are ads or content:\n",
+    "compact": (
+        "Please annotate following transcription with the segments that are ads or content. "
+        "Each line starts with its segment index in brackets:\n"
+    ),
+    "blocks": (
+        "Please annotate following transcription with the segments that are ads or content. "
+        "Each line starts with its index in brackets:\n"
+    ),
+}
+
+DEFAULT_MIN_BLOCK_WORDS = 12
+
+
+def estimate_tokens(text: str) -> int:
+    """Roughly estimate the tokens a prompt will use, for rate limiting."""
+    return len(text) // 4 + 1
+
+
+@dataclass
+class EncodedTranscript:
+
+    encoding: PromptEncoding
+    lines: list[str]
+    # First segment index of each line.
+    line_segments: list[int]
+    segment_count: int
+
+    @property
+    def text(self) -> str:
+        return "".join(self.lines)
+
+    def user_prompt(self, start: int = 0, end: int | None = None) -> str:
+        """Build the user message for lines ``start`` to ``end``."""
+        return _USER_PROMPTS[self.encoding] + "".join(self.lines[start:end])
+
+    def covered_lines(self, segments: set[int]) -> list[bool]:
+        """Mark the lines whose segments are all in ``segments``."""
+        ends = self.line_segments[1:] + [self.segment_count]
+        return [
+            all(i in segments for i in range(start, end))
+            for start, end in zip(self.line_segments, ends)
+        ]
+
+    def to_segment_annotations(self, annotations: list[SegmentAnnotation]) -> list[SegmentAnnotation]:
+        """Map annotations that refer to line indices back to segment indices."""
+        mapped = []
+        for ann in annotations:
+            if not 0 <= ann.segment_index < len(self.line_segments):
+                continue
+            mapped.append(SegmentAnnotation(
+                segment_type=ann.segment_type,
+                segment_index=self.line_segments[ann.segment_index],
+            ))
+        return mapped
+
+
+def encode_transcript(
+    transcription: TranscriptionVerbose,
+    encoding: PromptEncoding = "segment",
+    min_block_words: int = DEFAULT_MIN_BLOCK_WORDS,
+) -> EncodedTranscript:
+    if encoding not in _USER_PROMPTS:
+        logger.error("Unknown prompt encoding: %s", encoding)
+        raise ValueError(f"Unknown prompt encoding: {encoding}")
+
+    texts = [segment.text.strip() for segment in transcription.segments]
+
+    if encoding == "segment":
+        lines = [f"Segment {idx}: {text}\n" for idx, text in enumerate(texts)]
+        return EncodedTranscript(encoding, lines, list(range(len(texts))), len(texts))
+    if encoding == "compact":
+        lines = [f"[{idx}] {text}\n" for idx, text in enumerate(texts)]
+        return EncodedTranscript(encoding, lines, list(range(len(texts))), len(texts))
+
+    line_segments: list[int] = []
+    blocks: list[list[str]] = []
+    words = 0
+    for idx, text in enumerate(texts):
+        if not blocks or words >= min_block_words:
+            line_segments.append(idx)
+            blocks.append([])
+            words = 0
+        blocks[-1].append(text)
+        words += len(text.split())
+    lines = [f"[{i}] {' '.join(block)}\n" for i, block in enumerate(blocks)]
+    return EncodedTranscript(encoding, lines, line_segments, len(texts))
+
+
+def token_report(fixtures_dir: str) -> list[tuple[str, str, int, float]]:
+    """Estimate prompt tokens per encoding and the saving relative to ``"segment"``."""
+    rows = []
+    for fixture in sorted(Path(fixtures_dir).glob("*/transcription.json")):
+        transcription = TranscriptionVerbose.model_validate_json(fixture.read_text())
+        baseline = None
+        for encoding in _USER_PROMPTS:
+            encoded = encode_transcript(transcription, encoding)
+            tokens = estimate_tokens(SYSTEM_PROMPT + encoded.user_prompt())
+            baseline = baseline or tokens
+            rows.append((fixture.parent.name, encoding, tokens, 1 - tokens / baseline))
+    return rows
+
+
+if __name__ == "__main__":
+    import sys
+
+    fixtures_dir = sys.argv[1] if len(sys.argv) > 1 else "test/fixtures"
+    print(f"{'fixture':<20} {'encoding':<10} {'tokens':>8} {'saved':>7}")
+    for name, encoding, tokens, saved in token_report(fixtures_dir):
+        print(f"{name:<20} {encoding:<10} {tokens:>8} {saved:>7.1%}")
@@ -0,0 +1,265 @@
+"""Shared rate limiting and retries for OpenAI API calls.
+
+Every call goes through a :class:`RateLimiter`, which combines token buckets
+for requests and tokens per minute, an AIMD concurrency limit that backs off
+when the API returns 429s or slows down, and retries that honour the
+``Retry-After`` headers sent with rate limit errors.
+"""
+import email.utils
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator, TypeVar
+
+from openai import APIConnectionError, APITimeoutError, InternalServerError, RateLimitError
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+_RETRYABLE_ERRORS = (RateLimitError, APIConnectionError, APITimeoutError, InternalServerError)
+
+DEFAULT_REQUESTS_PER_MINUTE = 500
+DEFAULT_MAX_CONCURRENCY = 64
+# Calls slower than this, in seconds, are treated like a 429 by the
+# concurrency limit. A transcription uploads a whole part, which takes far
+# longer than a chat call even when the API is healthy.
+DEFAULT_LATENCY_TARGETS = {
+    "transcription": 300.0,
+    "chat": 60.0,
+}
+
+
+class TokenBucket:
+    """Allow ``rate_per_minute`` units per minute, with bursts up to ``capacity``."""
+
+    def __init__(
+        self,
+        rate_per_minute: float,
+        capacity: float | None = None,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self._available = self.capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self._available = min(self.capacity, self._available + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, amount: float = 1.0) -> float:
+        """Take ``amount`` units if available; otherwise return the seconds to wait."""
+        amount = min(amount, self.capacity)
+        with self._lock:
+            self._refill()
+            if self._available >= amount:
+                self._available -= amount
+                return 0.0
+            return (amount - self._available) / self.rate
+
+    def acquire(self, amount: float = 1.0) -> None:
+        while (wait := self.try_acquire(amount)) > 0:
+            self._sleep(wait)
+
+
+class AimdLimiter:
+    """Concurrency limit with additive increase and multiplicative decrease.
+
+    The limit grows by roughly one slot per limit's worth of fast successful
+    calls and is cut by ``decrease`` on every throttled or slow call.
+    """
+
+    def __init__(
+        self,
+        initial: int = 4,
+        minimum: int = 1,
+        maximum: int = 64,
+        decrease: float = 0.5,
+        latency_target: float | None = None,
+    ):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.decrease = decrease
+        self.latency_target = latency_target
+        self._limit = float(initial)
+        self._in_flight = 0
+        self._cond = threading.Condition()
+
+    @property
+    def limit(self) -> int:
+        return max(self.minimum, int(self._limit))
+
+    @contextmanager
+    def slot(self) -> Iterator[None]:
+        with self._cond:
+            while self._in_flight >= self.limit:
+                self._cond.wait()
+            self._in_flight += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._in_flight -= 1
+                self._cond.notify_all()
+
+    def on_success(self, latency: float) -> None:
+        with self._cond:
+            if self.latency_target is not None and latency > self.latency_target:
+                self._limit = max(self.minimum, self._limit * self.decrease)
+            else:
+                self._limit = min(self.maximum, self._limit + 1.0 / self._limit)
+            self._cond.notify_all()
+
+    def on_throttle(self) -> None:
+        with self._cond:
+            self._limit = max(self.minimum, self._limit * self.decrease)
+            logger.debug("Throttled, concurrency limit now %d", self.limit)
+
+
+def retry_after(error: Exception) -> float | None:
+    """Return the delay requested by an API error's headers, in seconds."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+
+    retry_ms = headers.get("retry-after-ms")
+    if retry_ms is not None:
+        try:
+            return float(retry_ms) / 1000
+        except ValueError:
+            pass
+
+    value = headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+class RateLimiter:
+
+    def __init__(
+        self,
+        requests_per_minute: float,
+        tokens_per_minute: float | None = None,
+        concurrency: AimdLimiter | None = None,
+        max_retries: int = 6,
+        backoff_base: float = 1.0,
+        backoff_max: float = 60.0,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.requests = TokenBucket(requests_per_minute, clock=clock, sleep=sleep)
+        self.tokens = None
+        if tokens_per_minute is not None:
+            self.tokens = TokenBucket(tokens_per_minute, clock=clock, sleep=sleep)
+        self.concurrency = concurrency or AimdLimiter()
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._clock = clock
+        self._sleep = sleep
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _pause(self, seconds: float) -> None:
+        with self._lock:
+            self._paused_until = max(self._paused_until, self._clock() + seconds)
+
+    def _wait_for_pause(self) -> None:
+        while (wait := self._paused_until - self._clock()) > 0:
+            self._sleep(wait)
+
+    def _backoff(self, attempt: int) -> float:
+        delay = min(self.backoff_max, self.backoff_base * 2 ** attempt)
+        return delay * (0.5 + random.random() / 2)
+
+    def call(self, fn: Callable[[], T], tokens: int = 0) -> T:
+        """Run ``fn`` within the rate limits, retrying transient API errors."""
+        attempt = 0
+        while True:
+            self._wait_for_pause()
+            self.requests.acquire()
+            if self.tokens is not None and tokens:
+                self.tokens.acquire(tokens)
+
+            with self.concurrency.slot():
+                start = self._clock()
+                try:
+                    result = fn()
+                except _RETRYABLE_ERRORS as error:
+                    failure = error
+                else:
+                    self.concurrency.on_success(self._clock() - start)
+                    return result
+
+            throttled = isinstance(failure, RateLimitError)
+            if throttled:
+                self.concurrency.on_throttle()
+            if attempt == self.max_retries:
+                logger.error("Giving up after %d attempts: %s", attempt + 1, failure)
+                raise failure
+            delay = retry_after(failure)
+            if delay is None:
+                delay = self._backoff(attempt)
+            logger.warning(
+                "%s, retrying in %.1fs (attempt %d/%d)",
+                type(failure).__name__, delay, attempt + 1, self.max_retries,
+            )
+            if throttled:
+                # A 429 applies to the whole account, so hold back every caller.
+                self._pause(delay)
+            else:
+                self._sleep(delay)
+            attempt += 1
+
+
+_LIMITERS: dict[str, RateLimiter] = {}
+_LIMITERS_LOCK = threading.Lock()
+
+
+def _env_float(name: str) -> float | None:
+    value = os.environ.get(name)
+    if not value:
+        return None
+    number = float(value)
+    if number <= 0:
+        logger.error("%s must be positive, got %s", name, value)
+        raise ValueError(f"{name} must be positive")
+    return number
+
+
+def get_rate_limiter(kind: str) -> RateLimiter:
+    """Return the process-wide limiter for one kind of call.
+
+    ``kind`` is ``"transcription"`` or ``"chat"``. Limits are read from
+    ``OPENAI_<KIND>_RPM``, ``OPENAI_<KIND>_TPM``,
+    ``OPENAI_<KIND>_LATENCY_TARGET`` and ``OPENAI_MAX_CONCURRENCY``.
+    """
+    with _LIMITERS_LOCK:
+        if kind not in _LIMITERS:
+            prefix = f"OPENAI_{kind.upper()}"
+            _LIMITERS[kind] = RateLimiter(
+                requests_per_minute=_env_float(f"{prefix}_RPM") or DEFAULT_REQUESTS_PER_MINUTE,
+                tokens_per_minute=_env_float(f"{prefix}_TPM"),
+                concurrency=AimdLimiter(
+                    maximum=int(_env_float("OPENAI_MAX_CONCURRENCY") or DEFAULT_MAX_CONCURRENCY),
+                    latency_target=_env_float(f"{prefix}_LATENCY_TARGET") or DEFAULT_LATENCY_TARGETS.get(kind),
+                ),
+            )
+        return _LIMITERS[kind]
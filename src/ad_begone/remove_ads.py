@@ -1,9 +1,11 @@
 import logging
 import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 from .ad_trimmer import AdTrimmer
-from .utils import join_files, split_file
+from .models import EpisodeResult, TrimEngine
+from .utils import UPLOAD_BITRATE_KBPS, episode_run_id, join_files, resolved_model, split_file
 
 from .notif_path import NOTIF_PATH
 
@@ -15,39 +17,89 @@ def remove_ads(
     notif_name: str = NOTIF_PATH,
     overwrite: bool = False,
     model: str | None = None,
-):
+    engine: TrimEngine = "pydub",
+    part_workers: int = 1,
+    hit_marker: bool = True,
+    parts: list[str] | None = None,
+) -> EpisodeResult | None:
+    """Remove ads from an episode, writing a ``.hit`` marker when done.
+
+    Up to ``part_workers`` parts of the episode are transcribed, annotated
+    and trimmed concurrently before the parts are joined again. Returns
+    ``None`` if the episode was already processed. Callers that track
+    progress elsewhere pass ``hit_marker=False`` to skip the marker file.
+    ``parts`` resumes an episode already split by an earlier run, such as
+    one annotated through :mod:`ad_begone.batch`.
+    """
     if out_name is None:
         out_name = file_name
 
     path = Path(file_name)
     path_file_hit = path.parent / f".hit.{path.name}.txt"
 
-    if path_file_hit.exists() and not overwrite:
+    if hit_marker and path_file_hit.exists() and not overwrite:
         logger.debug("Already processed %s, skipping", file_name)
         return
 
     logger.info("Removing ads from %s", file_name)
     start_time = time.monotonic()
 
-    split_names = split_file(file_name)
-    for i, split_name in enumerate(split_names, 1):
-        logger.info("Processing part %d/%d for %s", i, len(split_names), file_name)
-        trimmer = AdTrimmer(split_name, model=model)
-        trimmer.remove_ads(notif_name=notif_name)
+    if parts is not None:
+        split_names = parts
+    else:
+        # A retry of the same episode gets the same part names, and so reuses
+        # the transcriptions and annotations its earlier attempt cached.
+        run_id = episode_run_id(file_name)
+        split_names = split_file(file_name, upload_bitrate_kbps=UPLOAD_BITRATE_KBPS, run_id=run_id)
+
+    trimmers = [AdTrimmer(split_name, model=model, engine=engine) for split_name in split_names]
+
+    def _process_part(i: int, trimmer: AdTrimmer):
+        logger.info("Processing part %d/%d for %s", i, len(trimmers), file_name)
+        windows = trimmer.remove_ads(notif_name=notif_name)
+        return sum(w.duration() for w in windows if w.segment_type == "ad")
+
+    with ThreadPoolExecutor(max_workers=max(1, part_workers)) as pool:
+        futures = [
+            pool.submit(_process_part, i, trimmer)
+            for i, trimmer in enumerate(trimmers, 1)
+        ]
+        try:
+            ad_seconds = sum(future.result() for future in futures)
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
     logger.info("Joining parts for %s", file_name)
-    join_files(file_name)
+    join_files(file_name, file_parts=split_names)
 
     elapsed = time.monotonic() - start_time
     minutes, seconds = divmod(elapsed, 60)
     logger.info("Done processing %s (elapsed: %dm %ds)", file_name, int(minutes), int(seconds))
-    path_file_hit.write_text("")
+    if hit_marker:
+        path_file_hit.write_text("")
+    return EpisodeResult(
+        file_name=file_name,
+        elapsed=elapsed,
+        ad_seconds=ad_seconds,
+        model=resolved_model(model),
+    )
 
 if __name__ == "__main__":
     from typing import Optional
 
+    import os
+
     import pydantic.v1 as pydantic
     import pydantic_argparse
 
+    from .artifacts import CACHE_DIR_ENV
+    from .client import BASE_URL_ENV
+    from .fingerprint import FINGERPRINT_DB_ENV
+    from .models import TranscriberName
+    from .shingles import SHINGLE_DB_ENV
+    from .transcribers import TRANSCRIBER_ENV
+
     class RemoveAdsArgs(pydantic.BaseModel):
         file_name: str = pydantic.Field(
             description="Path to the podcast episode file.",
@@ -60,6 +112,38 @@ if __name__ == "__main__":
             default=None,
             description="OpenAI model to use for ad classification.",
         )
+        base_url: Optional[str] = pydantic.Field(
+            default=None,
+            description="URL of an OpenAI-compatible API to use instead of OpenAI's.",
+        )
+        transcriber: Optional[TranscriberName] = pydantic.Field(
+            default=None,
+            description="Transcription backend: 'openai' uploads to the API, 'local' runs Whisper on the CPU.",
+        )
+        engine: TrimEngine = pydantic.Field(
+            default="pydub",
+            description=(
+                "Trimming engine: 'pydub' re-encodes in memory, 'frames' splices MP3 "
+                "frames without decoding, 'stream' re-encodes with constant memory."
+            ),
+        )
+        part_workers: int = pydantic.Field(
+            default=1,
+            gt=0,
+            description="Number of parts of the episode to process concurrently.",
+        )
+        cache_dir: Optional[str] = pydantic.Field(
+            default=None,
+            description="Directory for transcriptions and annotations shared by identical audio.",
+        )
+        fingerprint_db: Optional[str] = pydantic.Field(
+            default=None,
+            description="SQLite index of removed ads, to recognise them by their audio in later episodes.",
+        )
+        shingle_db: Optional[str] = pydantic.Field(
+            default=None,
+            description="SQLite index of removed ad transcripts, to recognise repeated ad reads.",
+        )
 
     parser = pydantic_argparse.ArgumentParser(
         model=RemoveAdsArgs,
@@ -67,4 +151,21 @@ if __name__ == "__main__":
     )
     args = parser.parse_typed_args()
 
-    remove_ads(args.file_name, args.out_name, model=args.model)
+    if args.transcriber:
+        os.environ[TRANSCRIBER_ENV] = args.transcriber
+    if args.base_url:
+        os.environ[BASE_URL_ENV] = args.base_url
+    if args.cache_dir:
+        os.environ[CACHE_DIR_ENV] = args.cache_dir
+    if args.fingerprint_db:
+        os.environ[FINGERPRINT_DB_ENV] = args.fingerprint_db
+    if args.shingle_db:
+        os.environ[SHINGLE_DB_ENV] = args.shingle_db
+
+    remove_ads(
+        args.file_name,
+        args.out_name,
+        model=args.model,
+        engine=args.engine,
+        part_workers=args.part_workers,
+    )
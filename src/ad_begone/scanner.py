@@ -0,0 +1,121 @@
+"""Incremental scanning of a podcast library.
+
+A directory's mtime changes whenever an entry is added, removed or renamed
+in it, so :class:`LibraryScanner` only lists directories whose mtime moved
+since the previous scan and reuses its remembered listing for the rest.
+Known directories still need one ``stat`` each, which is done level by
+level in a thread pool to hide the latency of network filesystems.
+"""
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# Filesystem timestamps can be coarse, so a directory changed within this
+# window of being listed might not show a new mtime; list it again next time.
+_RACY_WINDOW_NS = 2_000_000_000
+
+
+@dataclass
+class ScanStats:
+
+    directories: int = 0
+    listed: int = 0
+    entries: int = 0
+    elapsed: float = 0.0
+
+
+@dataclass
+class ScanResult:
+
+    files: list[Path] = field(default_factory=list)
+    changed: list[Path] = field(default_factory=list)
+    stats: ScanStats = field(default_factory=ScanStats)
+
+
+@dataclass
+class _Listing:
+
+    mtime_ns: int
+    files: list[str]
+    subdirs: list[str]
+
+
+class LibraryScanner:
+
+    def __init__(
+        self,
+        root: str,
+        suffix: str = ".mp3",
+        workers: int = 8,
+    ):
+        self.root = str(root)
+        self.suffix = suffix
+        self.workers = max(1, workers)
+        self._listings: dict[str, _Listing] = {}
+
+    def _visit(self, directory: str) -> tuple[_Listing, int] | None:
+        """Return the listing of ``directory`` and how many entries were read."""
+        try:
+            mtime_ns = os.stat(directory).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        cached = self._listings.get(directory)
+        if cached is not None and cached.mtime_ns == mtime_ns:
+            return cached, 0
+
+        files, subdirs, entries = [], [], 0
+        try:
+            with os.scandir(directory) as it:
+                for entry in it:
+                    entries += 1
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.path)
+                    elif entry.name.endswith(self.suffix):
+                        files.append(entry.path)
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+        except PermissionError:
+            logger.warning("Permission denied listing %s", directory)
+            return None
+        if time.time_ns() - mtime_ns < _RACY_WINDOW_NS:
+            mtime_ns = -1
+        return _Listing(mtime_ns, files, subdirs), entries
+
+    def scan(self) -> ScanResult:
+        """Walk the library, re-listing only directories that changed.
+
+        ``files`` holds every matching file; ``changed`` only those found in
+        directories that were listed during this scan.
+        """
+        start = time.monotonic()
+        result = ScanResult()
+        listings: dict[str, _Listing] = {}
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            level = [self.root]
+            while level:
+                next_level = []
+                for directory, visited in zip(level, pool.map(self._visit, level)):
+                    if visited is None:
+                        continue
+                    listing, entries = visited
+                    listings[directory] = listing
+                    result.stats.directories += 1
+                    paths = [Path(f) for f in listing.files]
+                    result.files.extend(paths)
+                    if listing is not self._listings.get(directory):
+                        result.stats.listed += 1
+                        result.stats.entries += entries
+                        result.changed.extend(paths)
+                    next_level.extend(listing.subdirs)
+                level = next_level
+
+        # Directories that disappeared are dropped along with their listings.
+        self._listings = listings
+        result.stats.elapsed = time.monotonic() - start
+        return result
@@ -0,0 +1,281 @@
+"""Text index of known ad reads, for recognising them in other transcripts.
+
+Host-read ads reuse nearly the same script across episodes and shows. The
+transcript of every removed ad is split into overlapping chunks of about
+:data:`CHUNK_WORDS` words, and each chunk is summarised by a MinHash
+signature of its word shingles. The signatures are banded for
+locality-sensitive hashing and the band keys are stored in SQLite, so
+finding candidates is a handful of index seeks however many ads are stored.
+
+A new transcript is cut into windows of the same size, one starting at each
+segment. A window's candidates are the chunks that share enough bands with
+it. Windows are too coarse to find where an ad starts and ends, so each
+segment is then checked against the shingles of the candidate ads, and
+counts as a known ad when most of its shingles occur in them.
+"""
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SHINGLE_DB_ENV = "AD_BEGONE_SHINGLE_DB"
+
+SHINGLE_WORDS = 3
+CHUNK_WORDS = 30
+CHUNK_STRIDE = 10
+NUM_PERM = 128
+BANDS = 32
+ROWS = NUM_PERM // BANDS
+# Chunks sharing at least this many bands with a window are candidates.
+# With four rows per band, that is likely above a Jaccard similarity of
+# about 0.5 and unlikely below 0.3.
+MIN_BANDS = 3
+# Share of a segment's shingles that must occur in a candidate ad.
+MIN_CONTAINMENT = 0.6
+
+_WORD_RE = re.compile(r"[a-z0-9']+")
+_SHINGLE_BASE = np.uint64(0x100000001B3)
+_rng = np.random.default_rng(0x5EED)
+# Multiply-shift hash functions, one per permutation.
+_A = _rng.integers(1, 2**63, size=NUM_PERM, dtype=np.uint64) | np.uint64(1)
+_B = _rng.integers(0, 2**63, size=NUM_PERM, dtype=np.uint64)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS ads (
+    id INTEGER PRIMARY KEY,
+    source TEXT,
+    words INTEGER NOT NULL,
+    shingles BLOB NOT NULL,
+    added_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS chunks (
+    id INTEGER PRIMARY KEY,
+    ad_id INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS bands (
+    key INTEGER NOT NULL,
+    chunk_id INTEGER NOT NULL,
+    PRIMARY KEY (key, chunk_id)
+) WITHOUT ROWID;
+"""
+
+
+def words(text: str) -> list[str]:
+    return _WORD_RE.findall(text.lower())
+
+
+def shingle_hashes(tokens: list[str]) -> np.ndarray:
+    """Hash the shingle starting at each word of ``tokens``."""
+    hashes = np.array([zlib.crc32(t.encode()) for t in tokens], dtype=np.uint64)
+    k = min(SHINGLE_WORDS, len(hashes))
+    n = len(hashes) - k + 1
+    shingles = np.zeros(max(n, 0), dtype=np.uint64)
+    for j in range(k):
+        shingles = shingles * _SHINGLE_BASE + hashes[j:j + n]
+    return shingles
+
+
+def minhash(tokens: list[str]) -> np.ndarray:
+    """MinHash signature of the word shingles of ``tokens``."""
+    shingles = np.unique(shingle_hashes(tokens))
+    if not len(shingles):
+        return np.full(NUM_PERM, np.iinfo(np.uint32).max, dtype=np.uint32)
+    return ((_A[:, None] * shingles[None, :] + _B[:, None]) >> np.uint64(32)).min(axis=1).astype(np.uint32)
+
+
+def band_keys(signature: np.ndarray) -> list[int]:
+    """Hash each band of a signature, together with its position, to an integer key."""
+    keys = []
+    for band in range(BANDS):
+        rows = signature[band * ROWS:(band + 1) * ROWS].tobytes()
+        digest = hashlib.blake2b(bytes([band]) + rows, digest_size=8).digest()
+        keys.append(int.from_bytes(digest, "big", signed=True))
+    return keys
+
+
+def _chunks(tokens: list[str]) -> list[list[str]]:
+    if len(tokens) <= CHUNK_WORDS:
+        return [tokens]
+    starts = list(range(0, len(tokens) - CHUNK_WORDS + 1, CHUNK_STRIDE))
+    if starts[-1] + CHUNK_WORDS < len(tokens):
+        starts.append(len(tokens) - CHUNK_WORDS)
+    return [tokens[start:start + CHUNK_WORDS] for start in starts]
+
+
+def segment_windows(texts: list[str]) -> list[tuple[int, int, list[str]]]:
+    """Return ``(start, end, words)`` for the window of at least CHUNK_WORDS starting at each segment."""
+    tokens = [words(text) for text in texts]
+    windows = []
+    for start in range(len(tokens)):
+        window: list[str] = []
+        end = start
+        while end < len(tokens) and len(window) < CHUNK_WORDS:
+            window.extend(tokens[end])
+            end += 1
+        if len(window) >= SHINGLE_WORDS:
+            windows.append((start, end, window))
+    return windows
+
+
+class ShingleIndex:
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # Losing the last few ads in a power cut is harmless, and syncing
+        # every insert would dominate the cost of adding an ad.
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM ads").fetchone()[0]
+
+    def add(self, text: str, source: str | None = None) -> int | None:
+        """Store the transcript of an ad and return its id, or ``None`` if it is too short."""
+        tokens = words(text)
+        if len(tokens) < SHINGLE_WORDS:
+            return None
+        keys = [band_keys(minhash(chunk)) for chunk in _chunks(tokens)]
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN")
+            ad_id = self._conn.execute(
+                "INSERT INTO ads (source, words, shingles, added_at) VALUES (?, ?, ?, ?)",
+                (source, len(tokens), np.unique(shingle_hashes(tokens)).tobytes(), time.time()),
+            ).lastrowid
+            for chunk_keys in keys:
+                chunk_id = self._conn.execute("INSERT INTO chunks (ad_id) VALUES (?)", (ad_id,)).lastrowid
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO bands (key, chunk_id) VALUES (?, ?)",
+                    ((key, chunk_id) for key in chunk_keys),
+                )
+        logger.debug("Indexed ad transcript %d from %s (%d words)", ad_id, source, len(tokens))
+        return ad_id
+
+    def entries(self) -> list[tuple[int, str | None, float, int]]:
+        """Return ``(id, source, added_at, words)`` for every stored ad."""
+        with self._lock:
+            return self._conn.execute("SELECT id, source, added_at, words FROM ads ORDER BY id").fetchall()
+
+    def remove(self, ad_id: int) -> bool:
+        """Forget an ad transcript that was wrongly taken for one; return whether it was stored."""
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN")
+            self._conn.execute(
+                "DELETE FROM bands WHERE chunk_id IN (SELECT id FROM chunks WHERE ad_id = ?)",
+                (ad_id,),
+            )
+            self._conn.execute("DELETE FROM chunks WHERE ad_id = ?", (ad_id,))
+            removed = self._conn.execute("DELETE FROM ads WHERE id = ?", (ad_id,)).rowcount > 0
+        if removed:
+            logger.info("Removed ad transcript %d from %s", ad_id, self.path)
+        return removed
+
+    def _lookup(self, keys: list[int]) -> dict[int, list[int]]:
+        """Map each band key to the chunks stored under it."""
+        found: dict[int, list[int]] = {}
+        unique = sorted(set(keys))
+        with self._lock:
+            # Stay below SQLite's limit on query parameters.
+            for i in range(0, len(unique), 900):
+                batch = unique[i:i + 900]
+                for key, chunk_id in self._conn.execute(
+                    f"SELECT key, chunk_id FROM bands WHERE key IN ({','.join('?' * len(batch))})",
+                    batch,
+                ):
+                    found.setdefault(key, []).append(chunk_id)
+        return found
+
+    def candidates(self, texts: list[str], min_bands: int = MIN_BANDS) -> set[int]:
+        """Return the ids of the ads that windows of ``texts`` resemble."""
+        window_keys = [band_keys(minhash(tokens)) for _, _, tokens in segment_windows(texts)]
+        found = self._lookup([key for keys in window_keys for key in keys])
+
+        chunks: set[int] = set()
+        for keys in window_keys:
+            hits = [chunk_id for key in keys for chunk_id in found.get(key, ())]
+            if hits:
+                ids, votes = np.unique(hits, return_counts=True)
+                chunks.update(ids[votes >= min_bands].tolist())
+        if not chunks:
+            return set()
+        chunk_ids = sorted(chunks)
+        with self._lock:
+            return {
+                ad_id
+                for i in range(0, len(chunk_ids), 900)
+                for (ad_id,) in self._conn.execute(
+                    f"SELECT DISTINCT ad_id FROM chunks WHERE id IN ({','.join('?' * len(chunk_ids[i:i + 900]))})",
+                    chunk_ids[i:i + 900],
+                )
+            }
+
+    def _shingles(self, ad_ids: set[int]) -> np.ndarray:
+        ids = sorted(ad_ids)
+        with self._lock:
+            blobs = [
+                blob
+                for i in range(0, len(ids), 900)
+                for (blob,) in self._conn.execute(
+                    f"SELECT shingles FROM ads WHERE id IN ({','.join('?' * len(ids[i:i + 900]))})",
+                    ids[i:i + 900],
+                )
+            ]
+        return np.unique(np.concatenate([np.frombuffer(blob, dtype=np.uint64) for blob in blobs]))
+
+    def known_segments(
+        self,
+        texts: list[str],
+        min_bands: int = MIN_BANDS,
+        min_containment: float = MIN_CONTAINMENT,
+    ) -> set[int]:
+        """Return the indices of the segments that are part of a known ad."""
+        ad_ids = self.candidates(texts, min_bands)
+        if not ad_ids:
+            return set()
+        known_shingles = self._shingles(ad_ids)
+
+        tokens = [words(text) for text in texts]
+        segment_of_word = np.repeat(np.arange(len(tokens)), [len(t) for t in tokens])
+        shingles = shingle_hashes([word for t in tokens for word in t])
+        contained = np.isin(shingles, known_shingles)
+        # Each shingle belongs to the segment of its first word. Shingles
+        # running into the next segment say little about this one, so they
+        # only count for segments too short to have any of their own.
+        first = segment_of_word[:len(shingles)]
+        inside = first == segment_of_word[len(segment_of_word) - len(shingles):]
+        total = np.bincount(first, weights=inside, minlength=len(texts))
+        hits = np.bincount(first, weights=contained & inside, minlength=len(texts))
+        short = total == 0
+        total[short] = np.bincount(first, minlength=len(texts))[short]
+        hits[short] = np.bincount(first, weights=contained, minlength=len(texts))[short]
+        known = (total > 0) & (hits >= min_containment * total)
+        return set(np.flatnonzero(known).tolist())
+
+
+_INDEXES: dict[str, ShingleIndex] = {}
+_INDEXES_LOCK = threading.Lock()
+
+
+def get_shingle_index() -> ShingleIndex | None:
+    """Return the index configured by ``AD_BEGONE_SHINGLE_DB``, if any."""
+    path = os.environ.get(SHINGLE_DB_ENV)
+    if not path:
+        return None
+    with _INDEXES_LOCK:
+        if path not in _INDEXES:
+            _INDEXES[path] = ShingleIndex(path)
+        return _INDEXES[path]
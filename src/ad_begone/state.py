@@ -0,0 +1,199 @@
+"""SQLite-backed record of which episodes have been processed.
+
+Replaces the ``.hit.<name>.txt`` marker files with one database keyed by
+path. Each row remembers the size and mtime the episode had when it was
+last seen, so a re-downloaded or replaced file becomes pending again.
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from .models import EpisodeResult
+
+logger = logging.getLogger(__name__)
+
+STATE_DB_NAME = ".ad-begone.sqlite3"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS episodes (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    started_at REAL,
+    finished_at REAL,
+    elapsed REAL,
+    ad_seconds REAL,
+    model TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS episodes_status ON episodes (status, attempts);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+def _stat(path: str) -> tuple[int, float] | None:
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_size, st.st_mtime
+
+
+class StateStore:
+
+    def __init__(self, path: str, max_attempts: int = 3):
+        self.path = path
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        # Anything still marked as processing was interrupted by a restart.
+        self._conn.execute("UPDATE episodes SET status = 'pending' WHERE status = 'processing'")
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def import_hit_markers(self, directory: str) -> int:
+        """Record episodes with existing ``.hit`` markers as done, once."""
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'hit_markers_imported'").fetchone()
+            if row is not None:
+                return 0
+
+            rows = []
+            for marker in Path(directory).rglob(".hit.*.txt"):
+                episode = marker.parent / marker.name[len(".hit."):-len(".txt")]
+                stat = _stat(str(episode))
+                if stat is not None:
+                    rows.append((str(episode), *stat))
+
+            with self._conn:
+                self._conn.execute("BEGIN")
+                self._conn.executemany(
+                    """
+                    INSERT INTO episodes (path, size, mtime, status) VALUES (?, ?, ?, 'done')
+                    ON CONFLICT (path) DO NOTHING
+                    """,
+                    rows,
+                )
+                self._conn.execute(
+                    "INSERT INTO meta (key, value) VALUES ('hit_markers_imported', ?)",
+                    (str(time.time()),),
+                )
+        logger.info("Imported %d processed podcast(s) from .hit markers", len(rows))
+        return len(rows)
+
+    def observe(self, paths: list[Path], overwrite: bool = False) -> None:
+        """Register files found on disk, marking new or changed ones as pending."""
+        with self._lock:
+            known = {
+                path: (size, mtime, status)
+                for path, size, mtime, status in self._conn.execute(
+                    "SELECT path, size, mtime, status FROM episodes"
+                )
+            }
+            rows = []
+            for path in map(str, paths):
+                stat = _stat(path)
+                if stat is None:
+                    continue
+                previous = known.get(path)
+                if previous is not None and previous[2] == "processing":
+                    continue
+                if overwrite or previous is None or previous[:2] != stat:
+                    rows.append((path, *stat))
+
+            if rows:
+                with self._conn:
+                    self._conn.execute("BEGIN")
+                    self._conn.executemany(
+                        """
+                        INSERT INTO episodes (path, size, mtime, status) VALUES (?, ?, ?, 'pending')
+                        ON CONFLICT (path) DO UPDATE SET
+                            size = excluded.size,
+                            mtime = excluded.mtime,
+                            status = 'pending',
+                            attempts = 0,
+                            error = NULL
+                        """,
+                        rows,
+                    )
+
+    def pending(self) -> list[str]:
+        """Return episodes that still need processing, including failed retries.
+
+        Episodes whose file has disappeared since it was seen are forgotten.
+        """
+        with self._lock:
+            paths = [
+                path
+                for (path,) in self._conn.execute(
+                    """
+                    SELECT path FROM episodes
+                    WHERE status = 'pending' OR (status = 'failed' AND attempts < ?)
+                    ORDER BY path
+                    """,
+                    (self.max_attempts,),
+                )
+            ]
+            missing = {path for path in paths if not os.path.exists(path)}
+            if missing:
+                self._conn.executemany("DELETE FROM episodes WHERE path = ?", [(p,) for p in missing])
+        return [path for path in paths if path not in missing]
+
+    def status(self, path: str) -> str | None:
+        with self._lock:
+            row = self._conn.execute("SELECT status FROM episodes WHERE path = ?", (path,)).fetchone()
+        return row[0] if row else None
+
+    def mark_started(self, path: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                """
+                UPDATE episodes SET status = 'processing', started_at = ?, attempts = attempts + 1
+                WHERE path = ?
+                """,
+                (time.time(), path),
+            )
+
+    def mark_queued(self, path: str) -> None:
+        """Record that an episode waits on batch annotation, so it is not picked up again."""
+        with self._lock:
+            self._conn.execute("UPDATE episodes SET status = 'queued' WHERE path = ?", (path,))
+
+    def mark_done(self, result: EpisodeResult) -> None:
+        # Trimming rewrites the file, so remember its new size and mtime.
+        stat = _stat(result.file_name) or (0, 0.0)
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT INTO episodes (path, size, mtime, status, finished_at, elapsed, ad_seconds, model)
+                VALUES (?, ?, ?, 'done', ?, ?, ?, ?)
+                ON CONFLICT (path) DO UPDATE SET
+                    size = excluded.size,
+                    mtime = excluded.mtime,
+                    status = 'done',
+                    finished_at = excluded.finished_at,
+                    elapsed = excluded.elapsed,
+                    ad_seconds = excluded.ad_seconds,
+                    model = excluded.model,
+                    error = NULL
+                """,
+                (result.file_name, *stat, time.time(), result.elapsed, result.ad_seconds, result.model),
+            )
+
+    def mark_failed(self, path: str, error: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE episodes SET status = 'failed', finished_at = ?, error = ? WHERE path = ?",
+                (time.time(), error, path),
+            )
@@ -0,0 +1,105 @@
+"""Constant-memory trimming by piping PCM between two ffmpeg processes."""
+import logging
+import os
+import tempfile
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+
+from .ffmpeg import PCM_SAMPLE_WIDTH, check_returncode, decode_pcm, encode_mp3, read_pcm
+from .models import Window
+from .mp3_frames import probe_stream
+
+logger = logging.getLogger(__name__)
+
+_CHUNK_SIZE = 1024 * 1024
+
+
+def trim_pcm_stream(
+    chunks: Iterable[bytes],
+    windows: list[Window],
+    notif: bytes,
+    frame_rate: int,
+    frame_width: int,
+) -> Iterator[memoryview | bytes]:
+    """Yield the kept parts of a PCM stream, with ``notif`` in place of each ad.
+
+    ``chunks`` may be split anywhere, including mid-frame. Audio outside of
+    every window is dropped, matching the in-memory trimming path.
+    """
+    remaining = iter(windows)
+    window = next(remaining, None)
+    pending = b""
+    pos = 0
+
+    for chunk in chunks:
+        if pending:
+            chunk = pending + chunk
+        usable = len(chunk) - len(chunk) % frame_width
+        pending = chunk[usable:]
+        view = memoryview(chunk)[:usable]
+        chunk_start = pos
+        chunk_end = pos + usable // frame_width
+
+        while window is not None:
+            if window.segment_type == "ad":
+                yield notif
+                window = next(remaining, None)
+                continue
+
+            first = int(window.start * frame_rate)
+            last = int(window.end * frame_rate)
+            lo = max(first, chunk_start)
+            hi = min(last, chunk_end)
+            if hi > lo:
+                yield view[(lo - chunk_start) * frame_width:(hi - chunk_start) * frame_width]
+            if last > chunk_end:
+                break
+            window = next(remaining, None)
+
+        pos = chunk_end
+
+    while window is not None:
+        if window.segment_type == "ad":
+            yield notif
+        window = next(remaining, None)
+
+
+def stream_trim(
+    file_name: str,
+    windows: list[Window],
+    out_name: str,
+    notif_name: str,
+) -> str:
+    """Trim ``file_name`` without ever holding the decoded episode in memory."""
+    sample_rate, channels = probe_stream(file_name)
+    frame_width = PCM_SAMPLE_WIDTH * channels
+    notif = read_pcm(notif_name, sample_rate, channels)
+
+    out_path = Path(out_name)
+    fd, tmp_name = tempfile.mkstemp(
+        prefix=f".{out_path.name}.", suffix=".mp3", dir=out_path.parent
+    )
+    os.close(fd)
+
+    decoder = decode_pcm(file_name, sample_rate, channels)
+    encoder = encode_mp3(tmp_name, sample_rate, channels)
+    try:
+        chunks = iter(lambda: decoder.stdout.read(_CHUNK_SIZE), b"")
+        for piece in trim_pcm_stream(chunks, windows, notif, sample_rate, frame_width):
+            encoder.stdin.write(piece)
+        encoder.stdin.close()
+
+        decoder.wait()
+        check_returncode(decoder, decoder.stderr.read(), file_name)
+        encoder.wait()
+        check_returncode(encoder, encoder.stderr.read(), out_name)
+        os.replace(tmp_name, out_name)
+    finally:
+        for proc in (decoder, encoder):
+            if proc.poll() is None:
+                proc.kill()
+                proc.wait()
+        if os.path.exists(tmp_name):
+            os.remove(tmp_name)
+
+    return out_name
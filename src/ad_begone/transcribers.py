@@ -0,0 +1,117 @@
+"""Transcription backends.
+
+A backend turns an audio file into a :class:`TranscriptionVerbose` with
+segment timestamps, which is all the rest of the pipeline relies on. The
+OpenAI backend, in :mod:`ad_begone.utils`, uploads each part to the
+transcription API. The local backend runs a Whisper model on the CPU with
+`faster-whisper <https://github.com/SYSTRAN/faster-whisper>`_, an optional
+dependency, so nothing is uploaded or billed per minute. Its model is loaded
+once per process and shared by every episode and thread.
+
+The backend is chosen with ``AD_BEGONE_TRANSCRIBER`` (``openai`` or
+``local``), and the local model with ``AD_BEGONE_WHISPER_MODEL``.
+"""
+import logging
+import os
+import threading
+from abc import ABC, abstractmethod
+
+import numpy as np
+from openai.types.audio.transcription_verbose import TranscriptionVerbose
+
+from .ffmpeg import read_pcm
+from .models import TranscriberName
+
+logger = logging.getLogger(__name__)
+
+TRANSCRIBER_ENV = "AD_BEGONE_TRANSCRIBER"
+WHISPER_MODEL_ENV = "AD_BEGONE_WHISPER_MODEL"
+
+DEFAULT_WHISPER_MODEL = "small"
+# Whisper models expect 16 kHz mono audio.
+WHISPER_SAMPLE_RATE = 16000
+
+
+def transcriber_name() -> TranscriberName:
+    """Return the backend selected by ``AD_BEGONE_TRANSCRIBER``, ``openai`` by default."""
+    name = os.environ.get(TRANSCRIBER_ENV) or "openai"
+    if name not in ("openai", "local"):
+        logger.error("Unknown transcriber %s in %s", name, TRANSCRIBER_ENV)
+        raise ValueError(f"Unknown transcriber: {name}")
+    return name
+
+
+class Transcriber(ABC):
+    """Interface of a transcription backend."""
+
+    # Identifies the model in artifact cache keys, so that transcriptions
+    # from different backends are never mixed up.
+    model: str
+
+    @abstractmethod
+    def transcribe(self, file_name: str) -> TranscriptionVerbose:
+        """Transcribe ``file_name`` with segment timestamps."""
+
+
+class LocalWhisperTranscriber(Transcriber):
+    """Transcribe on the CPU with faster-whisper."""
+
+    # Each loaded model, with the lock its transcriptions run under.
+    _models: dict[tuple[str, str, str], tuple[object, threading.Lock]] = {}
+    _models_lock = threading.Lock()
+
+    def __init__(
+        self,
+        model_size: str | None = None,
+        device: str = "cpu",
+        compute_type: str = "int8",
+    ):
+        self.model_size = model_size or os.environ.get(WHISPER_MODEL_ENV) or DEFAULT_WHISPER_MODEL
+        self.device = device
+        self.compute_type = compute_type
+        self.model = f"faster-whisper/{self.model_size}"
+
+    def _load(self) -> tuple[object, threading.Lock]:
+        key = (self.model_size, self.device, self.compute_type)
+        with self._models_lock:
+            if key not in self._models:
+                try:
+                    from faster_whisper import WhisperModel
+                except ImportError:
+                    logger.error("The local transcriber needs faster-whisper; install ad-begone[local]")
+                    raise RuntimeError("faster-whisper is not installed")
+                logger.info("Loading Whisper model %s on %s", self.model_size, self.device)
+                model = WhisperModel(self.model_size, device=self.device, compute_type=self.compute_type)
+                # One model serves every thread and instance; CPU inference
+                # does not gain from running several transcriptions at once.
+                self._models[key] = (model, threading.Lock())
+            return self._models[key]
+
+    def transcribe(self, file_name: str) -> TranscriptionVerbose:
+        model, lock = self._load()
+        pcm = read_pcm(file_name, WHISPER_SAMPLE_RATE, 1)
+        audio = np.frombuffer(pcm, dtype=np.int16).astype(np.float32) / 32768.0
+        with lock:
+            segments, info = model.transcribe(audio)
+            # Segments are decoded lazily, so consume them under the lock.
+            segments = list(segments)
+        return TranscriptionVerbose.model_validate({
+            "duration": info.duration,
+            "language": info.language,
+            "text": "".join(segment.text for segment in segments),
+            "segments": [
+                {
+                    "id": i,
+                    "seek": segment.seek,
+                    "start": segment.start,
+                    "end": segment.end,
+                    "text": segment.text,
+                    "tokens": list(segment.tokens),
+                    "temperature": segment.temperature or 0.0,
+                    "avg_logprob": segment.avg_logprob,
+                    "compression_ratio": segment.compression_ratio,
+                    "no_speech_prob": segment.no_speech_prob,
+                }
+                for i, segment in enumerate(segments)
+            ],
+        })
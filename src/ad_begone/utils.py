@@ -1,34 +1,145 @@
+import hashlib
 import logging
 import os
 import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from pathlib import Path
 from typing import List
 
 import numpy as np
-from openai import OpenAI, pydantic_function_tool
+from openai import pydantic_function_tool
 from openai.types.audio.transcription_verbose import TranscriptionVerbose
-from openai.types.chat.parsed_chat_completion import ParsedChatCompletion
-from openai.types.chat.parsed_function_tool_call import ParsedFunctionToolCall
+from openai.types.chat.parsed_chat_completion import (
+    ParsedChatCompletion,
+    ParsedChatCompletionMessage,
+    ParsedChoice,
+)
+from openai.types.chat.parsed_function_tool_call import ParsedFunction, ParsedFunctionToolCall
+from openai.types.completion_usage import CompletionUsage
 from pydub import AudioSegment
 
-from .models import SegmentAnnotation, Window
+from .artifacts import artifact_key, audio_digest, get_artifact_store
+from .chunking import labels_to_annotations, merge_chunk_labels, plan_chunks, segment_labels
+from .client import _get_client
+from .metrics import STAGE_SECONDS, record_usage
+from .models import PromptEncoding, SegmentAnnotation, TranscriberName, TrimEngine, Window
+from .mp3_frames import concat_frames, read_frame_index, read_id3v2_tag, splice_windows
 from .notif_path import NOTIF_PATH
+from .ffmpeg import compact_mp3
+from .pcm import PcmBuffer
+from .prefilter import candidate_regions, mask_to_regions
+from .prompt import SYSTEM_PROMPT, EncodedTranscript, encode_transcript, estimate_tokens
+from .rate_limit import get_rate_limiter
+from .streaming import stream_trim
+from .transcribers import LocalWhisperTranscriber, Transcriber, transcriber_name
 
 logger = logging.getLogger(__name__)
 
-_CLIENT = None
+# Format of the temporary copy uploaded for transcription.
+UPLOAD_SAMPLE_RATE = 16000
+UPLOAD_BITRATE_KBPS = 32
+# Largest file the transcription API accepts.
+UPLOAD_MAX_MB = 25.0
+
+TRANSCRIPTION_MODEL = "whisper-1"
+# Part of the artifact cache key for annotations; bump it whenever the
+# annotation prompt changes so that older annotations are not reused.
+ANNOTATION_PROMPT_VERSION = "2"
+
+# Long transcripts are annotated in overlapping chunks of about this many
+# tokens, up to ANNOTATION_WORKERS at a time.
+ANNOTATION_CHUNK_TOKENS = 4000
+ANNOTATION_OVERLAP_TOKENS = 400
+ANNOTATION_WORKERS = 4
+
+# Prompt format for annotation: "segment", "compact" or "blocks".
+ANNOTATION_ENCODING: PromptEncoding = os.environ.get("AD_BEGONE_PROMPT_ENCODING", "segment")
+
+# Only send the lines the local pre-filter flags as ad candidates.
+ANNOTATION_PREFILTER = os.environ.get("AD_BEGONE_PREFILTER", "") not in ("", "0", "false")
+
+
+def _upload_file(file_name: str) -> tuple[str, bytes] | None:
+    """Build the low-bitrate mono copy of ``file_name`` that is sent to Whisper.
+
+    Whisper resamples to 16 kHz mono internally, so this loses nothing for
+    transcription while cutting upload size by roughly 8x. Timestamps are
+    unaffected because the duration does not change.
+
+    If the copy cannot be built, ``None`` is returned and the original is
+    uploaded instead, unless it is too large for the API. Parts are sized
+    for the compact copy, so that is usually the case.
+    """
+    try:
+        data = compact_mp3(file_name, UPLOAD_SAMPLE_RATE, UPLOAD_BITRATE_KBPS)
+    except (OSError, RuntimeError) as error:
+        size_mb = os.path.getsize(file_name) / 1024 / 1024
+        if size_mb > UPLOAD_MAX_MB:
+            logger.error(
+                "Could not build compact upload copy of %s, which at %.1f MB is too large to upload as is",
+                file_name,
+                size_mb,
+            )
+            raise RuntimeError(f"Could not build upload copy of {file_name}") from error
+        logger.warning("Could not build compact upload copy, uploading %s as is", file_name)
+        return None
+    logger.debug(
+        "Compact upload copy of %s is %.1f MB (was %.1f MB)",
+        file_name,
+        len(data) / 1024 / 1024,
+        os.path.getsize(file_name) / 1024 / 1024,
+    )
+    return Path(file_name).name, data
+
+
+class OpenAITranscriber(Transcriber):
+    """Transcribe with the OpenAI transcription API."""
+
+    model = TRANSCRIPTION_MODEL
+
+    def __init__(self, compact: bool = True):
+        self.compact = compact
+
+    def transcribe(self, file_name: str) -> TranscriptionVerbose:
+        upload = _upload_file(file_name) if self.compact else None
+        with open(file_name, "rb") as audio_file:
+            def _transcribe() -> TranscriptionVerbose:
+                audio_file.seek(0)
+                return _get_client("transcription").audio.transcriptions.create(
+                    file=upload or audio_file,
+                    model=TRANSCRIPTION_MODEL,
+                    response_format="verbose_json",
+                    timestamp_granularities=["segment"]
+                )
 
+            return get_rate_limiter("transcription").call(_transcribe)
 
-def _get_client() -> OpenAI:
-    global _CLIENT
-    if _CLIENT is None:
-        _CLIENT = OpenAI()
-    return _CLIENT
+
+_TRANSCRIBERS: dict[TranscriberName, Transcriber] = {}
+_TRANSCRIBERS_LOCK = threading.Lock()
+
+
+def get_transcriber(name: TranscriberName | None = None) -> Transcriber:
+    """Return the backend ``name``, or the one selected by ``AD_BEGONE_TRANSCRIBER``.
+
+    Backends are created once per process, so that a local model is only
+    loaded once.
+    """
+    name = name or transcriber_name()
+    with _TRANSCRIBERS_LOCK:
+        if name not in _TRANSCRIBERS:
+            _TRANSCRIBERS[name] = OpenAITranscriber() if name == "openai" else LocalWhisperTranscriber()
+        return _TRANSCRIBERS[name]
 
 
 def cached_transcription(
     file_name: str,
     file_transcription: str | None = None,
+    compact: bool = True,
+    transcriber: Transcriber | None = None,
 ) -> TranscriptionVerbose:
     if ".mp3" not in file_name:
         logger.error("Invalid file type for transcription: %s", file_name)
@@ -41,34 +152,47 @@ def cached_transcription(
         with open(file_transcription, "r", encoding="utf-8") as f:
             return TranscriptionVerbose.parse_raw(f.read())
 
-    with open(file_name, "rb") as audio_file:
-        logger.info("Transcribing audio for %s", file_name)
-        transcription: TranscriptionVerbose = _get_client().audio.transcriptions.create(
-            file=audio_file,
-            model="whisper-1",
-            response_format="verbose_json",
-            timestamp_granularities=["segment"]
-        )
-
+    if transcriber is None:
+        transcriber = get_transcriber()
+        if not compact and isinstance(transcriber, OpenAITranscriber):
+            transcriber = OpenAITranscriber(compact=False)
+
+    store = get_artifact_store()
+    if store is not None:
+        key = artifact_key("transcription", transcriber.model, audio_digest(file_name))
+        cached = store.get("transcription", key)
+        if cached is not None:
+            logger.info("Reusing cached transcription for %s", file_name)
+            with open(file_transcription, "w", encoding="utf-8") as f:
+                f.write(cached)
+            return TranscriptionVerbose.parse_raw(cached)
+
+    logger.info("Transcribing audio for %s with %s", file_name, transcriber.model)
+    with STAGE_SECONDS.time(stage="transcribe"):
+        transcription = transcriber.transcribe(file_name)
+
+    text = transcription.model_dump_json()
     with open(file_transcription, "w", encoding="utf-8") as f:
-        f.write(transcription.model_dump_json())
+        f.write(text)
+    if store is not None:
+        store.put("transcription", key, text)
 
     logger.info("Got transcription for %s", file_name)
     return transcription
 
 
 def transcription_with_segment_indices(transcription: TranscriptionVerbose) -> str:
-    res = ""
-    for idx, segment in enumerate(transcription.segments):
-        _segment = segment.text.rstrip(" ")
-        _segment = segment.text.lstrip(" ")
-        res += f"Segment {idx}: {_segment}\n"
-    return res
+    return encode_transcript(transcription, "segment").text
 
 
 _RESOLVED_MODEL = None
 
 
+def resolved_model(model: str | None = None) -> str | None:
+    """Return the chat model annotations use, without querying the API."""
+    return model or os.environ.get("OPENAI_MODEL") or _RESOLVED_MODEL
+
+
 def _get_model() -> str:
     global _RESOLVED_MODEL
     if _RESOLVED_MODEL is not None:
@@ -79,7 +203,7 @@ def _get_model() -> str:
         _RESOLVED_MODEL = env_model
         return _RESOLVED_MODEL
 
-    models = _get_client().models.list()
+    models = get_rate_limiter("chat").call(_get_client().models.list)
     # Filter for chat-capable GPT models, excluding instruct/realtime/audio
     # variants that only support the /v1/completions endpoint.
     non_chat_keywords = ("instruct", "realtime", "audio")
@@ -101,13 +225,231 @@ def _get_model() -> str:
     return _RESOLVED_MODEL
 
 
+def annotation_request(
+    encoded: EncodedTranscript,
+    model: str,
+    start: int = 0,
+    end: int | None = None,
+) -> dict:
+    """Build the chat completion request for lines ``start`` to ``end``."""
+    return dict(
+        model=model,
+        messages=[
+            { "role": "system", "content": SYSTEM_PROMPT, },
+            { "role": "user", "content": encoded.user_prompt(start, end), },
+        ],
+        tools=[ pydantic_function_tool(SegmentAnnotation), ],
+    )
+
+
+def _annotate(
+    encoded: EncodedTranscript,
+    model: str,
+    file_name: str,
+    start: int = 0,
+    end: int | None = None,
+) -> ParsedChatCompletion:
+    """Annotate lines ``start`` to ``end`` of an encoded transcript."""
+    request = annotation_request(encoded, model, start, end)
+
+    logger.info("Annotating transcription for %s", file_name)
+    completion: ParsedChatCompletion = get_rate_limiter("chat").call(
+        lambda: _get_client("chat").beta.chat.completions.parse(**request),
+        tokens=estimate_tokens("".join(m["content"] for m in request["messages"])),
+    )
+    record_usage(completion.usage)
+    logger.info("Got annotations for %s", file_name)
+    return completion
+
+
+def _merged_completion(
+    completions: list[ParsedChatCompletion],
+    annotations: list[SegmentAnnotation],
+    model: str = "",
+) -> ParsedChatCompletion:
+    """Build one completion carrying ``annotations``, in the shape the cache expects."""
+    if completions:
+        completion = completions[0].model_copy(deep=True)
+    else:
+        # Nothing was sent, e.g. the pre-filter found no ad candidates.
+        completion = ParsedChatCompletion(
+            id="local",
+            object="chat.completion",
+            created=int(time.time()),
+            model=model,
+            choices=[ParsedChoice(
+                index=0,
+                finish_reason="stop",
+                message=ParsedChatCompletionMessage(role="assistant", content=None),
+            )],
+        )
+    completion.choices[0].message.tool_calls = [
+        ParsedFunctionToolCall(
+            id=f"call_merged_{i}",
+            type="function",
+            function=ParsedFunction(
+                name="SegmentAnnotation",
+                arguments=ann.model_dump_json(),
+                parsed_arguments=ann,
+            ),
+        )
+        for i, ann in enumerate(annotations)
+    ]
+    usages = [c.usage for c in completions if c.usage is not None]
+    if usages:
+        completion.usage = CompletionUsage(
+            prompt_tokens=sum(u.prompt_tokens for u in usages),
+            completion_tokens=sum(u.completion_tokens for u in usages),
+            total_tokens=sum(u.total_tokens for u in usages),
+        )
+    return completion
+
+
+@dataclass
+class AnnotationPlan:
+    """The requests that annotate one transcript, and how to merge their results."""
+
+    encoded: EncodedTranscript
+    model: str
+    # Artifact store key of the merged completion.
+    key: str
+    # Line ranges sent to the model, one request each.
+    chunks: list[tuple[int, int]]
+    # Labels of the lines that are not sent.
+    gap_labels: list[str]
+    # A single request for the whole transcript, whose completion is used as is.
+    direct: bool
+
+
+def _annotation_regions(
+    encoded: EncodedTranscript,
+    prefilter: bool,
+    known_ad_segments: set[int] | None,
+) -> tuple[list[tuple[int, int]] | None, list[str] | None]:
+    """Pick the line ranges to send to the model and the labels of the rest."""
+    if not prefilter and not known_ad_segments:
+        return None, None
+
+    send = np.ones(len(encoded.lines), dtype=bool)
+    if prefilter:
+        send[:] = False
+        for start, end in candidate_regions(encoded.lines):
+            send[start:end] = True
+    known = np.array(encoded.covered_lines(known_ad_segments or set()), dtype=bool)
+    if known.size:
+        send &= ~known
+    gap_labels = ["ad" if k else "content" for k in known.tolist()]
+    return mask_to_regions(send), gap_labels
+
+
+def plan_annotation(
+    transcription: TranscriptionVerbose,
+    model: str,
+    chunk_tokens: int = ANNOTATION_CHUNK_TOKENS,
+    overlap_tokens: int = ANNOTATION_OVERLAP_TOKENS,
+    encoding: PromptEncoding = ANNOTATION_ENCODING,
+    prefilter: bool = ANNOTATION_PREFILTER,
+    known_ad_segments: set[int] | None = None,
+) -> AnnotationPlan:
+    """Work out which requests annotate ``transcription``.
+
+    Transcripts longer than ``chunk_tokens`` are split into overlapping
+    chunks. With ``prefilter``, only the regions that
+    :mod:`ad_begone.prefilter` flags as ad candidates are sent, and segments
+    in ``known_ad_segments`` are labelled as ads without being sent.
+    """
+    encoded = encode_transcript(transcription, encoding)
+    key = artifact_key(
+        "annotation", model, ANNOTATION_PROMPT_VERSION,
+        str(chunk_tokens), str(overlap_tokens), encoding,
+        "prefilter" if prefilter else "full",
+        ",".join(map(str, sorted(known_ad_segments or ()))), encoded.text,
+    )
+
+    whole = [(0, len(encoded.lines))]
+    regions, gap_labels = _annotation_regions(encoded, prefilter, known_ad_segments)
+    chunks = [
+        (start + chunk_start, start + chunk_end)
+        for start, end in (whole if regions is None else regions)
+        for chunk_start, chunk_end in plan_chunks(
+            encoded.lines[start:end], chunk_tokens, overlap_tokens, estimate_tokens,
+        )
+    ]
+    direct = regions is None and len(chunks) <= 1 and encoded.encoding != "blocks"
+    return AnnotationPlan(
+        encoded=encoded,
+        model=model,
+        key=key,
+        chunks=whole if direct else chunks,
+        gap_labels=gap_labels or ["content"] * len(encoded.lines),
+        direct=direct,
+    )
+
+
+def merge_annotations(plan: AnnotationPlan, completions: list[ParsedChatCompletion]) -> ParsedChatCompletion:
+    """Combine the completions of a plan's requests into one, in segment indices."""
+    if plan.direct:
+        return completions[0]
+
+    # Lines between the chunks keep their gap labels.
+    spans: list[tuple[int, int]] = []
+    labels = []
+    position = 0
+    for completion, (start, end) in zip(completions, plan.chunks):
+        if start > position:
+            spans.append((position, start))
+            labels.append(plan.gap_labels[position:start])
+        spans.append((start, end))
+        labels.append(segment_labels(get_ordered_annotations(completion), start, end))
+        position = max(position, end)
+    n_lines = len(plan.encoded.lines)
+    if position < n_lines:
+        spans.append((position, n_lines))
+        labels.append(plan.gap_labels[position:])
+
+    annotations = labels_to_annotations(merge_chunk_labels(spans, labels))
+    return _merged_completion(completions, plan.encoded.to_segment_annotations(annotations), plan.model)
+
+
+def _annotate_chunked(plan: AnnotationPlan, file_name: str, workers: int) -> ParsedChatCompletion:
+    """Send a plan's requests, up to ``workers`` at a time, and merge the results."""
+    chunks = plan.chunks
+    if not plan.direct:
+        logger.info(
+            "Annotating %d of %d lines of %s in %d request(s)",
+            sum(end - start for start, end in chunks), len(plan.encoded.lines), file_name, len(chunks),
+        )
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(chunks)))) as pool:
+        completions = list(pool.map(
+            lambda chunk: _annotate(
+                plan.encoded,
+                plan.model,
+                f"{file_name} (lines {chunk[0]}-{chunk[1] - 1})" if len(chunks) > 1 else file_name,
+                start=chunk[0],
+                end=chunk[1],
+            ),
+            chunks,
+        ))
+    return merge_annotations(plan, completions)
+
+
 def cached_annotate_transcription(
     transcription: TranscriptionVerbose,
     file_name: str,
     model: str = os.environ.get("OPENAI_MODEL", "gpt-4o-2024-08-06"),
+    chunk_tokens: int = ANNOTATION_CHUNK_TOKENS,
+    overlap_tokens: int = ANNOTATION_OVERLAP_TOKENS,
+    workers: int = ANNOTATION_WORKERS,
+    encoding: PromptEncoding = ANNOTATION_ENCODING,
+    prefilter: bool = ANNOTATION_PREFILTER,
+    known_ad_segments: set[int] | None = None,
 ) -> ParsedChatCompletion:
-    transcription_inds = transcription_with_segment_indices(transcription)
+    """Annotate a transcription, reusing the cached completion if there is one.
 
+    The requests are planned by :func:`plan_annotation`, and up to
+    ``workers`` of them are sent concurrently. ``encoding`` selects the
+    prompt format; see :mod:`ad_begone.prompt`.
+    """
     if os.path.isfile(file_name):
         with open(file_name, "r", encoding="utf-8") as f:
             _text = f.read()
@@ -115,25 +457,29 @@ def cached_annotate_transcription(
     else:
         if model is None:
             model = _get_model()
-        system_prompt = """You are a helpful assistant.
-        You help users identify segments in a transcription that are ads or content.
-        You will be given a transcription and asked to annotate the segments as either ads or content.
-        You ONLY need to provide annotations for the segments at the beginning of each ad or content block.
-        """
-        user_prompt = f"Please annotate following transcription with the segments that are ads or content:\n{transcription_inds}"
-
-        logger.info("Annotating transcription for %s", file_name)
-        completion: ParsedChatCompletion = _get_client().beta.chat.completions.parse(
-            model=model,
-            messages=[
-                { "role": "system", "content": system_prompt, },
-                { "role": "user", "content": user_prompt, },
-            ],
-            tools=[ pydantic_function_tool(SegmentAnnotation), ],
+
+        plan = plan_annotation(
+            transcription,
+            model,
+            chunk_tokens=chunk_tokens,
+            overlap_tokens=overlap_tokens,
+            encoding=encoding,
+            prefilter=prefilter,
+            known_ad_segments=known_ad_segments,
         )
+        store = get_artifact_store()
+        cached = store.get("annotation", plan.key) if store is not None else None
+        if cached is not None:
+            logger.info("Reusing cached annotations for %s", file_name)
+            completion = ParsedChatCompletion.parse_raw(cached)
+        else:
+            with STAGE_SECONDS.time(stage="annotate"):
+                completion = _annotate_chunked(plan, file_name, workers)
+            if store is not None:
+                store.put("annotation", plan.key, completion.model_dump_json())
+
         with open(file_name, "w", encoding="utf-8") as f:
             f.write(completion.model_dump_json())
-        logger.info("Got annotations for %s", file_name)
 
     return completion
 
@@ -187,15 +533,28 @@ def _get_ad_text_excerpt(transcription: TranscriptionVerbose, window: Window) ->
 
 def _remove_ads(
     file_name: str,
-    file_name_transcription_cache: str,
+    file_name_transcription_cache: str | None = None,
+    file_name_segments_cache: str | None = None,
     out_name: str | None = None,
     notif_name: str = NOTIF_PATH,
     model: str | None = None,
-) -> str:
-    transcription = cached_transcription(file_name)
-    completion = cached_annotate_transcription(transcription, file_name=file_name_transcription_cache, model=model)
-    annotations = get_ordered_annotations(completion)
-    windows = find_ad_time_windows(transcription, annotations)
+    engine: TrimEngine = "pydub",
+    transcription: TranscriptionVerbose | None = None,
+    windows: list[Window] | None = None,
+) -> list[Window]:
+    """Trim the ads out of one part and return the windows that were applied.
+
+    Callers that already hold the part's transcription and windows can pass
+    them in to skip reading the caches again.
+    """
+    if transcription is None:
+        transcription = cached_transcription(file_name, file_transcription=file_name_transcription_cache)
+    if windows is None:
+        if file_name_segments_cache is None:
+            file_name_segments_cache = file_name + ".segments.json"
+        completion = cached_annotate_transcription(transcription, file_name=file_name_segments_cache, model=model)
+        annotations = get_ordered_annotations(completion)
+        windows = find_ad_time_windows(transcription, annotations)
 
     total_ad_seconds = 0.0
     for window in windows:
@@ -207,34 +566,72 @@ def _remove_ads(
     minutes, seconds = divmod(total_ad_seconds, 60)
     logger.info("Total ad time removed from %s: %dm %ds", file_name, int(minutes), int(seconds))
 
-    audio = AudioSegment.from_mp3(file_name)
+    if out_name is None:
+        if "part_" not in file_name:
+            logger.error("Refusing to overwrite non-part file without explicit out_name: %s", file_name)
+            raise ValueError("Destructive")
+        out_name = file_name
+
+    if engine == "frames":
+        splice_windows(file_name, windows, out_name=out_name, notif_name=notif_name)
+        return windows
+    if engine == "stream":
+        # Decoding and encoding overlap here, so both count as encoding.
+        with STAGE_SECONDS.time(stage="encode"):
+            stream_trim(file_name, windows, out_name=out_name, notif_name=notif_name)
+        return windows
+
+    with STAGE_SECONDS.time(stage="decode"):
+        audio = PcmBuffer.from_segment(AudioSegment.from_mp3(file_name))
     notif = AudioSegment.from_mp3(notif_name)
+    notif = PcmBuffer.from_segment(
+        notif.set_frame_rate(audio.frame_rate)
+        .set_channels(audio.channels)
+        .set_sample_width(audio.sample_width)
+    )
     kept_windows = []
     for window in windows:
         if window.segment_type == "content":
-            kept_windows.append(audio[int(window.start * 1000): int(window.end * 1000)])
+            kept_windows.append(audio.window(window.start, window.end))
         if window.segment_type == "ad":
             kept_windows.append(notif)
 
-    audio_no_ads = AudioSegment.silent(duration=0)
-    for kept_window in kept_windows:
-        audio_no_ads += kept_window
+    audio_no_ads = PcmBuffer.concatenate(kept_windows or [audio.window(0.0, 0.0)]).to_segment()
+    # Release the decoded input before the encoder runs.
+    del audio, kept_windows
 
-    if out_name is None:
-        if "part_" not in file_name:
-            logger.error("Refusing to overwrite non-part file without explicit out_name: %s", file_name)
-            raise ValueError("Destructive")
-        out_name = file_name
+    with STAGE_SECONDS.time(stage="encode"):
+        audio_no_ads.export(out_name, format="mp3")
+    return windows
 
-    audio_no_ads.export(out_name, format="mp3")
-    return out_name
 
+# Parts written with a run id, as opposed to an episode that merely starts with "part_".
+PART_NAME_RE = re.compile(r"part_\d+_[0-9a-f]{8}_")
 
-def split_file(
+
+def episode_run_id(file_name: str) -> str:
+    """Derive the run id that names the parts of an episode.
+
+    The id depends on the episode's path, size and modification time, so a
+    retry of an unchanged episode reuses the parts and cache sidecars of the
+    earlier attempt, while a replaced or already trimmed episode gets new ones.
+    """
+    st = os.stat(file_name)
+    key = f"{os.path.abspath(file_name)}\0{st.st_size}\0{st.st_mtime_ns}"
+    return hashlib.sha256(key.encode()).hexdigest()[:8]
+
+
+def _part_path(file_path: Path, i: int, run_id: str | None) -> Path:
+    if run_id is None:
+        return file_path.parent / f"part_{i}_{file_path.name}"
+    return file_path.parent / f"part_{i}_{run_id}_{file_path.name}"
+
+
+def _split_file_decoded(
     file_name: str,
-    max_file_size_mb: float = 25.0,
+    max_file_size_mb: float,
+    run_id: str | None = None,
 ) -> list[str]:
-    max_file_size_mb = 25.0
     file_path = Path(file_name)
     audio = AudioSegment.from_mp3(file_name)
     file_size = os.path.getsize(file_name) / 1024 / 1024
@@ -246,35 +643,97 @@ def split_file(
 
     split_file_names = []
     for i in range(total_splits):
-        _fn = file_path.parent / f"part_{i}_{file_path.name}"
+        _fn = _part_path(file_path, i, run_id)
         split_file_names.append(str(_fn))
         _split_i(i).export(_fn, format="mp3")
     return split_file_names
 
 
+@STAGE_SECONDS.time(stage="split")
+def split_file(
+    file_name: str,
+    max_file_size_mb: float = UPLOAD_MAX_MB,
+    upload_bitrate_kbps: int | None = None,
+    run_id: str | None = None,
+) -> list[str]:
+    """Split an MP3 into parts no larger than ``max_file_size_mb``.
+
+    When ``upload_bitrate_kbps`` is given, parts are sized so that a copy
+    transcoded to that bitrate fits the limit, rather than the original.
+    Parts are named ``part_<i>_<run_id>_<name>`` when ``run_id`` is given,
+    see :func:`episode_run_id`.
+
+    Parts are cut at frame boundaries and written by copying frames, so the
+    episode is never decoded. Files that cannot be parsed as MPEG Layer III
+    fall back to decoding and re-encoding with pydub.
+    """
+    try:
+        index = read_frame_index(file_name)
+    except ValueError:
+        logger.warning("Falling back to decoding %s for splitting", file_name)
+        return _split_file_decoded(file_name, max_file_size_mb, run_id=run_id)
+
+    file_path = Path(file_name)
+    total_bytes = index.audio_bytes()
+    upload_bytes = total_bytes
+    if upload_bitrate_kbps is not None:
+        upload_bytes = min(total_bytes, index.duration() * upload_bitrate_kbps * 1000 / 8)
+    total_splits = max(1, int(np.ceil(upload_bytes / 1024 / 1024 / max_file_size_mb)))
+    frame_ends = np.cumsum(index.sizes)
+    targets = np.arange(1, total_splits) * total_bytes / total_splits
+    bounds = [0, *np.searchsorted(frame_ends, targets, side="right").tolist(), len(index)]
+
+    split_file_names = []
+    for i in range(total_splits):
+        _fn = _part_path(file_path, i, run_id)
+        split_file_names.append(str(_fn))
+        concat_frames([(file_name, index, bounds[i], bounds[i + 1])], str(_fn))
+    return split_file_names
+
+
+def _join_files_decoded(file_parts: list[str], joined_out_name: str) -> None:
+    audio = AudioSegment.silent(duration=0)
+    for file_part in file_parts:
+        audio += AudioSegment.from_mp3(file_part)
+    audio.export(joined_out_name, format="mp3")
+
+
+@STAGE_SECONDS.time(stage="join")
 def join_files(
     file_name: str,
     overwrite: bool = True,
+    file_parts: list[str] | None = None,
 ) -> str:
     path = Path(file_name)
-    file_parts = []
-    for fn in path.parent.glob("part_*_" + path.name):
-        file_parts.append(str(fn))
+    if file_parts is None:
+        file_parts = []
+        for fn in path.parent.glob("part_*_" + path.name):
+            file_parts.append(str(fn))
 
-    def _part_index(filepath: str) -> int:
-        match = re.search(r"part_(\d+)_", Path(filepath).name)
-        return int(match.group(1)) if match else 0
+        def _part_index(filepath: str) -> int:
+            match = re.search(r"part_(\d+)_", Path(filepath).name)
+            return int(match.group(1)) if match else 0
 
-    file_parts.sort(key=_part_index)
-    audio = AudioSegment.silent(duration=0)
-    for file_part in file_parts:
-        audio += AudioSegment.from_mp3(file_part)
+        file_parts.sort(key=_part_index)
     if overwrite:
         joined_out = path
     else:
         joined_out = path.parent / ("joined_" + path.name)
     joined_out_name = str(joined_out)
-    audio.export(joined_out_name, format="mp3")
+
+    try:
+        sources = []
+        for file_part in file_parts:
+            index = read_frame_index(file_part)
+            sources.append((file_part, index, 0, len(index)))
+    except ValueError:
+        logger.warning("Falling back to decoding parts of %s for joining", file_name)
+        _join_files_decoded(file_parts, joined_out_name)
+    else:
+        # Keep the original episode's ID3 tag so players still see its metadata.
+        tag = read_id3v2_tag(file_name) if path.is_file() else b""
+        concat_frames(sources, joined_out_name, tag=tag)
+
     for file_part in file_parts:
         os.remove(file_part)
     return joined_out_name
@@ -1,14 +1,31 @@
 import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
-from time import sleep
+from time import monotonic, sleep
 
-from typing import Optional
+from typing import Literal, Optional
 
 import pydantic.v1 as pydantic
 import pydantic_argparse
 
+from . import metrics
+from .artifacts import CACHE_DIR_ENV, CACHE_MAX_MB_ENV
+from .batch import BATCH_DIR_NAME, BATCH_POLL_INTERVAL, Backlog
+from .cleanup import GarbageCollector
+from .client import BASE_URL_ENV, POOL_SIZE_ENV
+from .fingerprint import FINGERPRINT_DB_ENV
+from .inotify import InotifyWatcher
 from .logging import setup_logging
+from .models import EpisodeResult, TranscriberName, TrimEngine
+from .pipeline import StageLimits, run_pipeline
 from .remove_ads import remove_ads
+from .scanner import LibraryScanner
+from .shingles import SHINGLE_DB_ENV
+from .state import STATE_DB_NAME, StateStore
+from .transcribers import TRANSCRIBER_ENV
+from .utils import ANNOTATION_WORKERS, PART_NAME_RE
 
 logger = logging.getLogger(__name__)
 
@@ -23,33 +40,338 @@ class WatchArgs(pydantic.BaseModel):
         gt=0,
         description="Sleep time in seconds between processing runs.",
     )
+    watch: Literal["poll", "inotify"] = pydantic.Field(
+        default="poll",
+        description="'poll' rescans every --sleep seconds, 'inotify' reacts to new files (Linux).",
+    )
+    debounce: float = pydantic.Field(
+        default=5.0,
+        ge=0,
+        description="Seconds a new file must be quiet before it is processed in inotify mode.",
+    )
+    rescan: int = pydantic.Field(
+        default=6 * 60 * 60,
+        gt=0,
+        description="Seconds between fallback full scans in inotify mode.",
+    )
     model: Optional[str] = pydantic.Field(
         default=None,
         description="OpenAI model to use for ad classification.",
     )
+    base_url: Optional[str] = pydantic.Field(
+        default=None,
+        description=f"URL of an OpenAI-compatible API to use instead of OpenAI's (or ${BASE_URL_ENV}).",
+    )
+    transcriber: Optional[TranscriberName] = pydantic.Field(
+        default=None,
+        description=f"Transcription backend: 'openai' uploads to the API, 'local' runs Whisper on the CPU (or ${TRANSCRIBER_ENV}).",
+    )
+    engine: TrimEngine = pydantic.Field(
+        default="pydub",
+        description=(
+            "Trimming engine: 'pydub' re-encodes in memory, 'frames' splices MP3 "
+            "frames without decoding, 'stream' re-encodes with constant memory."
+        ),
+    )
+    part_workers: int = pydantic.Field(
+        default=1,
+        gt=0,
+        description="Number of parts of one episode to process concurrently.",
+    )
+    workers: int = pydantic.Field(
+        default=1,
+        gt=0,
+        description="Number of episodes to process concurrently in separate processes.",
+    )
+    pipeline: bool = pydantic.Field(
+        default=False,
+        description="Overlap the split, transcribe, annotate and trim stages across episodes.",
+    )
+    transcribe_workers: int = pydantic.Field(
+        default=StageLimits.transcribe,
+        gt=0,
+        description="Concurrent transcriptions in pipeline mode.",
+    )
+    annotate_workers: int = pydantic.Field(
+        default=StageLimits.annotate,
+        gt=0,
+        description="Concurrent annotation requests in pipeline mode.",
+    )
+    trim_workers: int = pydantic.Field(
+        default=StageLimits.trim,
+        gt=0,
+        description="Concurrent trim/encode jobs in pipeline mode.",
+    )
+    scan_workers: int = pydantic.Field(
+        default=8,
+        gt=0,
+        description="Threads used to check directories for changes during a scan.",
+    )
+    cache_dir: Optional[str] = pydantic.Field(
+        default=None,
+        description=f"Directory for transcriptions and annotations shared by identical audio (or ${CACHE_DIR_ENV}).",
+    )
+    cache_max_mb: Optional[float] = pydantic.Field(
+        default=None,
+        gt=0,
+        description=f"Size budget of the cache directory; least recently used entries are evicted (or ${CACHE_MAX_MB_ENV}).",
+    )
+    gc_interval: int = pydantic.Field(
+        default=24 * 60 * 60,
+        ge=0,
+        description="Seconds between removals of orphaned parts and sidecars (0 disables).",
+    )
+    fingerprint_db: Optional[str] = pydantic.Field(
+        default=None,
+        description=f"SQLite index of removed ads, to recognise them by their audio in later episodes (or ${FINGERPRINT_DB_ENV}).",
+    )
+    shingle_db: Optional[str] = pydantic.Field(
+        default=None,
+        description=f"SQLite index of removed ad transcripts, to recognise repeated ad reads (or ${SHINGLE_DB_ENV}).",
+    )
+    batch: bool = pydantic.Field(
+        default=False,
+        description="Annotate through the OpenAI Batch API, at lower cost but with results within a day.",
+    )
+    batch_dir: Optional[str] = pydantic.Field(
+        default=None,
+        description=f"Directory for queued batch jobs (default: DIRECTORY/{BATCH_DIR_NAME}).",
+    )
+    state_db: Optional[str] = pydantic.Field(
+        default=None,
+        description=f"SQLite database recording processed episodes (default: DIRECTORY/{STATE_DB_NAME}).",
+    )
+    metrics_port: Optional[int] = pydantic.Field(
+        default=None,
+        ge=0,
+        lt=65536,
+        description="Serve Prometheus metrics on this port at /metrics.",
+    )
 
 
-def walk_directory(
-    directory: str,
+def _is_work_file(path: Path) -> bool:
+    """Check whether a file is a temporary part or output of another run."""
+    return path.name.startswith(".") or PART_NAME_RE.match(path.name) is not None
+
+
+def _needs_processing(path: Path, overwrite: bool = False) -> bool:
+    if _is_work_file(path) or not path.is_file():
+        return False
+    path_file_hit = path.parent / f".hit.{path.name}.txt"
+    return overwrite or not path_file_hit.exists()
+
+
+def _select_pending(
+    paths: list[Path],
+    overwrite: bool = False,
+    state: StateStore | None = None,
+) -> list[Path]:
+    """Pick the episodes among ``paths`` that still need processing."""
+    if state is None:
+        return [p for p in paths if _needs_processing(p, overwrite)]
+    state.observe([p for p in paths if not _is_work_file(p)], overwrite=overwrite)
+    return [Path(p) for p in state.pending()]
+
+
+def _remove_ads_in_worker(**kwargs) -> tuple[EpisodeResult | None, dict]:
+    """Run :func:`remove_ads` in a worker process and hand back the metrics it recorded."""
+    return remove_ads(**kwargs), metrics.drain()
+
+
+def process_files(
+    queue: list[Path],
     overwrite: bool = False,
     model: str | None = None,
+    engine: TrimEngine = "pydub",
+    part_workers: int = 1,
+    workers: int = 1,
+    limits: StageLimits | None = None,
+    state: StateStore | None = None,
+    parts: dict[str, list[str]] | None = None,
 ):
-    queue = []
-    for fn in Path(directory).rglob("*.mp3"):
-        path = Path(fn)
-        path_file_hit = path.parent / f".hit.{path.name}.txt"
-        if path_file_hit.exists() and not overwrite:
-            continue
-        queue.append(fn)
+    """Remove ads from each episode in ``queue``.
 
-    logger.info("Found %d podcast(s) to process", len(queue))
-    for i, fn in enumerate(queue, 1):
-        logger.info("Processing podcast %d/%d: %s", i, len(queue), fn)
-        remove_ads(
-            file_name=str(fn),
-            overwrite=overwrite,
+    Episodes are processed one at a time, in a pool of ``workers``
+    processes, or, when ``limits`` is given, in a staged pipeline. A
+    failing episode is logged and skipped. Outcomes are recorded in
+    ``state`` if given, otherwise as ``.hit`` marker files. Episodes in
+    ``parts`` are trimmed from the parts an earlier run split them into.
+    """
+    hit_marker = state is None
+    if state is not None:
+        for fn in queue:
+            state.mark_started(str(fn))
+
+    if limits is not None and not parts:
+        # The pipeline records the metrics of its episodes as they finish.
+        done, failed = run_pipeline(
+            [str(fn) for fn in queue],
             model=model,
+            engine=engine,
+            limits=limits,
+            hit_marker=hit_marker,
         )
+        if state is not None:
+            for result in done:
+                state.mark_done(result)
+            for fn, error in failed:
+                state.mark_failed(fn, repr(error))
+        return
+
+    metrics.QUEUE_DEPTH.inc(len(queue), queue="episodes")
+
+    def _finished(result: EpisodeResult | None) -> None:
+        metrics.QUEUE_DEPTH.dec(queue="episodes")
+        if result is not None:
+            metrics.EPISODES.inc(outcome="done")
+            metrics.AD_SECONDS.inc(result.ad_seconds)
+        if state is not None and result is not None:
+            state.mark_done(result)
+
+    def _failed(fn: Path, error: BaseException) -> None:
+        logger.error("Failed to process podcast %s: %s", fn, error, exc_info=error)
+        metrics.QUEUE_DEPTH.dec(queue="episodes")
+        metrics.EPISODES.inc(outcome="failed")
+        if state is not None:
+            state.mark_failed(str(fn), repr(error))
+
+    kwargs = dict(
+        overwrite=overwrite,
+        model=model,
+        engine=engine,
+        part_workers=part_workers,
+        hit_marker=hit_marker,
+    )
+    if workers <= 1:
+        for i, fn in enumerate(queue, 1):
+            logger.info("Processing podcast %d/%d: %s", i, len(queue), fn)
+            try:
+                result = remove_ads(file_name=str(fn), parts=(parts or {}).get(str(fn)), **kwargs)
+            except Exception as error:
+                _failed(fn, error)
+            else:
+                _finished(result)
+        return
+
+    # Spawned workers start from a clean interpreter instead of a fork of
+    # this process, so they need their own logging setup.
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=setup_logging,
+    ) as pool:
+        futures = {
+            pool.submit(_remove_ads_in_worker, file_name=str(fn), parts=(parts or {}).get(str(fn)), **kwargs): fn
+            for fn in queue
+        }
+        for i, future in enumerate(as_completed(futures), 1):
+            fn = futures[future]
+            try:
+                result, recorded = future.result()
+            except Exception as error:
+                _failed(fn, error)
+            else:
+                metrics.merge(recorded)
+                _finished(result)
+                logger.info("Finished podcast %d/%d: %s", i, len(queue), fn)
+
+
+def process_backlog(backlog: Backlog, state: StateStore | None = None, **kwargs):
+    """Trim the episodes in ``backlog`` whose batch annotations have arrived.
+
+    Keyword arguments are passed on to :func:`process_files`.
+    """
+    ready = backlog.ready()
+    if ready:
+        logger.info("Found %d batch annotated podcast(s) to process", len(ready))
+        process_files(list(map(Path, ready)), state=state, parts=ready, **kwargs)
+        backlog.done(list(ready))
+    metrics.QUEUE_DEPTH.set(len(backlog), queue="batch")
+
+
+def walk_directory(
+    directory: str,
+    overwrite: bool = False,
+    state: StateStore | None = None,
+    scanner: LibraryScanner | None = None,
+    backlog: Backlog | None = None,
+    **kwargs,
+):
+    """Remove ads from every unprocessed episode under ``directory``.
+
+    Pass the same ``scanner`` on every call to only re-list directories that
+    changed since the previous scan. With a ``backlog``, episodes are queued
+    for batch annotation instead, and those whose annotations have arrived
+    are trimmed. Remaining keyword arguments are passed on to
+    :func:`process_files`.
+    """
+    scan = (scanner or LibraryScanner(directory)).scan()
+    logger.info(
+        "Scanned %d directories (%d listed, %d entries) in %.1fs",
+        scan.stats.directories, scan.stats.listed, scan.stats.entries, scan.stats.elapsed,
+    )
+    # The state store remembers files in unchanged directories, so only
+    # newly listed ones need to be registered.
+    candidates = scan.changed if state is not None and not overwrite else scan.files
+    queue = _select_pending(candidates, overwrite, state)
+
+    logger.info("Found %d podcast(s) to process", len(queue))
+    if backlog is None:
+        process_files(queue, overwrite=overwrite, state=state, **kwargs)
+        return
+    backlog.enqueue(queue, state)
+    process_backlog(backlog, overwrite=overwrite, state=state, **kwargs)
+
+
+def _garbage_collector(directory: str, interval: float, backlog: Backlog | None) -> GarbageCollector:
+    """Build the watcher's garbage collector, which never removes parts waiting on ``backlog``."""
+    # An empty backlog is falsy, but still has to be kept: it fills up later.
+    return GarbageCollector(directory, interval=interval, keep=backlog if backlog is not None else ())
+
+
+def watch_inotify(
+    watcher: InotifyWatcher,
+    rescan_interval: float,
+    collector: GarbageCollector | None = None,
+    **kwargs,
+):
+    """Process new episodes as soon as the watcher reports them.
+
+    A full scan runs at start-up, every ``rescan_interval`` seconds, and
+    whenever the kernel event queue overflows, to catch anything missed.
+    Garbage collection, if given, is attempted after each full scan. With a
+    ``backlog`` keyword argument, new episodes are queued for batch
+    annotation, and finished batches are collected every
+    ``backlog.poll_interval`` seconds.
+    """
+    directory = str(watcher.directory)
+    backlog: Backlog | None = kwargs.get("backlog")
+    # process_files takes neither the scanner nor the backlog.
+    process_kwargs = {k: v for k, v in kwargs.items() if k not in ("scanner", "backlog")}
+    walk_directory(directory, **kwargs)
+    if collector is not None:
+        collector.maybe_run()
+    last_scan = monotonic()
+    while True:
+        timeout = max(0.0, last_scan + rescan_interval - monotonic())
+        if backlog is not None:
+            timeout = min(timeout, backlog.poll_interval)
+        queue = _select_pending(watcher.poll(timeout), state=kwargs.get("state"))
+        if queue:
+            logger.info("Found %d new podcast(s) to process", len(queue))
+            if backlog is None:
+                process_files(queue, **process_kwargs)
+            else:
+                backlog.enqueue(queue, kwargs.get("state"))
+        if backlog is not None:
+            process_backlog(backlog, **process_kwargs)
+        if watcher.overflowed or monotonic() - last_scan >= rescan_interval:
+            watcher.overflowed = False
+            walk_directory(directory, **kwargs)
+            if collector is not None:
+                collector.maybe_run()
+            last_scan = monotonic()
+
 
 def main():
     setup_logging()
@@ -60,9 +382,80 @@ def main():
     )
     args = parser.parse_typed_args()
 
+    if args.transcriber:
+        os.environ[TRANSCRIBER_ENV] = args.transcriber
+    if args.base_url:
+        os.environ[BASE_URL_ENV] = args.base_url
+    if args.cache_dir:
+        # Set in the environment so that worker processes pick it up too.
+        os.environ[CACHE_DIR_ENV] = args.cache_dir
+    if args.cache_max_mb:
+        os.environ[CACHE_MAX_MB_ENV] = str(args.cache_max_mb)
+    if args.fingerprint_db:
+        os.environ[FINGERPRINT_DB_ENV] = args.fingerprint_db
+    if args.shingle_db:
+        os.environ[SHINGLE_DB_ENV] = args.shingle_db
+    backlog = None
+    if args.batch:
+        backlog = Backlog(
+            args.batch_dir or str(Path(args.directory) / BATCH_DIR_NAME),
+            model=args.model,
+            engine=args.engine,
+            poll_interval=min(args.sleep, BATCH_POLL_INTERVAL),
+        )
+    collector = _garbage_collector(args.directory, args.gc_interval, backlog)
+
+    limits = None
+    if args.pipeline:
+        limits = StageLimits(
+            transcribe=args.transcribe_workers,
+            annotate=args.annotate_workers,
+            trim=args.trim_workers,
+        )
+
+    if POOL_SIZE_ENV not in os.environ:
+        # Each process has its own connection pool; size it to the calls
+        # one process can have in flight at once.
+        if limits is not None:
+            in_flight = limits.transcribe + limits.annotate * ANNOTATION_WORKERS
+        else:
+            in_flight = args.part_workers * ANNOTATION_WORKERS
+        os.environ[POOL_SIZE_ENV] = str(in_flight)
+
+    if args.metrics_port is not None:
+        metrics.start_http_server(args.metrics_port)
+
+    state = StateStore(args.state_db or str(Path(args.directory) / STATE_DB_NAME))
+    state.import_hit_markers(args.directory)
+
+    kwargs = dict(
+        state=state,
+        scanner=LibraryScanner(args.directory, workers=args.scan_workers),
+        model=args.model,
+        engine=args.engine,
+        part_workers=args.part_workers,
+        workers=args.workers,
+        limits=limits,
+        backlog=backlog,
+    )
+
+    if args.watch == "inotify":
+        try:
+            watcher = InotifyWatcher(args.directory, debounce=args.debounce)
+        except OSError:
+            logger.exception("Could not start inotify watch, falling back to polling")
+        else:
+            with watcher:
+                try:
+                    watch_inotify(watcher, rescan_interval=args.rescan, collector=collector, **kwargs)
+                except KeyboardInterrupt:
+                    pass
+            return
+
     while True:
         try:
-            walk_directory(args.directory, model=args.model)
+            walk_directory(args.directory, **kwargs)
+            collector.maybe_run()
             logger.info("Sleeping for %d minutes", args.sleep // 60)
             sleep(args.sleep)
         except KeyboardInterrupt:
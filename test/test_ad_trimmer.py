@@ -1,7 +1,12 @@
+import os
+import tempfile
+from pathlib import Path
 from unittest import TestCase
 from unittest.mock import Mock, patch
 
 from ad_begone.ad_trimmer import AdTrimmer
+from ad_begone.fingerprint import FingerprintMatch
+from ad_begone.models import Window
 
 
 class TestAdTrimmer(TestCase):
@@ -52,6 +57,7 @@ class TestAdTrimmer(TestCase):
             transcription=mock_transcription,
             file_name="test.mp3.segments.json",
             model=None,
+            known_ad_segments=None,
         )
 
     @patch("ad_begone.ad_trimmer.find_ad_time_windows")
@@ -82,8 +88,10 @@ class TestAdTrimmer(TestCase):
         mock_get_annotations.assert_called_once_with(mock_completion)
         mock_find_windows.assert_called_once_with(mock_transcription, mock_annotations)
 
+    @patch.object(AdTrimmer, "get_time_windows")
+    @patch.object(AdTrimmer, "transcription")
     @patch("ad_begone.ad_trimmer._remove_ads")
-    def test_remove_ads_default_params(self, mock_remove_ads):
+    def test_remove_ads_default_params(self, mock_remove_ads, mock_transcription, mock_windows):
         trimmer = AdTrimmer("test.mp3")
         trimmer.remove_ads()
 
@@ -92,9 +100,12 @@ class TestAdTrimmer(TestCase):
         self.assertEqual(call_kwargs["file_name"], "test.mp3")
         self.assertEqual(call_kwargs["out_name"], None)
         self.assertEqual(call_kwargs["file_name_transcription_cache"], "test.mp3.transcription.json")
+        self.assertEqual(call_kwargs["file_name_segments_cache"], "test.mp3.segments.json")
 
+    @patch.object(AdTrimmer, "get_time_windows")
+    @patch.object(AdTrimmer, "transcription")
     @patch("ad_begone.ad_trimmer._remove_ads")
-    def test_remove_ads_with_output_name(self, mock_remove_ads):
+    def test_remove_ads_with_output_name(self, mock_remove_ads, mock_transcription, mock_windows):
         trimmer = AdTrimmer("test.mp3")
         trimmer.remove_ads(out_name="output.mp3")
 
@@ -103,11 +114,171 @@ class TestAdTrimmer(TestCase):
         self.assertEqual(call_kwargs["file_name"], "test.mp3")
         self.assertEqual(call_kwargs["out_name"], "output.mp3")
 
+    @patch.object(AdTrimmer, "get_time_windows")
+    @patch.object(AdTrimmer, "transcription")
     @patch("ad_begone.ad_trimmer._remove_ads")
-    def test_remove_ads_with_custom_notif(self, mock_remove_ads):
+    def test_remove_ads_with_custom_notif(self, mock_remove_ads, mock_transcription, mock_windows):
         trimmer = AdTrimmer("test.mp3")
         trimmer.remove_ads(notif_name="custom_notif.mp3")
 
         mock_remove_ads.assert_called_once()
         call_kwargs = mock_remove_ads.call_args[1]
         self.assertEqual(call_kwargs["notif_name"], "custom_notif.mp3")
+
+    @patch.object(AdTrimmer, "get_time_windows")
+    @patch.object(AdTrimmer, "transcription")
+    @patch("ad_begone.ad_trimmer._remove_ads")
+    def test_remove_ads_uses_loaded_artifacts(self, mock_remove_ads, mock_transcription, mock_windows):
+        trimmer = AdTrimmer("test.mp3")
+        trimmer.remove_ads()
+
+        call_kwargs = mock_remove_ads.call_args[1]
+        self.assertIs(call_kwargs["transcription"], mock_transcription.return_value)
+        self.assertIs(call_kwargs["windows"], mock_windows.return_value)
+
+
+class TestAdTrimmerMemo(TestCase):
+
+    @patch("ad_begone.ad_trimmer.find_ad_time_windows")
+    @patch("ad_begone.ad_trimmer.get_ordered_annotations")
+    @patch("ad_begone.ad_trimmer.cached_annotate_transcription")
+    @patch("ad_begone.ad_trimmer.cached_transcription")
+    def test_artifacts_loaded_once(self, mock_transcription, mock_annotate, mock_annotations, mock_windows):
+        trimmer = AdTrimmer("test.mp3")
+
+        trimmer.get_time_windows()
+        trimmer.segments_completion()
+        windows = trimmer.get_time_windows()
+
+        self.assertIs(windows, mock_windows.return_value)
+        mock_transcription.assert_called_once()
+        mock_annotate.assert_called_once()
+        mock_annotations.assert_called_once()
+        mock_windows.assert_called_once()
+
+    @patch("ad_begone.ad_trimmer.cached_annotate_transcription")
+    @patch("ad_begone.ad_trimmer.cached_transcription")
+    def test_reloaded_when_cache_file_changes(self, mock_transcription, mock_annotate):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            trimmer = AdTrimmer(str(Path(tmpdir) / "test.mp3"))
+            cache_file = Path(trimmer.transcription_cache_file)
+            cache_file.write_text("{}")
+
+            trimmer.segments_completion()
+            trimmer.segments_completion()
+            os.utime(cache_file, ns=(0, 0))
+            trimmer.segments_completion()
+
+            self.assertEqual(mock_transcription.call_count, 2)
+            self.assertEqual(mock_annotate.call_count, 2)
+
+
+class TestAdTrimmerFingerprints(TestCase):
+
+    def setUp(self):
+        self.index = Mock()
+        self.index.__len__ = Mock(return_value=1)
+        self.index.match.return_value = [FingerprintMatch(ad_id=1, start=10.0, end=20.0, hits=50)]
+        patcher = patch("ad_begone.ad_trimmer.get_fingerprint_index", return_value=self.index)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch("ad_begone.ad_trimmer.fingerprint_file")
+        self.fingerprint_file = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @patch("ad_begone.ad_trimmer.cached_annotate_transcription")
+    @patch("ad_begone.ad_trimmer.cached_transcription")
+    def test_matched_segments_are_known_ads(self, mock_transcription, mock_annotate):
+        mock_transcription.return_value.segments = [
+            Mock(start=0.0, end=9.0), Mock(start=10.0, end=15.0), Mock(start=15.0, end=21.0),
+        ]
+        AdTrimmer("test.mp3").segments_completion()
+        self.assertEqual(mock_annotate.call_args[1]["known_ad_segments"], {1})
+
+    @patch("ad_begone.ad_trimmer.find_ad_time_windows")
+    @patch("ad_begone.ad_trimmer.get_ordered_annotations")
+    @patch("ad_begone.ad_trimmer.cached_annotate_transcription")
+    @patch("ad_begone.ad_trimmer.cached_transcription")
+    def test_windows_use_exact_match_boundaries(self, mock_transcription, mock_annotate, mock_annotations, mock_windows):
+        mock_transcription.return_value.segments = []
+        mock_windows.return_value = [
+            Window(start=0.0, end=9.0, segment_type="content"),
+            Window(start=9.0, end=21.0, segment_type="ad"),
+            Window(start=21.0, end=30.0, segment_type="content"),
+        ]
+
+        windows = AdTrimmer("test.mp3").get_time_windows()
+
+        self.assertEqual(windows[1], Window(start=9.0, end=21.0, segment_type="ad"))
+        mock_windows.return_value[1] = Window(start=12.0, end=18.0, segment_type="ad")
+        windows = AdTrimmer("test.mp3").get_time_windows()
+        self.assertEqual(windows[1], Window(start=10.0, end=20.0, segment_type="ad"))
+
+    def test_only_new_ads_are_indexed(self):
+        trimmer = AdTrimmer("test.mp3")
+        added = trimmer.index_ads([
+            Window(start=0.0, end=10.0, segment_type="content"),
+            Window(start=10.0, end=20.0, segment_type="ad"),
+            Window(start=20.0, end=30.0, segment_type="content"),
+            Window(start=30.0, end=60.0, segment_type="ad"),
+            Window(start=60.0, end=62.0, segment_type="ad"),
+        ])
+
+        self.assertEqual(added, 1)
+        self.index.add.assert_called_once()
+        self.fingerprint_file.return_value.window.assert_called_once_with(30.0, 60.0)
+
+
+class TestAdTrimmerShingles(TestCase):
+
+    def setUp(self):
+        self.index = Mock()
+        self.index.__len__ = Mock(return_value=1)
+        self.index.known_segments.return_value = {1}
+        patcher = patch("ad_begone.ad_trimmer.get_shingle_index", return_value=self.index)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @patch("ad_begone.ad_trimmer.cached_annotate_transcription")
+    @patch("ad_begone.ad_trimmer.cached_transcription")
+    def test_repeated_reads_are_known_ads(self, mock_transcription, mock_annotate):
+        mock_transcription.return_value.segments = [Mock(text="a"), Mock(text="b"), Mock(text="c")]
+        AdTrimmer("test.mp3").segments_completion()
+
+        self.index.known_segments.assert_called_once_with(["a", "b", "c"])
+        self.assertEqual(mock_annotate.call_args[1]["known_ad_segments"], {1})
+
+    @patch.object(AdTrimmer, "transcription")
+    def test_only_new_reads_are_indexed(self, mock_transcription):
+        mock_transcription.return_value.segments = [
+            Mock(start=0.0, end=10.0, text="intro"),
+            Mock(start=10.0, end=20.0, text="known sponsor"),
+            Mock(start=20.0, end=30.0, text="content"),
+            Mock(start=30.0, end=40.0, text="new sponsor"),
+            Mock(start=40.0, end=50.0, text="more new sponsor"),
+        ]
+        added = AdTrimmer("test.mp3").index_ads([
+            Window(start=10.0, end=20.0, segment_type="ad"),
+            Window(start=20.0, end=30.0, segment_type="content"),
+            Window(start=30.0, end=50.0, segment_type="ad"),
+        ])
+
+        self.assertEqual(added, 1)
+        self.index.add.assert_called_once_with("new sponsor more new sponsor", source="test.mp3")
+
+    @patch("ad_begone.ad_trimmer._remove_ads", side_effect=RuntimeError("ffmpeg failed"))
+    @patch.object(AdTrimmer, "get_time_windows")
+    @patch.object(AdTrimmer, "transcription")
+    def test_reads_are_indexed_only_after_trimming(self, mock_transcription, mock_windows, mock_remove_ads):
+        mock_transcription.return_value.segments = [Mock(start=0.0, end=30.0, text="new sponsor")]
+        mock_windows.return_value = [Window(start=0.0, end=30.0, segment_type="ad")]
+        trimmer = AdTrimmer("test_part_1.mp3")
+
+        with self.assertRaises(RuntimeError):
+            trimmer.remove_ads()
+        self.index.add.assert_not_called()
+
+        mock_remove_ads.side_effect = None
+        mock_remove_ads.return_value = mock_windows.return_value
+        trimmer.remove_ads()
+        self.index.add.assert_called_once_with("new sponsor", source="test_part_1.mp3")
@@ -0,0 +1,141 @@
+import os
+import tempfile
+import time
+from pathlib import Path
+from unittest import TestCase
+from unittest.mock import patch
+
+from openai.types.audio.transcription_verbose import TranscriptionVerbose
+from openai.types.chat.parsed_chat_completion import ParsedChatCompletion
+
+from ad_begone.artifacts import CACHE_DIR_ENV, ArtifactStore, audio_digest, get_artifact_store
+from ad_begone.utils import cached_annotate_transcription, cached_transcription
+
+_MP3_FRAME = b"\xff\xfb\x90\x00" + b"\x01" * 413
+_ID3_TAG = b"ID3\x04\x00\x00\x00\x00\x00\x04" + b"\x00" * 4
+
+_DATA = Path(__file__).parent / "data"
+
+
+class TestAudioDigest(TestCase):
+
+    def test_ignores_tags(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            plain = Path(tmpdir) / "plain.mp3"
+            tagged = Path(tmpdir) / "tagged.mp3"
+            plain.write_bytes(_MP3_FRAME * 5)
+            tagged.write_bytes(_ID3_TAG + _MP3_FRAME * 5)
+
+            self.assertEqual(audio_digest(str(plain)), audio_digest(str(tagged)))
+
+    def test_differs_for_different_audio(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            short = Path(tmpdir) / "short.mp3"
+            long = Path(tmpdir) / "long.mp3"
+            short.write_bytes(_MP3_FRAME * 5)
+            long.write_bytes(_MP3_FRAME * 6)
+
+            self.assertNotEqual(audio_digest(str(short)), audio_digest(str(long)))
+
+    def test_hashes_unparseable_files_whole(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            a = Path(tmpdir) / "a.mp3"
+            b = Path(tmpdir) / "b.mp3"
+            a.write_bytes(b"not audio")
+            b.write_bytes(b"not audio either")
+
+            self.assertNotEqual(audio_digest(str(a)), audio_digest(str(b)))
+
+
+class TestArtifactStore(TestCase):
+
+    def test_round_trip(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            store = ArtifactStore(tmpdir)
+
+            self.assertIsNone(store.get("transcription", "ab" * 32))
+            store.put("transcription", "ab" * 32, '{"text": "hi"}')
+
+            self.assertEqual(store.get("transcription", "ab" * 32), '{"text": "hi"}')
+            self.assertEqual(os.listdir(store.path("transcription", "ab" * 32).parent), ["ab" * 32 + ".json"])
+
+    def test_disabled_without_env(self):
+        with patch.dict(os.environ, {CACHE_DIR_ENV: ""}):
+            self.assertIsNone(get_artifact_store())
+
+
+class TestCachedResultsAreShared(TestCase):
+
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.tmpdir = Path(self._tmpdir.name)
+        env = patch.dict(os.environ, {CACHE_DIR_ENV: str(self.tmpdir / "cache")})
+        env.start()
+        self.addCleanup(env.stop)
+
+    def tearDown(self):
+        self._tmpdir.cleanup()
+
+    @patch("ad_begone.utils._get_client")
+    @patch("ad_begone.utils.compact_mp3", return_value=b"compact")
+    def test_identical_audio_is_transcribed_once(self, mock_compact, mock_get_client):
+        transcription = TranscriptionVerbose.model_validate_json((_DATA / "test.json").read_text())
+        create = mock_get_client.return_value.audio.transcriptions.create
+        create.return_value = transcription
+
+        first = self.tmpdir / "feed_a" / "episode.mp3"
+        second = self.tmpdir / "feed_b" / "same_episode.mp3"
+        for path, tag in ((first, b""), (second, _ID3_TAG)):
+            path.parent.mkdir()
+            path.write_bytes(tag + _MP3_FRAME * 5)
+
+        cached_transcription(str(first))
+        result = cached_transcription(str(second))
+
+        create.assert_called_once()
+        self.assertEqual(result.text, transcription.text)
+        self.assertTrue((self.tmpdir / "feed_b" / "same_episode.json").exists())
+
+    @patch("ad_begone.utils._annotate")
+    def test_annotation_reused_for_same_transcription_and_model(self, mock_annotate):
+        transcription = TranscriptionVerbose.model_validate_json((_DATA / "test.json").read_text())
+        completion = ParsedChatCompletion.model_validate_json((_DATA / "test_annotation_completion.json").read_text())
+        mock_annotate.return_value = completion
+
+        cached_annotate_transcription(transcription, file_name=str(self.tmpdir / "a.json"), model="gpt-a")
+        result = cached_annotate_transcription(transcription, file_name=str(self.tmpdir / "b.json"), model="gpt-a")
+        cached_annotate_transcription(transcription, file_name=str(self.tmpdir / "c.json"), model="gpt-b")
+
+        self.assertEqual(mock_annotate.call_count, 2)
+        self.assertEqual(result.id, completion.id)
+        self.assertTrue((self.tmpdir / "b.json").exists())
+
+
+class TestArtifactStoreEviction(TestCase):
+
+    def test_evicts_least_recently_used(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            store = ArtifactStore(tmpdir, max_bytes=250)
+            keys = ["aa" * 32, "bb" * 32, "cc" * 32]
+            store.put("annotation", keys[0], "x" * 100)
+            store.put("annotation", keys[1], "x" * 100)
+            for i, key in enumerate(keys[:2]):
+                then = time.time() - 100 + i
+                os.utime(store.path("annotation", key), (then, then))
+            # Reading the older entry makes it the most recently used.
+            store.get("annotation", keys[0])
+
+            store.put("annotation", keys[2], "x" * 100)
+
+            self.assertIsNotNone(store.get("annotation", keys[0]))
+            self.assertIsNone(store.get("annotation", keys[1]))
+            self.assertIsNotNone(store.get("annotation", keys[2]))
+
+    def test_unbounded_store_keeps_everything(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            store = ArtifactStore(tmpdir)
+            for key in ("aa" * 32, "bb" * 32):
+                store.put("annotation", key, "x" * 100)
+
+            self.assertEqual(store.evict(), 0)
+            self.assertIsNotNone(store.get("annotation", "aa" * 32))
@@ -0,0 +1,307 @@
+import json
+import os
+import re
+import tempfile
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import TestCase
+from unittest.mock import patch
+
+from openai.types.audio.transcription_verbose import TranscriptionVerbose
+from openai.types.chat.parsed_chat_completion import ParsedChatCompletion
+
+from ad_begone.batch import BATCH_MAX_ATTEMPTS, Backlog, BatchAnnotator
+from ad_begone.models import EpisodeResult, SegmentAnnotation
+from ad_begone.state import StateStore
+from ad_begone.utils import get_ordered_annotations
+from ad_begone.watch_directory import _garbage_collector, process_backlog
+
+_SEGMENT_RE = re.compile(r"^Segment (\d+): (.*)$", re.MULTILINE)
+
+
+def _transcription(texts: list[str]) -> TranscriptionVerbose:
+    return TranscriptionVerbose.model_validate({
+        "duration": 5.0 * len(texts),
+        "language": "english",
+        "text": " ".join(texts),
+        "segments": [
+            {
+                "id": i, "seek": 0, "start": 5.0 * i, "end": 5.0 * (i + 1), "text": text,
+                "tokens": [1], "temperature": 0.0, "avg_logprob": -0.2,
+                "compression_ratio": 1.5, "no_speech_prob": 0.001,
+            }
+            for i, text in enumerate(texts)
+        ],
+    })
+
+
+def _texts(ad: range, n: int = 10) -> list[str]:
+    return [f"sponsor read {i}" if i in ad else f"story line {i}" for i in range(n)]
+
+
+class FakeBatchClient:
+    """Stand-in for the files and batches endpoints of the OpenAI client.
+
+    Submitted batches stay in progress until :meth:`complete` answers their
+    requests, labelling segments that mention a sponsor as ads.
+    """
+
+    def __init__(self):
+        self.inputs: dict[str, str] = {}
+        self.outputs: dict[str, str] = {}
+        self.jobs: dict[str, SimpleNamespace] = {}
+        self.files = SimpleNamespace(create=self._create_file, content=self._content)
+        self.batches = SimpleNamespace(create=self._create_batch, retrieve=self._retrieve)
+
+    def _create_file(self, file, purpose):
+        file_id = f"file-{len(self.inputs) + len(self.outputs)}"
+        self.inputs[file_id] = file.read().decode()
+        return SimpleNamespace(id=file_id)
+
+    def _content(self, file_id):
+        return SimpleNamespace(text=self.outputs[file_id])
+
+    def _create_batch(self, input_file_id, endpoint, completion_window):
+        batch = SimpleNamespace(
+            id=f"batch-{len(self.jobs)}", status="in_progress",
+            input_file_id=input_file_id, output_file_id=None,
+        )
+        self.jobs[batch.id] = batch
+        return batch
+
+    def _retrieve(self, batch_id):
+        return self.jobs[batch_id]
+
+    @staticmethod
+    def _answer(request: dict) -> dict:
+        prompt = request["body"]["messages"][1]["content"]
+        tool_calls = []
+        previous = None
+        for index, text in _SEGMENT_RE.findall(prompt):
+            label = "ad" if "sponsor" in text else "content"
+            if label != previous:
+                tool_calls.append({
+                    "id": f"call_{index}",
+                    "type": "function",
+                    "function": {
+                        "name": "SegmentAnnotation",
+                        "arguments": json.dumps({"segment_type": label, "segment_index": int(index)}),
+                    },
+                })
+                previous = label
+        return {
+            "id": "chatcmpl-batch",
+            "object": "chat.completion",
+            "created": 0,
+            "model": request["body"]["model"],
+            "choices": [{
+                "index": 0,
+                "finish_reason": "tool_calls",
+                "message": {"role": "assistant", "content": None, "tool_calls": tool_calls},
+            }],
+        }
+
+    def complete(self, batch_id: str, fail: set[str] = frozenset()) -> None:
+        batch = self.jobs[batch_id]
+        lines = []
+        for line in self.inputs[batch.input_file_id].splitlines():
+            request = json.loads(line)
+            if request["custom_id"] in fail:
+                response = {"status_code": 500, "body": {"error": {"message": "server error"}}}
+            else:
+                response = {"status_code": 200, "body": self._answer(request)}
+            lines.append(json.dumps({"custom_id": request["custom_id"], "response": response, "error": None}))
+        batch.output_file_id = f"file-out-{batch_id}"
+        self.outputs[batch.output_file_id] = "\n".join(lines)
+        batch.status = "completed"
+
+    def submitted(self) -> list[dict]:
+        return [json.loads(line) for text in self.inputs.values() for line in text.splitlines()]
+
+
+class TestBatchAnnotator(TestCase):
+
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.tmpdir = Path(self._tmpdir.name)
+        self.client = FakeBatchClient()
+        patcher = patch.dict(os.environ, {"AD_BEGONE_CACHE_DIR": ""})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self._tmpdir.cleanup()
+
+    def _annotator(self, **kwargs) -> BatchAnnotator:
+        return BatchAnnotator(str(self.tmpdir / "batch"), client=self.client, **kwargs)
+
+    def test_completions_are_written_to_cache_files(self):
+        annotator = self._annotator()
+        first, second = self.tmpdir / "a.segments.json", self.tmpdir / "b.segments.json"
+        self.assertTrue(annotator.add(_transcription(_texts(range(3, 6))), str(first), model="gpt-test"))
+        self.assertTrue(annotator.add(_transcription(_texts(range(0, 2))), str(second), model="gpt-test"))
+
+        (batch_id,) = annotator.submit()
+        self.assertEqual(annotator.poll(), [])
+        self.assertTrue(annotator.queued(str(first)))
+
+        self.client.complete(batch_id)
+        written = annotator.poll()
+
+        self.assertEqual(sorted(written), [str(first), str(second)])
+        self.assertEqual(len(annotator), 0)
+        completion = ParsedChatCompletion.model_validate_json(first.read_text())
+        self.assertEqual(get_ordered_annotations(completion), [
+            SegmentAnnotation(segment_type="content", segment_index=0),
+            SegmentAnnotation(segment_type="ad", segment_index=3),
+            SegmentAnnotation(segment_type="content", segment_index=6),
+        ])
+
+    def test_identical_transcripts_share_requests(self):
+        annotator = self._annotator()
+        transcription = _transcription(_texts(range(3, 6)))
+        annotator.add(transcription, str(self.tmpdir / "a.segments.json"), model="gpt-test")
+        annotator.add(transcription, str(self.tmpdir / "b.segments.json"), model="gpt-test")
+
+        (batch_id,) = annotator.submit()
+        self.client.complete(batch_id)
+
+        self.assertEqual(len(self.client.submitted()), 1)
+        self.assertEqual(len(annotator.poll()), 2)
+
+    def test_annotated_files_are_not_queued(self):
+        annotator = self._annotator()
+        cache_file = self.tmpdir / "a.segments.json"
+        cache_file.write_text("{}")
+
+        self.assertFalse(annotator.add(_transcription(_texts(range(3, 6))), str(cache_file), model="gpt-test"))
+        self.assertEqual(annotator.submit(), [])
+
+    def test_large_backlogs_are_split_into_batches(self):
+        annotator = self._annotator(max_requests=1)
+        for i in range(3):
+            annotator.add(_transcription(_texts(range(i, i + 3))), str(self.tmpdir / f"{i}.segments.json"), model="gpt-test")
+
+        self.assertEqual(len(annotator.submit()), 3)
+
+    def test_failed_requests_are_queued_again(self):
+        annotator = self._annotator()
+        cache_file = self.tmpdir / "a.segments.json"
+        annotator.add(_transcription(_texts(range(3, 6))), str(cache_file), model="gpt-test")
+
+        for attempt in range(BATCH_MAX_ATTEMPTS):
+            (batch_id,) = annotator.submit()
+            custom_ids = {r["custom_id"] for r in self.client.submitted()}
+            self.client.complete(batch_id, fail=custom_ids)
+            self.assertEqual(annotator.poll(), [])
+
+        # Given up on, so that trimming falls back to interactive annotation.
+        self.assertFalse(annotator.queued(str(cache_file)))
+        self.assertFalse(cache_file.exists())
+
+    def test_restart_resumes_outstanding_batches(self):
+        cache_file = self.tmpdir / "a.segments.json"
+        annotator = self._annotator()
+        annotator.add(_transcription(_texts(range(3, 6))), str(cache_file), model="gpt-test")
+        (batch_id,) = annotator.submit()
+
+        annotator = self._annotator()
+        self.assertEqual(annotator.submit(), [])
+        self.client.complete(batch_id)
+
+        self.assertEqual(annotator.poll(), [str(cache_file)])
+        self.assertTrue(cache_file.exists())
+
+    def test_results_are_shared_through_the_artifact_store(self):
+        transcription = _transcription(_texts(range(3, 6)))
+        with patch.dict(os.environ, {"AD_BEGONE_CACHE_DIR": str(self.tmpdir / "cache")}):
+            annotator = self._annotator()
+            annotator.add(transcription, str(self.tmpdir / "a.segments.json"), model="gpt-test")
+            (batch_id,) = annotator.submit()
+            self.client.complete(batch_id)
+            annotator.poll()
+
+            other = self.tmpdir / "b.segments.json"
+            self.assertFalse(annotator.add(transcription, str(other), model="gpt-test"))
+
+        self.assertEqual(other.read_text(), (self.tmpdir / "a.segments.json").read_text())
+
+
+class TestBacklog(TestCase):
+
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.tmpdir = Path(self._tmpdir.name)
+        self.client = FakeBatchClient()
+        self.state = StateStore(str(self.tmpdir / "state.sqlite3"))
+        self.episode = self.tmpdir / "episode.mp3"
+        self.episode.write_bytes(b"audio")
+        self.parts = [str(self.tmpdir / f"part_{i}_0a1b2c3d_episode.mp3") for i in range(2)]
+        for patcher in (
+            patch.dict(os.environ, {"AD_BEGONE_CACHE_DIR": ""}),
+            patch("ad_begone.batch.split_file", return_value=self.parts),
+            patch(
+                "ad_begone.batch.AdTrimmer.transcription",
+                side_effect=[_transcription(_texts(range(3, 6))), _transcription(_texts(range(0)))],
+            ),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.state.close()
+        self._tmpdir.cleanup()
+
+    def _backlog(self) -> Backlog:
+        return Backlog(str(self.tmpdir / "batch"), client=self.client, model="gpt-test", poll_interval=0)
+
+    @patch("ad_begone.watch_directory.remove_ads")
+    def test_episodes_are_trimmed_once_annotated(self, mock_remove_ads):
+        mock_remove_ads.return_value = EpisodeResult(str(self.episode), elapsed=1.0, ad_seconds=15.0, model="gpt-test")
+        backlog = self._backlog()
+        self.state.observe([self.episode])
+
+        backlog.enqueue(self.state.pending(), self.state)
+
+        self.assertEqual(self.state.status(str(self.episode)), "queued")
+        self.assertEqual(self.state.pending(), [])
+        self.assertIn(self.parts[0] + ".segments.json", backlog)
+        process_backlog(backlog, state=self.state)
+        mock_remove_ads.assert_not_called()
+
+        for batch_id in list(self.client.jobs):
+            self.client.complete(batch_id)
+        process_backlog(backlog, state=self.state)
+
+        mock_remove_ads.assert_called_once()
+        self.assertEqual(mock_remove_ads.call_args[1]["file_name"], str(self.episode))
+        self.assertEqual(mock_remove_ads.call_args[1]["parts"], self.parts)
+        self.assertTrue(Path(self.parts[1] + ".segments.json").exists())
+        self.assertEqual(self.state.status(str(self.episode)), "done")
+        self.assertEqual(len(backlog), 0)
+
+    def test_queued_episodes_survive_a_restart(self):
+        self._backlog().enqueue([str(self.episode)])
+
+        backlog = self._backlog()
+        self.assertEqual(backlog.ready(), {})
+        for batch_id in list(self.client.jobs):
+            self.client.complete(batch_id)
+
+        self.assertEqual(backlog.ready(), {str(self.episode): self.parts})
+
+    def test_parts_are_kept_by_garbage_collection(self):
+        backlog = self._backlog()
+        # Built while the backlog is still empty, as on a fresh start.
+        collector = _garbage_collector(str(self.tmpdir), 1, backlog)
+        backlog.enqueue([str(self.episode)])
+        old = time.time() - 2 * 86400
+        for part in self.parts:
+            Path(part).write_bytes(b"audio")
+            os.utime(part, (old, old))
+
+        with patch("ad_begone.cleanup.get_artifact_store", return_value=None):
+            collector.maybe_run()
+
+        self.assertTrue(all(Path(part).exists() for part in self.parts))
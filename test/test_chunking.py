@@ -0,0 +1,74 @@
+from unittest import TestCase
+
+from ad_begone.chunking import labels_to_annotations, merge_chunk_labels, plan_chunks, segment_labels
+from ad_begone.models import SegmentAnnotation
+
+
+def _ann(segment_type, segment_index):
+    return SegmentAnnotation(segment_type=segment_type, segment_index=segment_index)
+
+
+class TestPlanChunks(TestCase):
+
+    def test_single_chunk_when_within_budget(self):
+        self.assertEqual(plan_chunks(["a"] * 5, 10, 2, lambda line: 1), [(0, 5)])
+
+    def test_chunks_respect_budget_and_overlap(self):
+        chunks = plan_chunks(["a"] * 10, 4, 1, lambda line: 1)
+
+        self.assertEqual(chunks, [(0, 4), (3, 7), (6, 10)])
+
+    def test_oversized_line_gets_own_chunk(self):
+        tokens = {"small": 1, "huge": 50}
+        chunks = plan_chunks(["small", "huge", "small"], 4, 0, tokens.get)
+
+        self.assertEqual(chunks, [(0, 1), (1, 2), (2, 3)])
+
+    def test_empty(self):
+        self.assertEqual(plan_chunks([], 4, 1, len), [])
+
+
+class TestSegmentLabels(TestCase):
+
+    def test_expands_block_starts(self):
+        labels = segment_labels([_ann("ad", 12), _ann("content", 10)], 10, 15)
+
+        self.assertEqual(labels, ["content", "content", "ad", "ad", "ad"])
+
+    def test_unknown_before_first_annotation(self):
+        labels = segment_labels([_ann("ad", 2)], 0, 4)
+
+        self.assertEqual(labels, [None, None, "ad", "ad"])
+
+
+class TestMergeChunkLabels(TestCase):
+
+    def test_overlap_split_at_midpoint(self):
+        chunks = [(0, 6), (4, 10)]
+        first = ["content"] * 4 + ["ad", "ad"]
+        second = ["content"] * 6
+
+        merged = merge_chunk_labels(chunks, [first, second])
+
+        # The overlap is segments 4-5; segment 4 belongs to the first chunk.
+        self.assertEqual(merged, ["content"] * 4 + ["ad"] + ["content"] * 5)
+
+    def test_unknown_labels_fall_back_to_other_chunk(self):
+        chunks = [(0, 6), (4, 10)]
+        first = ["content"] * 4 + ["ad", "ad"]
+        second = [None, None, "ad", "content", "content", "content"]
+
+        merged = merge_chunk_labels(chunks, [first, second])
+
+        self.assertEqual(merged, ["content"] * 4 + ["ad"] * 3 + ["content"] * 3)
+
+    def test_unlabelled_start_defaults_to_content(self):
+        self.assertEqual(merge_chunk_labels([(0, 3)], [[None, "ad", "ad"]]), ["content", "ad", "ad"])
+
+
+class TestLabelsToAnnotations(TestCase):
+
+    def test_block_starts(self):
+        annotations = labels_to_annotations(["content", "content", "ad", "ad", "content"])
+
+        self.assertEqual(annotations, [_ann("content", 0), _ann("ad", 2), _ann("content", 4)])
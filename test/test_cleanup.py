@@ -0,0 +1,143 @@
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+from unittest import TestCase
+
+from ad_begone.artifacts import ArtifactStore
+from ad_begone.cleanup import GarbageCollector, collect_garbage, waiting_files
+
+
+def _age(path: Path, seconds: float) -> None:
+    then = time.time() - seconds
+    os.utime(path, (then, then))
+
+
+class TestCollectGarbage(TestCase):
+
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.root = Path(self._tmpdir.name)
+        self.feed = self.root / "feed"
+        self.feed.mkdir()
+
+    def tearDown(self):
+        self._tmpdir.cleanup()
+
+    def _touch(self, name: str, age: float = 0.0) -> Path:
+        path = self.feed / name
+        path.write_bytes(b"x" * 10)
+        _age(path, age)
+        return path
+
+    def test_removes_old_parts_and_temp_files(self):
+        old_part = self._touch("part_0_0a1b2c3d_episode.mp3", age=2 * 86400)
+        new_part = self._touch("part_1_4e5f6a7b_episode.mp3")
+        old_temp = self._touch(".episode.mp3.k2j3x9_a.tmp", age=2 * 86400)
+        episode = self._touch("episode.mp3", age=2 * 86400)
+        episode_like_part = self._touch("part_1_the_beginning.mp3", age=2 * 86400)
+        state_db = self._touch(".ad-begone.sqlite3", age=2 * 86400)
+
+        stats = collect_garbage(str(self.root))
+
+        self.assertFalse(old_part.exists())
+        self.assertFalse(old_temp.exists())
+        self.assertTrue(new_part.exists())
+        self.assertTrue(episode.exists())
+        self.assertTrue(episode_like_part.exists())
+        self.assertTrue(state_db.exists())
+        self.assertEqual((stats.parts, stats.temp_files), (1, 1))
+        self.assertEqual(stats.bytes_freed, 20)
+
+    def test_removes_only_temp_files_of_this_program(self):
+        ours = [
+            self._touch(".part_0_0a1b2c3d_episode.mp3.q8w_7zzt.mp3", age=2 * 86400),
+            self._touch(".episode.mp3.0b1c2d3e.tmp", age=2 * 86400),
+            self._touch(".batches.json.x7yyz01a.tmp", age=2 * 86400),
+        ]
+        unrelated = [
+            self._touch(".something.mp3", age=2 * 86400),
+            self._touch(".episode.mp3", age=2 * 86400),
+            self._touch(".download.part.tmp", age=2 * 86400),
+        ]
+
+        stats = collect_garbage(str(self.root))
+
+        self.assertEqual([p for p in ours if p.exists()], [])
+        self.assertEqual([p for p in unrelated if not p.exists()], [])
+        self.assertEqual(stats.temp_files, 3)
+
+    def test_keeps_listed_parts(self):
+        part = self._touch("part_0_0a1b2c3d_episode.mp3", age=2 * 86400)
+
+        stats = collect_garbage(str(self.root), keep={str(part)})
+
+        self.assertTrue(part.exists())
+        self.assertEqual(stats.parts, 0)
+
+    def test_keeps_parts_waiting_in_batch_dir(self):
+        waiting = self._touch("part_0_0a1b2c3d_episode.mp3", age=2 * 86400)
+        sidecar = self._touch("part_0_0a1b2c3d_episode.mp3.transcription.json", age=2 * 86400)
+        orphan = self._touch("part_0_4e5f6a7b_other.mp3", age=2 * 86400)
+        batch_dir = self.root / ".ad-begone-batch"
+        batch_dir.mkdir()
+        (batch_dir / "episodes.json").write_text(json.dumps({str(self.feed / "episode.mp3"): [str(waiting)]}))
+
+        stats = collect_garbage(str(self.root), keep=waiting_files(str(self.root)))
+
+        self.assertTrue(waiting.exists())
+        self.assertTrue(sidecar.exists())
+        self.assertFalse(orphan.exists())
+        self.assertEqual(stats.parts, 1)
+
+    def test_waiting_files_without_batch_dir(self):
+        self.assertEqual(waiting_files(str(self.root)), set())
+
+    def test_removes_sidecars_without_audio(self):
+        self._touch("episode.mp3")
+        kept = [
+            self._touch("episode.mp3.transcription.json"),
+            self._touch("episode.mp3.segments.json"),
+            # May belong to the podcast client, so left alone.
+            self._touch("deleted.json", age=2 * 86400),
+            # A failed run's parts are gone, but a retry reuses their sidecars.
+            self._touch("part_0_4e5f6a7b_failed.mp3.transcription.json"),
+        ]
+        orphans = [
+            self._touch("deleted.mp3.transcription.json", age=2 * 86400),
+            self._touch("deleted.mp3.segments.json", age=2 * 86400),
+            self._touch("part_0_0a1b2c3d_deleted.json", age=2 * 86400),
+        ]
+
+        stats = collect_garbage(str(self.root))
+
+        self.assertTrue(all(p.exists() for p in kept))
+        self.assertFalse(any(p.exists() for p in orphans))
+        self.assertEqual(stats.sidecars, 3)
+
+    def test_dry_run_keeps_files(self):
+        orphan = self._touch("part_0_0a1b2c3d_episode.mp3", age=2 * 86400)
+
+        stats = collect_garbage(str(self.root), dry_run=True)
+
+        self.assertTrue(orphan.exists())
+        self.assertEqual(stats.parts, 1)
+
+    def test_enforces_store_budget(self):
+        store = ArtifactStore(str(self.root / "cache"))
+        store.put("annotation", "aa" * 32, "x" * 100)
+        store.put("annotation", "bb" * 32, "x" * 100)
+        store.max_bytes = 150
+
+        stats = collect_garbage(str(self.root), store=store)
+
+        self.assertEqual(stats.bytes_freed, 100)
+
+    def test_collector_runs_at_most_once_per_interval(self):
+        self._touch("part_0_0a1b2c3d_episode.mp3", age=2 * 86400)
+        collector = GarbageCollector(str(self.root), interval=3600)
+
+        self.assertIsNotNone(collector.maybe_run())
+        self.assertIsNone(collector.maybe_run())
+        self.assertIsNone(GarbageCollector(str(self.root), interval=0).maybe_run())
@@ -0,0 +1,61 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase
+from unittest.mock import patch
+
+from ad_begone import client
+
+
+class TestGetClient(TestCase):
+
+    def setUp(self):
+        client._reset_after_fork()
+        self.addCleanup(client._reset_after_fork)
+        patcher = patch.dict(os.environ, {
+            "OPENAI_API_KEY": "test-key",
+            "OPENAI_BASE_URL": "",
+            "AD_BEGONE_HTTP_POOL_SIZE": "",
+        })
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_one_client_per_process(self):
+        with patch("ad_begone.client._build_client", wraps=client._build_client) as build:
+            with ThreadPoolExecutor(max_workers=8) as pool:
+                clients = list(pool.map(lambda _: client._get_client("chat"), range(32)))
+
+        build.assert_called_once()
+        self.assertTrue(all(c is clients[0] for c in clients))
+
+    def test_kinds_share_the_connection_pool(self):
+        chat = client._get_client("chat")
+        transcription = client._get_client("transcription")
+
+        self.assertIs(chat._client, transcription._client)
+        self.assertEqual(chat.timeout.read, client.DEFAULT_TIMEOUTS["chat"])
+        self.assertEqual(transcription.timeout.read, client.DEFAULT_TIMEOUTS["transcription"])
+
+    def test_timeouts_from_environment(self):
+        with patch.dict(os.environ, {"OPENAI_CHAT_TIMEOUT": "30"}):
+            self.assertEqual(client._get_client("chat").timeout.read, 30.0)
+
+    def test_pool_size_from_environment(self):
+        with patch.dict(os.environ, {"AD_BEGONE_HTTP_POOL_SIZE": "12"}):
+            pool = client._get_client()._client._transport._pool
+
+        self.assertEqual(pool._max_connections, 12)
+        self.assertEqual(pool._max_keepalive_connections, 12)
+        self.assertEqual(pool._keepalive_expiry, client.KEEPALIVE_EXPIRY)
+
+    def test_base_url_without_api_key(self):
+        with patch.dict(os.environ, {"OPENAI_BASE_URL": "http://localhost:8000/v1", "OPENAI_API_KEY": ""}):
+            local = client._get_client()
+
+        self.assertEqual(str(local.base_url), "http://localhost:8000/v1/")
+        self.assertEqual(local.api_key, "unused")
+
+    def test_forked_child_builds_its_own_client(self):
+        parent = client._get_client()
+        client._reset_after_fork()
+
+        self.assertIsNot(client._get_client(), parent)
@@ -0,0 +1,110 @@
+import os
+import tempfile
+from unittest import TestCase
+from unittest.mock import Mock
+
+import numpy as np
+
+from ad_begone.fingerprint import (
+    SAMPLE_RATE,
+    FingerprintIndex,
+    FingerprintMatch,
+    fingerprint,
+    known_ad_segments,
+    overlay_matches,
+)
+from ad_begone.models import Window
+
+
+def _tones(seconds: float, seed: int) -> np.ndarray:
+    """Random chords changing every 1/8 s, like a busy piece of audio."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(SAMPLE_RATE // 8) / SAMPLE_RATE
+    notes = [
+        sum(np.sin(2 * np.pi * f * t) for f in rng.uniform(200, 3500, size=3))
+        for _ in range(int(seconds * 8))
+    ]
+    return np.concatenate(notes) * 3000
+
+
+class TestFingerprintIndex(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.index = FingerprintIndex(os.path.join(self.tmpdir.name, "fingerprints.sqlite3"))
+        self.ad = _tones(15, seed=1)
+
+    def tearDown(self):
+        self.index.close()
+        self.tmpdir.cleanup()
+
+    def test_finds_every_occurrence(self):
+        self.index.add(fingerprint(self.ad), source="first.mp3")
+        noise = np.random.default_rng(0).normal(0, 500, size=(20 + 15 + 20 + 15 + 5) * SAMPLE_RATE)
+        episode = np.concatenate([_tones(20, 2), self.ad, _tones(20, 3), self.ad, _tones(5, 4)]) + noise
+
+        matches = self.index.match(fingerprint(episode))
+
+        self.assertEqual(len(matches), 2)
+        for match, start in zip(matches, (20.0, 55.0)):
+            self.assertAlmostEqual(match.start, start, delta=0.1)
+            self.assertAlmostEqual(match.end, start + 15.0, delta=0.1)
+
+    def test_unrelated_audio_does_not_match(self):
+        self.index.add(fingerprint(self.ad))
+        self.assertEqual(self.index.match(fingerprint(_tones(60, seed=9))), [])
+
+    def test_ad_cut_from_an_episode(self):
+        episode = fingerprint(np.concatenate([_tones(10, 5), self.ad, _tones(10, 6)]))
+        self.index.add(episode.window(10.0, 25.0))
+        self.assertEqual(len(self.index), 1)
+
+        matches = self.index.match(fingerprint(np.concatenate([_tones(30, 7), self.ad])))
+        self.assertEqual(len(matches), 1)
+        self.assertAlmostEqual(matches[0].start, 30.0, delta=0.1)
+
+    def test_remove(self):
+        bad = self.index.add(fingerprint(self.ad), source="intro.mp3")
+        other = _tones(15, seed=8)
+        self.index.add(fingerprint(other), source="ad.mp3")
+
+        self.assertTrue(self.index.remove(bad))
+        self.assertFalse(self.index.remove(bad))
+
+        self.assertEqual([entry[1] for entry in self.index.entries()], ["ad.mp3"])
+        self.assertEqual(self.index.match(fingerprint(self.ad)), [])
+        self.assertEqual(len(self.index.match(fingerprint(other))), 1)
+
+    def test_empty(self):
+        self.assertEqual(self.index.match(fingerprint(self.ad)), [])
+        self.assertEqual(len(fingerprint(np.zeros(SAMPLE_RATE)).hashes), 0)
+
+
+class TestOverlayMatches(TestCase):
+
+    def test_matches_replace_windows(self):
+        windows = [
+            Window(start=0.0, end=10.0, segment_type="content"),
+            Window(start=10.5, end=40.0, segment_type="ad"),
+            Window(start=40.5, end=60.0, segment_type="content"),
+        ]
+        matches = [FingerprintMatch(ad_id=1, start=25.0, end=42.0, hits=50)]
+
+        self.assertEqual(
+            overlay_matches(windows, matches),
+            [
+                Window(start=0.0, end=10.0, segment_type="content"),
+                Window(start=10.5, end=42.0, segment_type="ad"),
+                Window(start=42.0, end=60.0, segment_type="content"),
+            ],
+        )
+
+    def test_no_matches(self):
+        windows = [Window(start=0.0, end=10.0, segment_type="content")]
+        self.assertIs(overlay_matches(windows, []), windows)
+
+    def test_known_ad_segments(self):
+        transcription = Mock()
+        transcription.segments = [Mock(start=0.0, end=5.0), Mock(start=5.0, end=9.0), Mock(start=9.0, end=12.0)]
+        matches = [FingerprintMatch(ad_id=1, start=4.0, end=11.0, hits=50)]
+        self.assertEqual(known_ad_segments(transcription, matches), {1})
@@ -0,0 +1,77 @@
+import struct
+import sys
+import tempfile
+from pathlib import Path
+from unittest import TestCase, skipUnless
+
+from ad_begone.inotify import (
+    IN_CLOSE_WRITE,
+    IN_ISDIR,
+    IN_MOVED_TO,
+    InotifyWatcher,
+    parse_events,
+)
+
+
+def _event(wd: int, mask: int, name: str = "", cookie: int = 0) -> bytes:
+    raw = name.encode()
+    length = (len(raw) + 1 + 15) // 16 * 16 if raw else 0
+    return struct.pack("iIII", wd, mask, cookie, length) + raw.ljust(length, b"\0")
+
+
+class TestParseEvents(TestCase):
+
+    def test_parses_padded_names(self):
+        buf = _event(1, IN_CLOSE_WRITE, "episode.mp3") + _event(2, IN_MOVED_TO | IN_ISDIR, "feed", cookie=7)
+
+        events = parse_events(buf)
+
+        self.assertEqual(len(events), 2)
+        self.assertEqual(events[0].name, "episode.mp3")
+        self.assertEqual(events[0].mask, IN_CLOSE_WRITE)
+        self.assertEqual(events[1].wd, 2)
+        self.assertEqual(events[1].cookie, 7)
+        self.assertEqual(events[1].name, "feed")
+
+    def test_event_without_name(self):
+        self.assertEqual(parse_events(_event(3, IN_CLOSE_WRITE))[0].name, "")
+
+
+@skipUnless(sys.platform.startswith("linux"), "inotify is Linux only")
+class TestInotifyWatcher(TestCase):
+
+    def test_reports_closed_and_moved_files(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmpdir_path = Path(tmpdir)
+            with InotifyWatcher(tmpdir, debounce=0.0) as watcher:
+                (tmpdir_path / "written.mp3").write_bytes(b"data")
+                (tmpdir_path / "notes.txt").write_text("ignored")
+                staging = tmpdir_path / "staging.tmp"
+                staging.write_bytes(b"data")
+                staging.rename(tmpdir_path / "moved.mp3")
+
+                ready = watcher.poll(timeout=1.0)
+                ready += watcher.poll(timeout=0.1)
+
+            self.assertEqual(sorted(p.name for p in ready), ["moved.mp3", "written.mp3"])
+
+    def test_watches_new_subdirectories(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmpdir_path = Path(tmpdir)
+            with InotifyWatcher(tmpdir, debounce=0.0) as watcher:
+                feed = tmpdir_path / "feed"
+                feed.mkdir()
+                watcher.poll(timeout=0.1)
+                (feed / "episode.mp3").write_bytes(b"data")
+
+                ready = watcher.poll(timeout=1.0)
+
+            self.assertEqual(ready, [feed / "episode.mp3"])
+
+    def test_debounce_waits_for_quiet_period(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with InotifyWatcher(tmpdir, debounce=0.3) as watcher:
+                (Path(tmpdir) / "episode.mp3").write_bytes(b"data")
+
+                self.assertEqual(watcher.poll(timeout=0.05), [])
+                self.assertEqual(len(watcher.poll(timeout=1.0)), 1)
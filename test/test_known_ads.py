@@ -0,0 +1,29 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from ad_begone.known_ads import format_entries, remove_entries
+from ad_begone.shingles import ShingleIndex
+
+
+class TestKnownAds(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.index = ShingleIndex(os.path.join(self.tmpdir.name, "shingles.sqlite3"))
+
+    def tearDown(self):
+        self.index.close()
+        self.tmpdir.cleanup()
+
+    def test_lists_and_removes_entries(self):
+        intro = self.index.add("welcome back to the show about rocks", source="part_0_0a1b2c3d_ep1.mp3")
+        self.index.add("this episode is brought to you by acme", source="part_0_4e5f6a7b_ep2.mp3")
+
+        lines = format_entries(self.index)
+        self.assertEqual(len(lines), 2)
+        self.assertIn("7 words", lines[0])
+        self.assertTrue(lines[0].endswith("part_0_0a1b2c3d_ep1.mp3"))
+
+        self.assertEqual(remove_entries(self.index, [intro, 99]), [99])
+        self.assertEqual(len(self.index), 1)
@@ -0,0 +1,123 @@
+import tempfile
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from unittest import TestCase
+from unittest.mock import patch
+
+from ad_begone import metrics
+from ad_begone.metrics import Counter, Gauge, Histogram, Metric
+from ad_begone.models import EpisodeResult
+from ad_begone.watch_directory import process_files
+
+
+class TestMetrics(TestCase):
+
+    def test_counter(self):
+        counter = Counter("test_total", "A test counter.")
+        counter.inc(kind="prompt")
+        counter.inc(2.5, kind="prompt")
+        counter.inc(kind='say "hi"')
+
+        self.assertEqual(counter.value(kind="prompt"), 3.5)
+        self.assertEqual(counter.render(), (
+            "# HELP test_total A test counter.\n"
+            "# TYPE test_total counter\n"
+            'test_total{kind="prompt"} 3.5\n'
+            'test_total{kind="say \\"hi\\""} 1\n'
+        ))
+        with self.assertRaises(ValueError):
+            counter.inc(-1)
+
+    def test_metrics_implement_samples(self):
+        with self.assertRaises(TypeError):
+            Metric("test_total", "A metric without samples.")
+
+    def test_gauge_from_function(self):
+        gauge = Gauge("test_bytes", "A test gauge.", function=lambda: 42)
+
+        self.assertIn("test_bytes 42\n", gauge.render())
+
+    def test_histogram(self):
+        histogram = Histogram("test_seconds", "A test histogram.", buckets=(1.0, 10.0))
+        for value in (0.5, 2.0, 20.0):
+            histogram.observe(value, stage="split")
+
+        lines = histogram.render().splitlines()[2:]
+        self.assertEqual(lines, [
+            'test_seconds_bucket{stage="split",le="1"} 1',
+            'test_seconds_bucket{stage="split",le="10"} 2',
+            'test_seconds_bucket{stage="split",le="+Inf"} 3',
+            'test_seconds_sum{stage="split"} 22.5',
+            'test_seconds_count{stage="split"} 3',
+        ])
+
+    def test_histogram_times_functions(self):
+        histogram = Histogram("test_seconds", "A test histogram.")
+
+        @histogram.time(stage="join")
+        def _join():
+            return "joined"
+
+        self.assertEqual(_join(), "joined")
+        self.assertEqual(_join(), "joined")
+        self.assertEqual(histogram.count(stage="join"), 2)
+
+    def test_drain_and_merge(self):
+        metrics.drain()
+        metrics.STAGE_SECONDS.observe(1.0, stage="split")
+        metrics.AD_SECONDS.inc(60.0)
+
+        snapshot = metrics.drain()
+        self.assertEqual(metrics.STAGE_SECONDS.count(stage="split"), 0)
+        self.assertEqual(metrics.AD_SECONDS.value(), 0.0)
+
+        metrics.merge(snapshot)
+        metrics.merge(snapshot)
+        self.assertEqual(metrics.STAGE_SECONDS.count(stage="split"), 2)
+        self.assertEqual(metrics.AD_SECONDS.value(), 120.0)
+
+    def test_http_server(self):
+        server = metrics.start_http_server(0, addr="127.0.0.1")
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        url = f"http://127.0.0.1:{server.server_address[1]}"
+
+        with urllib.request.urlopen(f"{url}/metrics") as response:
+            body = response.read().decode()
+            self.assertEqual(response.headers["Content-Type"], metrics.CONTENT_TYPE)
+        self.assertIn("# TYPE ad_begone_stage_duration_seconds histogram", body)
+        self.assertIn("process_resident_memory_bytes ", body)
+        with self.assertRaises(urllib.error.HTTPError):
+            urllib.request.urlopen(f"{url}/other")
+
+
+class TestProcessFilesMetrics(TestCase):
+
+    @patch("ad_begone.watch_directory.ProcessPoolExecutor")
+    @patch("ad_begone.watch_directory.remove_ads")
+    def test_worker_metrics_reach_the_parent(self, mock_remove_ads, mock_pool):
+        mock_pool.side_effect = lambda max_workers, **kwargs: ThreadPoolExecutor(max_workers)
+
+        def _remove_ads(file_name, **kwargs):
+            if "bad" in file_name:
+                raise RuntimeError("API error")
+            metrics.STAGE_SECONDS.observe(1.0, stage="transcribe")
+            return EpisodeResult(file_name, elapsed=1.0, ad_seconds=30.0)
+
+        mock_remove_ads.side_effect = _remove_ads
+        done = metrics.EPISODES.value(outcome="done")
+        failed = metrics.EPISODES.value(outcome="failed")
+        ad_seconds = metrics.AD_SECONDS.value()
+        transcribed = metrics.STAGE_SECONDS.count(stage="transcribe")
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            queue = [Path(tmpdir) / name for name in ("bad.mp3", "good1.mp3", "good2.mp3")]
+            process_files(queue, workers=2)
+
+        self.assertEqual(metrics.EPISODES.value(outcome="done"), done + 2)
+        self.assertEqual(metrics.EPISODES.value(outcome="failed"), failed + 1)
+        self.assertEqual(metrics.AD_SECONDS.value(), ad_seconds + 60.0)
+        self.assertGreaterEqual(metrics.STAGE_SECONDS.count(stage="transcribe"), transcribed + 2)
+        self.assertEqual(metrics.QUEUE_DEPTH.value(queue="episodes"), 0)
@@ -0,0 +1,129 @@
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+
+from ad_begone.models import Window
+from ad_begone.mp3_frames import (
+    index_frames,
+    parse_frame_header,
+    read_frame_index,
+    splice_windows,
+)
+
+# MPEG-1 Layer III, 128 kbps, 44.1 kHz, stereo: 417 bytes and 1152 samples per frame.
+_HEADER = b"\xff\xfb\x90\x00"
+_FRAME_SIZE = 417
+_FRAME_SECONDS = 1152 / 44100
+
+
+def _frame(fill: int) -> bytes:
+    return _HEADER + bytes([fill]) * (_FRAME_SIZE - 4)
+
+
+def _id3_tag(payload: bytes) -> bytes:
+    size = len(payload)
+    syncsafe = bytes([(size >> 21) & 0x7F, (size >> 14) & 0x7F, (size >> 7) & 0x7F, size & 0x7F])
+    return b"ID3\x04\x00\x00" + syncsafe + payload
+
+
+def _write_mp3(path: Path, n_frames: int, fill: int = 1, tag: bytes = b"") -> Path:
+    path.write_bytes(tag + b"".join(_frame(fill) for _ in range(n_frames)))
+    return path
+
+
+class TestParseFrameHeader(TestCase):
+
+    def test_mpeg1_layer3(self):
+        header = parse_frame_header(_HEADER)
+        self.assertEqual(header.sample_rate, 44100)
+        self.assertEqual(header.channels, 2)
+        self.assertEqual(header.frame_size, _FRAME_SIZE)
+        self.assertEqual(header.samples, 1152)
+
+    def test_mpeg2_mono(self):
+        # MPEG-2 Layer III, 64 kbps, 24 kHz, mono
+        header = parse_frame_header(b"\xff\xf3\x84\xc4")
+        self.assertEqual(header.sample_rate, 24000)
+        self.assertEqual(header.channels, 1)
+        self.assertEqual(header.frame_size, 192)
+        self.assertEqual(header.samples, 576)
+
+    def test_invalid_headers(self):
+        self.assertIsNone(parse_frame_header(b"\x00\x00\x00\x00"))
+        self.assertIsNone(parse_frame_header(b"\xff\xfd\x90\x00"))  # Layer II
+        self.assertIsNone(parse_frame_header(b"\xff\xfb\xf0\x00"))  # bad bitrate
+        self.assertIsNone(parse_frame_header(b"\xff\xfb"))
+
+
+class TestIndexFrames(TestCase):
+
+    def test_index_with_id3_tag(self):
+        tag = _id3_tag(b"\x00" * 20)
+        data = tag + b"".join(_frame(1) for _ in range(10))
+
+        index = index_frames(data)
+
+        self.assertEqual(len(index), 10)
+        self.assertEqual(index.tag, tag)
+        self.assertEqual(index.offsets[0], len(tag))
+        self.assertAlmostEqual(index.duration(), 10 * _FRAME_SECONDS)
+
+    def test_skips_info_frame_and_trailing_id3v1(self):
+        info = bytearray(_frame(0))
+        info[4 + 32:4 + 36] = b"Info"
+        data = bytes(info) + b"".join(_frame(1) for _ in range(5)) + b"TAG" + b"\x00" * 125
+
+        index = index_frames(data)
+
+        self.assertEqual(len(index), 5)
+        self.assertEqual(index.offsets[0], _FRAME_SIZE)
+
+    def test_resyncs_after_garbage(self):
+        data = _frame(1) + b"\x12\x34\xff\x00" + _frame(1)
+
+        index = index_frames(data)
+
+        self.assertEqual(len(index), 2)
+        self.assertEqual(index.offsets[1], _FRAME_SIZE + 4)
+
+    def test_no_frames(self):
+        with self.assertRaises(ValueError):
+            index_frames(b"not an mp3 file")
+
+    def test_nearest_boundary(self):
+        index = index_frames(b"".join(_frame(1) for _ in range(10)))
+        self.assertEqual(index.nearest_boundary(0.0), 0)
+        self.assertEqual(index.nearest_boundary(_FRAME_SECONDS * 2.4), 2)
+        self.assertEqual(index.nearest_boundary(_FRAME_SECONDS * 2.6), 3)
+        self.assertEqual(index.nearest_boundary(100.0), 10)
+
+    def test_real_file(self):
+        index = read_frame_index("test/data/test.mp3")
+        self.assertGreater(len(index), 0)
+        self.assertAlmostEqual(index.duration(), 131.1, places=0)
+
+
+class TestSpliceWindows(TestCase):
+
+    def test_splice_replaces_ads_with_notification(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmpdir_path = Path(tmpdir)
+            tag = _id3_tag(b"\x00" * 20)
+            episode = _write_mp3(tmpdir_path / "part_0_test.mp3", 100, fill=1, tag=tag)
+            notif = _write_mp3(tmpdir_path / "notif.mp3", 3, fill=2)
+
+            windows = [
+                Window(start=0.0, end=_FRAME_SECONDS * 40, segment_type="content"),
+                Window(start=_FRAME_SECONDS * 40, end=_FRAME_SECONDS * 70, segment_type="ad"),
+                Window(start=_FRAME_SECONDS * 70, end=_FRAME_SECONDS * 100, segment_type="content"),
+            ]
+
+            out = splice_windows(str(episode), windows, out_name=str(episode), notif_name=str(notif))
+
+            data = Path(out).read_bytes()
+            self.assertTrue(data.startswith(tag))
+            index = index_frames(data)
+            self.assertEqual(len(index), 40 + 3 + 30)
+            fills = [data[int(offset) + 4] for offset in index.offsets]
+            self.assertEqual(fills, [1] * 40 + [2] * 3 + [1] * 30)
+            self.assertEqual(sorted(p.name for p in tmpdir_path.iterdir()), ["notif.mp3", "part_0_test.mp3"])
@@ -35,7 +35,8 @@ class TestOpenAIAPI(TestCase):
         _remove_ads(
             file_name="test/data/test.mp3",
             out_name="test/data/test_no_ads.mp3",
-            file_name_transcription_cache="test/data/test_annotation_completion.json",
+            file_name_transcription_cache="test/data/test.json",
+            file_name_segments_cache="test/data/test_annotation_completion.json",
         )
 
 class TestAdTrimmer(TestCase):
@@ -0,0 +1,61 @@
+from unittest import TestCase
+
+import numpy as np
+from pydub import AudioSegment
+
+from ad_begone.pcm import PcmBuffer
+
+
+def _segment(n_frames: int, channels: int = 2, frame_rate: int = 1000) -> AudioSegment:
+    samples = np.arange(n_frames * channels, dtype=np.int16)
+    return AudioSegment(
+        data=samples.tobytes(),
+        sample_width=2,
+        frame_rate=frame_rate,
+        channels=channels,
+    )
+
+
+class TestPcmBuffer(TestCase):
+
+    def test_from_segment_is_a_view(self):
+        segment = _segment(100)
+        buffer = PcmBuffer.from_segment(segment)
+
+        self.assertEqual(len(buffer), 100)
+        self.assertEqual(buffer.channels, 2)
+        self.assertEqual(buffer.sample_width, 2)
+        self.assertFalse(buffer.samples.flags.owndata)
+
+    def test_window_is_a_view(self):
+        buffer = PcmBuffer.from_segment(_segment(1000))
+
+        window = buffer.window(0.25, 0.5)
+
+        self.assertEqual(len(window), 250)
+        self.assertTrue(np.shares_memory(window.samples, buffer.samples))
+        self.assertEqual(window.samples[0, 0], 500)
+
+    def test_concatenate(self):
+        buffer = PcmBuffer.from_segment(_segment(1000))
+        pieces = [buffer.window(0.0, 0.1), buffer.window(0.5, 0.6)]
+
+        out = PcmBuffer.concatenate(pieces)
+
+        self.assertEqual(len(out), 200)
+        np.testing.assert_array_equal(out.samples[:100], buffer.samples[:100])
+        np.testing.assert_array_equal(out.samples[100:], buffer.samples[500:600])
+
+    def test_concatenate_empty(self):
+        with self.assertRaises(ValueError):
+            PcmBuffer.concatenate([])
+
+    def test_to_segment_round_trip(self):
+        segment = _segment(100)
+        buffer = PcmBuffer.from_segment(segment)
+
+        out = buffer.window(0.0, 0.05).to_segment()
+
+        self.assertEqual(out.frame_count(), 50)
+        self.assertEqual(out.channels, 2)
+        self.assertEqual(bytes(out.raw_data), segment.raw_data[:200])
@@ -0,0 +1,114 @@
+import tempfile
+import threading
+from pathlib import Path
+from unittest import TestCase
+from unittest.mock import patch
+
+from ad_begone.pipeline import Episode, Stage, StageLimits, run_pipeline
+
+
+def _fake_split(file_name, upload_bitrate_kbps=None, run_id=None):
+    path = Path(file_name)
+    part = path.parent / f"part_0_{run_id}_{path.name}"
+    part.touch()
+    return [str(part)]
+
+
+def _episodes(tmpdir, names):
+    paths = [Path(tmpdir) / name for name in names]
+    for path in paths:
+        path.touch()
+    return [str(path) for path in paths]
+
+
+class TestStage(TestCase):
+
+    def test_failing_cleanup_does_not_stall_the_pipeline(self):
+        def _fail(episode):
+            raise RuntimeError("API error")
+
+        def _cleanup(episode):
+            raise OSError("cannot remove part")
+
+        first = Stage("first", _fail, workers=2, queue_size=2)
+        second = Stage("second", lambda episode: episode, workers=1, queue_size=2)
+        first.next_stage = second
+        first.on_failure = _cleanup
+        first.start()
+        second.start()
+
+        for name in ("a.mp3", "b.mp3", "c.mp3"):
+            first.inbox.put(Episode(file_name=name))
+        first.stop()
+        for stage in (first, second):
+            for thread in stage._threads:
+                thread.join(timeout=5)
+                self.assertFalse(thread.is_alive())
+
+        self.assertEqual(first.failed, 3)
+
+
+@patch("ad_begone.pipeline.join_files")
+@patch("ad_begone.ad_trimmer._remove_ads", return_value=[])
+@patch("ad_begone.ad_trimmer.cached_annotate_transcription")
+@patch("ad_begone.ad_trimmer.cached_transcription")
+@patch("ad_begone.pipeline.split_file", side_effect=_fake_split)
+class TestRunPipeline(TestCase):
+
+    def test_processes_all_episodes(self, mock_split, mock_transcribe, mock_annotate, mock_remove_ads, mock_join):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            files = _episodes(tmpdir, [f"ep{i}.mp3" for i in range(5)])
+
+            done, failed = run_pipeline(files, limits=StageLimits(trim=2), queue_size=1)
+
+            self.assertEqual(sorted(r.file_name for r in done), files)
+            self.assertEqual(failed, [])
+            self.assertEqual(mock_transcribe.call_count, 5)
+            self.assertEqual(mock_annotate.call_count, 5)
+            self.assertEqual(mock_join.call_count, 5)
+            for file_name in files:
+                self.assertTrue((Path(tmpdir) / f".hit.{Path(file_name).name}.txt").exists())
+
+    def test_failure_does_not_stop_other_episodes(self, mock_split, mock_transcribe, mock_annotate, mock_remove_ads, mock_join):
+        def _transcribe(file_name, **kwargs):
+            if "bad" in file_name:
+                raise RuntimeError("API error")
+
+        mock_transcribe.side_effect = _transcribe
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            files = _episodes(tmpdir, ["bad.mp3", "good.mp3"])
+
+            done, failed = run_pipeline(files)
+
+            self.assertEqual([r.file_name for r in done], [files[1]])
+            self.assertEqual([(fn, repr(error)) for fn, error in failed], [(files[0], "RuntimeError('API error')")])
+            self.assertEqual(list(Path(tmpdir).glob("part_*_bad.mp3")), [])
+            self.assertFalse((Path(tmpdir) / ".hit.bad.mp3.txt").exists())
+
+    def test_stages_overlap_across_episodes(self, mock_split, mock_transcribe, mock_annotate, mock_remove_ads, mock_join):
+        first_trim_started = threading.Event()
+        second_transcribed = threading.Event()
+
+        def _transcribe(file_name, **kwargs):
+            if "ep1" in file_name:
+                self.assertTrue(first_trim_started.wait(5))
+                second_transcribed.set()
+
+        def _trim(**kwargs):
+            if not first_trim_started.is_set():
+                first_trim_started.set()
+                # Episode 1 can only transcribe while episode 0 is still trimming.
+                self.assertTrue(second_transcribed.wait(5))
+            return []
+
+        mock_transcribe.side_effect = _transcribe
+        mock_remove_ads.side_effect = _trim
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            files = _episodes(tmpdir, [f"ep{i}.mp3" for i in range(2)])
+
+            done, failed = run_pipeline(files, limits=StageLimits(trim=1))
+
+            self.assertEqual(sorted(r.file_name for r in done), files)
+            self.assertTrue(second_transcribed.is_set())
@@ -0,0 +1,75 @@
+from unittest import TestCase
+
+import numpy as np
+
+from ad_begone.prefilter import (
+    candidate_mask,
+    candidate_regions,
+    mask_to_regions,
+    prefilter_report,
+    score_lines,
+)
+
+from .conftest import FIXTURES_DIR
+
+
+class TestScoreLines(TestCase):
+
+    def test_empty(self):
+        self.assertEqual(score_lines([]).shape, (0,))
+
+    def test_sponsor_phrases_score_higher(self):
+        scores = score_lines([
+            "We talked about geology.",
+            "",
+            "",
+            "This episode is brought to you by Acme. Use code PODCAST at acme dot com.",
+            "",
+            "",
+            "Back to the rocks.",
+        ])
+        self.assertEqual(scores[0], 0.0)
+        self.assertEqual(int(np.argmax(scores)), 3)
+        # Neighbours get half of the line's score.
+        self.assertEqual(scores[2], scores[3] / 2)
+
+    def test_case_insensitive(self):
+        self.assertGreater(score_lines(["SPONSORED BY ACME"])[0], 0.0)
+
+    def test_shorter_than_smoothing(self):
+        scores = score_lines(["use code FOO at x dot com"])
+        self.assertEqual(scores.shape, (1,))
+        self.assertGreater(scores[0], 0.0)
+
+
+class TestCandidateRegions(TestCase):
+
+    def test_padding(self):
+        mask = candidate_mask(np.array([0, 0, 0, 0, 5, 0, 0, 0, 0, 0.0]), threshold=1, padding=2)
+        self.assertEqual(mask_to_regions(mask), [(2, 7)])
+
+    def test_no_padding(self):
+        mask = candidate_mask(np.array([5, 0, 5.0]), threshold=1, padding=0)
+        self.assertEqual(mask_to_regions(mask), [(0, 1), (2, 3)])
+
+    def test_padding_merges_nearby_candidates(self):
+        mask = candidate_mask(np.array([0, 5, 0, 0, 5, 0, 0, 0, 0.0]), threshold=1, padding=1)
+        self.assertEqual(mask_to_regions(mask), [(0, 6)])
+
+    def test_shorter_than_padding(self):
+        lines = ["Hello.", "Welcome back.", "", "Use code FOO at x dot com."]
+        self.assertEqual(candidate_regions(lines), [(0, 4)])
+
+    def test_no_candidates(self):
+        self.assertEqual(candidate_regions(["Just a story.", "Nothing to sell."]), [])
+
+
+class TestPrefilterReport(TestCase):
+
+    def test_fixtures_keep_all_ads_and_save_tokens(self):
+        rows = prefilter_report(str(FIXTURES_DIR))
+        self.assertTrue(rows)
+        for name, saved, recall in rows:
+            with self.subTest(fixture=name):
+                self.assertEqual(recall, 1.0)
+                self.assertGreater(saved, 0.25)
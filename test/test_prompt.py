@@ -0,0 +1,79 @@
+from unittest import TestCase
+from unittest.mock import Mock
+
+from openai.types.audio.transcription_verbose import TranscriptionVerbose
+
+from ad_begone.models import SegmentAnnotation
+from ad_begone.prompt import encode_transcript, token_report
+
+from .conftest import FIXTURES_DIR
+
+
+def _transcription(*texts: str) -> Mock:
+    transcription = Mock(spec=TranscriptionVerbose)
+    transcription.segments = [Mock(text=text) for text in texts]
+    return transcription
+
+
+class TestEncodeTranscript(TestCase):
+
+    def test_segment_encoding(self):
+        encoded = encode_transcript(_transcription(" Hello.", " World. "))
+        self.assertEqual(encoded.text, "Segment 0: Hello.\nSegment 1: World.\n")
+        self.assertEqual(encoded.line_segments, [0, 1])
+
+    def test_compact_encoding(self):
+        encoded = encode_transcript(_transcription(" Hello.", " World. "), "compact")
+        self.assertEqual(encoded.text, "[0] Hello.\n[1] World.\n")
+
+    def test_text_is_stripped(self):
+        # Leading whitespace used to be kept, giving "Segment 0:  Hello."
+        encoded = encode_transcript(_transcription("  Hello.  "))
+        self.assertEqual(encoded.text, "Segment 0: Hello.\n")
+
+    def test_blocks_merge_short_segments(self):
+        encoded = encode_transcript(
+            _transcription("one two", "three", "four five six", "seven", "eight nine"),
+            "blocks",
+            min_block_words=3,
+        )
+        self.assertEqual(encoded.text, "[0] one two three\n[1] four five six\n[2] seven eight nine\n")
+        self.assertEqual(encoded.line_segments, [0, 2, 3])
+
+    def test_blocks_map_back_to_segments(self):
+        encoded = encode_transcript(
+            _transcription("one two", "three", "four five six", "seven", "eight nine"),
+            "blocks",
+            min_block_words=3,
+        )
+        annotations = [
+            SegmentAnnotation(segment_type="content", segment_index=0),
+            SegmentAnnotation(segment_type="ad", segment_index=2),
+            SegmentAnnotation(segment_type="content", segment_index=7),
+        ]
+        self.assertEqual(
+            encoded.to_segment_annotations(annotations),
+            [
+                SegmentAnnotation(segment_type="content", segment_index=0),
+                SegmentAnnotation(segment_type="ad", segment_index=3),
+            ],
+        )
+
+    def test_user_prompt_slices_lines(self):
+        encoded = encode_transcript(_transcription("a", "b", "c"), "compact")
+        self.assertTrue(encoded.user_prompt(1, 2).endswith(":\n[1] b\n"))
+
+    def test_unknown_encoding(self):
+        with self.assertRaises(ValueError):
+            encode_transcript(_transcription("a"), "xml")
+
+
+class TestTokenReport(TestCase):
+
+    def test_compact_encodings_save_tokens(self):
+        rows = token_report(str(FIXTURES_DIR))
+        self.assertTrue(rows)
+        tokens = {(name, encoding): count for name, encoding, count, _ in rows}
+        for name in {name for name, *_ in rows}:
+            self.assertLess(tokens[name, "compact"], tokens[name, "segment"])
+            self.assertLessEqual(tokens[name, "blocks"], tokens[name, "compact"])
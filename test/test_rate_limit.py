@@ -0,0 +1,161 @@
+import os
+from unittest import TestCase
+from unittest.mock import Mock, patch
+
+from openai import APIConnectionError, RateLimitError
+
+from ad_begone import rate_limit
+from ad_begone.rate_limit import AimdLimiter, RateLimiter, TokenBucket, retry_after
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def _error(cls, headers=None):
+    error = cls.__new__(cls)
+    error.response = Mock(headers=headers or {})
+    return error
+
+
+class TestTokenBucket(TestCase):
+
+    def test_bursts_up_to_capacity_then_waits(self):
+        clock = FakeClock()
+        bucket = TokenBucket(60, capacity=2, clock=clock, sleep=clock.sleep)
+
+        bucket.acquire()
+        bucket.acquire()
+        self.assertEqual(clock.sleeps, [])
+
+        bucket.acquire()
+        self.assertAlmostEqual(sum(clock.sleeps), 1.0)
+
+    def test_large_requests_are_clamped_to_capacity(self):
+        clock = FakeClock()
+        bucket = TokenBucket(600, capacity=100, clock=clock, sleep=clock.sleep)
+
+        self.assertEqual(bucket.try_acquire(1000), 0.0)
+        self.assertAlmostEqual(bucket.try_acquire(50), 5.0)
+
+
+class TestAimdLimiter(TestCase):
+
+    def test_throttle_halves_limit(self):
+        limiter = AimdLimiter(initial=8)
+        limiter.on_throttle()
+        self.assertEqual(limiter.limit, 4)
+        for _ in range(10):
+            limiter.on_throttle()
+        self.assertEqual(limiter.limit, 1)
+
+    def test_success_increases_limit_additively(self):
+        limiter = AimdLimiter(initial=4, maximum=5)
+        for _ in range(4):
+            limiter.on_success(0.1)
+        self.assertEqual(limiter.limit, 4)
+        for _ in range(20):
+            limiter.on_success(0.1)
+        self.assertEqual(limiter.limit, 5)
+
+    def test_slow_calls_decrease_limit(self):
+        limiter = AimdLimiter(initial=8, latency_target=1.0)
+        limiter.on_success(5.0)
+        self.assertEqual(limiter.limit, 4)
+
+
+class TestRetryAfter(TestCase):
+
+    def test_seconds(self):
+        self.assertEqual(retry_after(_error(RateLimitError, {"retry-after": "3"})), 3.0)
+
+    def test_milliseconds_take_precedence(self):
+        error = _error(RateLimitError, {"retry-after": "3", "retry-after-ms": "1500"})
+        self.assertEqual(retry_after(error), 1.5)
+
+    def test_missing(self):
+        self.assertIsNone(retry_after(_error(RateLimitError)))
+        self.assertIsNone(retry_after(ValueError()))
+
+
+class TestRateLimiter(TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def _limiter(self, **kwargs):
+        return RateLimiter(600, clock=self.clock, sleep=self.clock.sleep, **kwargs)
+
+    def test_returns_result(self):
+        self.assertEqual(self._limiter().call(lambda: 42), 42)
+
+    def test_honours_retry_after_on_429(self):
+        fn = Mock(side_effect=[_error(RateLimitError, {"retry-after": "7"}), "ok"])
+        limiter = self._limiter(concurrency=AimdLimiter(initial=8))
+
+        self.assertEqual(limiter.call(fn), "ok")
+        self.assertEqual(fn.call_count, 2)
+        self.assertIn(7.0, self.clock.sleeps)
+        self.assertEqual(limiter.concurrency.limit, 4)
+
+    def test_retries_connection_errors_with_backoff(self):
+        fn = Mock(side_effect=[_error(APIConnectionError), _error(APIConnectionError), "ok"])
+
+        self.assertEqual(self._limiter(backoff_base=1.0).call(fn), "ok")
+        self.assertEqual(fn.call_count, 3)
+        self.assertEqual(len(self.clock.sleeps), 2)
+
+    def test_gives_up_after_max_retries(self):
+        fn = Mock(side_effect=_error(RateLimitError, {"retry-after": "1"}))
+
+        with self.assertRaises(RateLimitError):
+            self._limiter(max_retries=2).call(fn)
+        self.assertEqual(fn.call_count, 3)
+
+    def test_other_errors_are_not_retried(self):
+        fn = Mock(side_effect=ValueError("bad request"))
+
+        with self.assertRaises(ValueError):
+            self._limiter().call(fn)
+        self.assertEqual(fn.call_count, 1)
+
+    def test_token_bucket_limits_large_prompts(self):
+        limiter = RateLimiter(
+            600, tokens_per_minute=1000, clock=self.clock, sleep=self.clock.sleep
+        )
+
+        limiter.call(lambda: None, tokens=1000)
+        limiter.call(lambda: None, tokens=500)
+
+        self.assertAlmostEqual(sum(self.clock.sleeps), 30.0)
+
+
+class TestGetRateLimiter(TestCase):
+
+    def setUp(self):
+        rate_limit._LIMITERS.clear()
+        self.addCleanup(rate_limit._LIMITERS.clear)
+
+    def test_latency_targets(self):
+        with patch.dict(os.environ, {"OPENAI_CHAT_LATENCY_TARGET": "", "OPENAI_TRANSCRIPTION_LATENCY_TARGET": "90"}):
+            chat = rate_limit.get_rate_limiter("chat")
+            transcription = rate_limit.get_rate_limiter("transcription")
+
+        self.assertEqual(chat.concurrency.latency_target, rate_limit.DEFAULT_LATENCY_TARGETS["chat"])
+        self.assertEqual(transcription.concurrency.latency_target, 90.0)
+
+    def test_zero_limits_are_rejected(self):
+        for name in ("OPENAI_CHAT_RPM", "OPENAI_CHAT_TPM", "OPENAI_MAX_CONCURRENCY", "OPENAI_CHAT_LATENCY_TARGET"):
+            with self.subTest(name=name), patch.dict(os.environ, {name: "0"}):
+                with self.assertRaises(ValueError):
+                    rate_limit.get_rate_limiter("chat")
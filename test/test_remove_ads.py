@@ -1,9 +1,12 @@
 import tempfile
+import threading
 from pathlib import Path
 from unittest import TestCase
-from unittest.mock import Mock, patch
+from unittest.mock import ANY, Mock, patch
 
+from ad_begone.models import Window
 from ad_begone.remove_ads import remove_ads
+from ad_begone.utils import UPLOAD_BITRATE_KBPS
 
 
 class TestRemoveAds(TestCase):
@@ -20,13 +23,16 @@ class TestRemoveAds(TestCase):
             mock_split.return_value = [str(tmpdir_path / "part_0_test.mp3")]
             mock_trimmer = Mock()
             mock_trimmer_class.return_value = mock_trimmer
+            mock_trimmer.remove_ads.return_value = []
 
             remove_ads(str(test_file))
 
-            mock_split.assert_called_once_with(str(test_file))
+            mock_split.assert_called_once_with(
+                str(test_file), upload_bitrate_kbps=UPLOAD_BITRATE_KBPS, run_id=ANY
+            )
             mock_trimmer_class.assert_called_once()
             mock_trimmer.remove_ads.assert_called_once()
-            mock_join.assert_called_once_with(str(test_file))
+            mock_join.assert_called_once_with(str(test_file), file_parts=mock_split.return_value)
 
     @patch("ad_begone.remove_ads.join_files")
     @patch("ad_begone.remove_ads.AdTrimmer")
@@ -39,7 +45,7 @@ class TestRemoveAds(TestCase):
             hit_file = tmpdir_path / ".hit.test.mp3.txt"
 
             mock_split.return_value = [str(tmpdir_path / "part_0_test.mp3")]
-            mock_trimmer_class.return_value = Mock()
+            mock_trimmer_class.return_value.remove_ads.return_value = []
 
             remove_ads(str(test_file))
 
@@ -75,7 +81,7 @@ class TestRemoveAds(TestCase):
             hit_file.touch()
 
             mock_split.return_value = [str(tmpdir_path / "part_0_test.mp3")]
-            mock_trimmer_class.return_value = Mock()
+            mock_trimmer_class.return_value.remove_ads.return_value = []
 
             remove_ads(str(test_file), overwrite=True)
 
@@ -95,12 +101,14 @@ class TestRemoveAds(TestCase):
             test_file.touch()
 
             mock_split.return_value = [str(tmpdir_path / "part_0_test.mp3")]
-            mock_trimmer_class.return_value = Mock()
+            mock_trimmer_class.return_value.remove_ads.return_value = []
 
             remove_ads(str(test_file), out_name=str(output_file))
 
-            mock_split.assert_called_once_with(str(test_file))
-            mock_join.assert_called_once_with(str(test_file))
+            mock_split.assert_called_once_with(
+                str(test_file), upload_bitrate_kbps=UPLOAD_BITRATE_KBPS, run_id=ANY
+            )
+            mock_join.assert_called_once_with(str(test_file), file_parts=mock_split.return_value)
 
     @patch("ad_begone.remove_ads.join_files")
     @patch("ad_begone.remove_ads.AdTrimmer")
@@ -119,6 +127,7 @@ class TestRemoveAds(TestCase):
             ]
             mock_trimmer = Mock()
             mock_trimmer_class.return_value = mock_trimmer
+            mock_trimmer.remove_ads.return_value = []
 
             remove_ads(str(test_file))
 
@@ -138,8 +147,97 @@ class TestRemoveAds(TestCase):
             mock_split.return_value = [str(tmpdir_path / "part_0_test.mp3")]
             mock_trimmer = Mock()
             mock_trimmer_class.return_value = mock_trimmer
+            mock_trimmer.remove_ads.return_value = []
 
             custom_notif = "custom_notif.mp3"
             remove_ads(str(test_file), notif_name=custom_notif)
 
             mock_trimmer.remove_ads.assert_called_once_with(notif_name=custom_notif)
+
+    @patch("ad_begone.remove_ads.join_files")
+    @patch("ad_begone.remove_ads.AdTrimmer")
+    @patch("ad_begone.remove_ads.split_file")
+    def test_remove_ads_parts_run_concurrently(self, mock_split, mock_trimmer_class, mock_join):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmpdir_path = Path(tmpdir)
+            test_file = tmpdir_path / "test.mp3"
+            test_file.touch()
+
+            mock_split.return_value = [str(tmpdir_path / f"part_{i}_test.mp3") for i in range(3)]
+            # Every part waits for the others, so this only finishes if all three run at once.
+            barrier = threading.Barrier(3, timeout=5)
+
+            def _wait_for_all(**kwargs):
+                barrier.wait()
+                return []
+
+            mock_trimmer_class.return_value.remove_ads.side_effect = _wait_for_all
+
+            remove_ads(str(test_file), part_workers=3)
+
+            self.assertEqual(mock_trimmer_class.return_value.remove_ads.call_count, 3)
+            mock_join.assert_called_once_with(str(test_file), file_parts=mock_split.return_value)
+
+    @patch("ad_begone.remove_ads.join_files")
+    @patch("ad_begone.remove_ads.AdTrimmer")
+    @patch("ad_begone.remove_ads.split_file")
+    def test_remove_ads_part_failure_skips_join(self, mock_split, mock_trimmer_class, mock_join):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmpdir_path = Path(tmpdir)
+            test_file = tmpdir_path / "test.mp3"
+            test_file.touch()
+
+            mock_split.return_value = [str(tmpdir_path / f"part_{i}_test.mp3") for i in range(2)]
+            mock_trimmer_class.return_value.remove_ads.side_effect = RuntimeError("API error")
+
+            with self.assertRaises(RuntimeError):
+                remove_ads(str(test_file), part_workers=2)
+
+            mock_join.assert_not_called()
+            self.assertFalse((tmpdir_path / ".hit.test.mp3.txt").exists())
+
+    @patch("ad_begone.remove_ads.join_files")
+    @patch("ad_begone.remove_ads.AdTrimmer")
+    @patch("ad_begone.remove_ads.split_file")
+    def test_remove_ads_reuses_run_id_on_retry(self, mock_split, mock_trimmer_class, mock_join):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            test_file = Path(tmpdir) / "test.mp3"
+            test_file.write_bytes(b"episode")
+            other_file = Path(tmpdir) / "other.mp3"
+            other_file.write_bytes(b"episode")
+            mock_split.return_value = [str(Path(tmpdir) / "part_0_test.mp3")]
+
+            remove_ads(str(test_file), overwrite=True)
+            remove_ads(str(test_file), overwrite=True)
+            remove_ads(str(other_file), overwrite=True)
+            test_file.write_bytes(b"trimmed")
+            remove_ads(str(test_file), overwrite=True)
+
+            run_ids = [call.kwargs["run_id"] for call in mock_split.call_args_list]
+            # A retry finds the parts and sidecars of the earlier attempt.
+            self.assertEqual(run_ids[0], run_ids[1])
+            self.assertNotEqual(run_ids[0], run_ids[2])
+            self.assertNotEqual(run_ids[0], run_ids[3])
+            self.assertRegex(run_ids[0], "^[0-9a-f]{8}$")
+
+    @patch("ad_begone.remove_ads.join_files")
+    @patch("ad_begone.remove_ads.AdTrimmer")
+    @patch("ad_begone.remove_ads.split_file")
+    def test_remove_ads_returns_result(self, mock_split, mock_trimmer_class, mock_join):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmpdir_path = Path(tmpdir)
+            test_file = tmpdir_path / "test.mp3"
+            test_file.touch()
+
+            mock_split.return_value = [str(tmpdir_path / f"part_{i}_test.mp3") for i in range(2)]
+            mock_trimmer_class.return_value.remove_ads.return_value = [
+                Window(0.0, 10.0, "content"),
+                Window(10.0, 40.0, "ad"),
+            ]
+
+            result = remove_ads(str(test_file), model="gpt-test", hit_marker=False)
+
+            self.assertEqual(result.file_name, str(test_file))
+            self.assertEqual(result.ad_seconds, 60.0)
+            self.assertEqual(result.model, "gpt-test")
+            self.assertFalse((tmpdir_path / ".hit.test.mp3.txt").exists())
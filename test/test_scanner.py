@@ -0,0 +1,92 @@
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from unittest import TestCase
+
+from ad_begone.scanner import LibraryScanner
+
+
+def _age(path: Path, seconds: float = 60.0) -> None:
+    """Backdate a directory so its mtime is outside the racy window."""
+    then = time.time() - seconds
+    os.utime(path, (then, then))
+
+
+class TestLibraryScanner(TestCase):
+
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.root = Path(self._tmpdir.name)
+        for feed in ("feed_a", "feed_b", "feed_b/season_1"):
+            (self.root / feed).mkdir()
+        (self.root / "feed_a" / "ep1.mp3").touch()
+        (self.root / "feed_a" / "notes.txt").touch()
+        (self.root / "feed_b" / "season_1" / "ep2.mp3").touch()
+        for directory in (self.root / "feed_b" / "season_1", self.root / "feed_b", self.root / "feed_a", self.root):
+            _age(directory)
+
+    def tearDown(self):
+        self._tmpdir.cleanup()
+
+    def test_first_scan_lists_everything(self):
+        scan = LibraryScanner(str(self.root), workers=2).scan()
+
+        expected = [self.root / "feed_a" / "ep1.mp3", self.root / "feed_b" / "season_1" / "ep2.mp3"]
+        self.assertEqual(sorted(scan.files), expected)
+        self.assertEqual(sorted(scan.changed), expected)
+        self.assertEqual(scan.stats.directories, 4)
+        self.assertEqual(scan.stats.listed, 4)
+        # root: 2 dirs, feed_a: 2 files, feed_b: 1 dir, season_1: 1 file
+        self.assertEqual(scan.stats.entries, 6)
+
+    def test_unchanged_directories_are_not_listed_again(self):
+        scanner = LibraryScanner(str(self.root))
+        scanner.scan()
+
+        scan = scanner.scan()
+
+        self.assertEqual(len(scan.files), 2)
+        self.assertEqual(scan.changed, [])
+        self.assertEqual(scan.stats.directories, 4)
+        self.assertEqual(scan.stats.listed, 0)
+        self.assertEqual(scan.stats.entries, 0)
+
+    def test_only_changed_directory_is_listed(self):
+        scanner = LibraryScanner(str(self.root))
+        scanner.scan()
+
+        new = self.root / "feed_b" / "season_1" / "ep3.mp3"
+        new.touch()
+        _age(new.parent, 10)
+        scan = scanner.scan()
+
+        self.assertEqual(len(scan.files), 3)
+        self.assertEqual(sorted(scan.changed), [self.root / "feed_b" / "season_1" / "ep2.mp3", new])
+        self.assertEqual(scan.stats.listed, 1)
+
+    def test_new_and_removed_directories(self):
+        scanner = LibraryScanner(str(self.root))
+        scanner.scan()
+
+        shutil.rmtree(self.root / "feed_a")
+        (self.root / "feed_c").mkdir()
+        (self.root / "feed_c" / "ep4.mp3").touch()
+        scan = scanner.scan()
+
+        self.assertEqual(
+            sorted(scan.files),
+            [self.root / "feed_b" / "season_1" / "ep2.mp3", self.root / "feed_c" / "ep4.mp3"],
+        )
+        self.assertEqual(scan.changed, [self.root / "feed_c" / "ep4.mp3"])
+
+    def test_recently_changed_directory_is_listed_again(self):
+        scanner = LibraryScanner(str(self.root))
+        (self.root / "feed_a" / "ep5.mp3").touch()
+        scanner.scan()
+
+        scan = scanner.scan()
+
+        # feed_a changed within the racy window, so it cannot be trusted yet.
+        self.assertEqual(scan.stats.listed, 1)
@@ -0,0 +1,109 @@
+import os
+import random
+import tempfile
+from unittest import TestCase
+
+from ad_begone.shingles import BANDS, ShingleIndex, band_keys, minhash, words
+
+AD = (
+    "This episode is brought to you by Fernwood Coffee Roasters. Tired of bland, "
+    "mass-produced coffee? Fernwood sources single-origin beans from small farms "
+    "across Central America and roasts them fresh every week. Use code ECHOES at "
+    "fernwoodcoffee dot com for fifteen percent off your first bag. Fernwood "
+    "Coffee, taste the difference."
+)
+
+
+def _random_text(rng: random.Random, n_words: int) -> str:
+    return " ".join(f"word{rng.randrange(5000)}" for _ in range(n_words))
+
+
+def _segments(text: str, rng: random.Random) -> list[str]:
+    tokens = text.split()
+    segments = []
+    while tokens:
+        n = rng.randint(6, 14)
+        # Whisper rarely leaves a word or two on their own.
+        if len(tokens) - n < 4:
+            n = len(tokens)
+        segments.append(" ".join(tokens[:n]))
+        tokens = tokens[n:]
+    return segments
+
+
+class TestMinHash(TestCase):
+
+    def test_similar_texts_share_bands(self):
+        a = band_keys(minhash(words(AD)))
+        b = band_keys(minhash(words(AD.replace("every week", "each week"))))
+        c = band_keys(minhash(words(_random_text(random.Random(0), 50))))
+        self.assertEqual(len(a), BANDS)
+        self.assertGreater(len(set(a) & set(b)), len(set(a) & set(c)))
+        self.assertEqual(set(a) & set(c), set())
+
+    def test_words_are_normalised(self):
+        self.assertEqual(words("Use CODE: Echoes!"), ["use", "code", "echoes"])
+
+
+class TestShingleIndex(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.index = ShingleIndex(os.path.join(self.tmpdir.name, "shingles.sqlite3"))
+        self.rng = random.Random(1)
+
+    def tearDown(self):
+        self.index.close()
+        self.tmpdir.cleanup()
+
+    def _episode(self, ad: str) -> tuple[list[str], set[int]]:
+        before = [_random_text(self.rng, 10) for _ in range(8)]
+        ad_segments = _segments(ad, self.rng)
+        after = [_random_text(self.rng, 10) for _ in range(8)]
+        return before + ad_segments + after, set(range(len(before), len(before) + len(ad_segments)))
+
+    def test_recognises_ad_with_new_segmentation(self):
+        self.index.add(AD, source="first.mp3")
+        texts, expected = self._episode(AD)
+        self.assertEqual(self.index.known_segments(texts), expected)
+
+    def test_reworded_ad_never_spills_into_content(self):
+        self.index.add(AD)
+        texts, expected = self._episode(AD.replace("every week", "each week"))
+        known = self.index.known_segments(texts)
+        # The segments with the changed words may be left to the model.
+        self.assertLessEqual(known, expected)
+        self.assertGreaterEqual(len(known), len(expected) - 2)
+
+    def test_unrelated_transcript(self):
+        self.index.add(AD)
+        texts, _ = self._episode(_random_text(self.rng, 60))
+        self.assertEqual(self.index.known_segments(texts), set())
+
+    def test_finds_ad_among_many(self):
+        for _ in range(300):
+            self.index.add(_random_text(self.rng, 80))
+        self.index.add(AD)
+        self.assertEqual(len(self.index), 301)
+
+        texts, expected = self._episode(AD)
+        self.assertEqual(self.index.known_segments(texts), expected)
+
+    def test_remove(self):
+        bad = self.index.add(AD, source="intro.mp3")
+        other = _random_text(self.rng, 60)
+        self.index.add(other, source="ad.mp3")
+
+        self.assertTrue(self.index.remove(bad))
+        self.assertFalse(self.index.remove(bad))
+
+        self.assertEqual([entry[1] for entry in self.index.entries()], ["ad.mp3"])
+        texts, _ = self._episode(AD)
+        self.assertEqual(self.index.known_segments(texts), set())
+        texts, expected = self._episode(other)
+        self.assertEqual(self.index.known_segments(texts), expected)
+
+    def test_short_text_is_not_indexed(self):
+        self.assertIsNone(self.index.add("Buy now"))
+        self.assertEqual(len(self.index), 0)
+        self.assertEqual(self.index.known_segments([]), set())
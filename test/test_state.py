@@ -0,0 +1,115 @@
+import os
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+
+from ad_begone.models import EpisodeResult
+from ad_begone.state import StateStore
+
+
+class TestStateStore(TestCase):
+
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.tmpdir = Path(self._tmpdir.name)
+        self.store = StateStore(str(self.tmpdir / "state.sqlite3"))
+
+    def tearDown(self):
+        self.store.close()
+        self._tmpdir.cleanup()
+
+    def _episode(self, name: str, content: bytes = b"audio") -> Path:
+        path = self.tmpdir / name
+        path.write_bytes(content)
+        return path
+
+    def test_new_files_are_pending(self):
+        a, b = self._episode("a.mp3"), self._episode("b.mp3")
+
+        self.store.observe([b, a])
+
+        self.assertEqual(self.store.pending(), [str(a), str(b)])
+
+    def test_done_files_are_not_pending(self):
+        a = self._episode("a.mp3")
+        self.store.observe([a])
+        self.store.mark_started(str(a))
+        a.write_bytes(b"trimmed")
+        self.store.mark_done(EpisodeResult(str(a), elapsed=1.0, ad_seconds=30.0, model="gpt-test"))
+
+        # The trimmed file is seen again on the next scan.
+        self.store.observe([a])
+
+        self.assertEqual(self.store.pending(), [])
+        self.assertEqual(self.store.status(str(a)), "done")
+
+    def test_changed_file_is_pending_again(self):
+        a = self._episode("a.mp3")
+        self.store.observe([a])
+        self.store.mark_done(EpisodeResult(str(a), elapsed=1.0, ad_seconds=0.0))
+
+        a.write_bytes(b"a new download")
+        self.store.observe([a])
+
+        self.assertEqual(self.store.pending(), [str(a)])
+
+    def test_overwrite_marks_done_files_pending(self):
+        a = self._episode("a.mp3")
+        self.store.observe([a])
+        self.store.mark_done(EpisodeResult(str(a), elapsed=1.0, ad_seconds=0.0))
+
+        self.store.observe([a], overwrite=True)
+
+        self.assertEqual(self.store.pending(), [str(a)])
+
+    def test_failed_files_are_retried_up_to_max_attempts(self):
+        a = self._episode("a.mp3")
+        self.store.observe([a])
+        for _ in range(self.store.max_attempts):
+            self.assertEqual(self.store.pending(), [str(a)])
+            self.store.mark_started(str(a))
+            self.store.mark_failed(str(a), "API error")
+
+        self.assertEqual(self.store.pending(), [])
+        self.assertEqual(self.store.status(str(a)), "failed")
+
+    def test_interrupted_files_are_pending_after_restart(self):
+        a = self._episode("a.mp3")
+        self.store.observe([a])
+        self.store.mark_started(str(a))
+        self.store.close()
+
+        self.store = StateStore(str(self.tmpdir / "state.sqlite3"))
+
+        self.assertEqual(self.store.pending(), [str(a)])
+
+    def test_queued_files_are_not_pending_after_restart(self):
+        a = self._episode("a.mp3")
+        self.store.observe([a])
+        self.store.mark_queued(str(a))
+        self.store.close()
+
+        self.store = StateStore(str(self.tmpdir / "state.sqlite3"))
+        self.store.observe([a])
+
+        self.assertEqual(self.store.pending(), [])
+        self.assertEqual(self.store.status(str(a)), "queued")
+
+    def test_vanished_files_are_forgotten(self):
+        a = self._episode("a.mp3")
+        self.store.observe([a])
+        os.remove(a)
+
+        self.assertEqual(self.store.pending(), [])
+        self.assertIsNone(self.store.status(str(a)))
+
+    def test_import_hit_markers_once(self):
+        a, b = self._episode("a.mp3"), self._episode("b.mp3")
+        (self.tmpdir / ".hit.a.mp3.txt").touch()
+        (self.tmpdir / ".hit.gone.mp3.txt").touch()
+
+        self.assertEqual(self.store.import_hit_markers(str(self.tmpdir)), 1)
+        self.store.observe([a, b])
+
+        self.assertEqual(self.store.pending(), [str(b)])
+        self.assertEqual(self.store.import_hit_markers(str(self.tmpdir)), 0)
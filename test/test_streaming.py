@@ -0,0 +1,81 @@
+import shutil
+import tempfile
+from pathlib import Path
+from unittest import TestCase, skipUnless
+
+from ad_begone.models import Window
+from ad_begone.mp3_frames import read_frame_index
+from ad_begone.notif_path import NOTIF_PATH
+from ad_begone.streaming import stream_trim, trim_pcm_stream
+
+# One byte per frame at 10 frames per second keeps the arithmetic readable.
+_RATE = 10
+
+
+def _collect(chunks, windows, notif=b"N"):
+    return b"".join(bytes(p) for p in trim_pcm_stream(chunks, windows, notif, _RATE, 1))
+
+
+def _chunked(data: bytes, size: int) -> list[bytes]:
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+class TestTrimPcmStream(TestCase):
+
+    def setUp(self):
+        self.pcm = bytes(range(100))
+        self.windows = [
+            Window(start=0.0, end=2.0, segment_type="content"),
+            Window(start=2.0, end=5.0, segment_type="ad"),
+            Window(start=5.0, end=10.0, segment_type="content"),
+        ]
+        self.expected = self.pcm[:20] + b"N" + self.pcm[50:]
+
+    def test_single_chunk(self):
+        self.assertEqual(_collect([self.pcm], self.windows), self.expected)
+
+    def test_chunk_boundaries_do_not_matter(self):
+        for size in (1, 3, 7, 20, 64):
+            with self.subTest(size=size):
+                self.assertEqual(_collect(_chunked(self.pcm, size), self.windows), self.expected)
+
+    def test_partial_frames_are_carried_over(self):
+        pcm = bytes(range(40))
+        windows = [Window(start=0.5, end=1.5, segment_type="content")]
+
+        out = b"".join(
+            bytes(p) for p in trim_pcm_stream(_chunked(pcm, 3), windows, b"", _RATE, 2)
+        )
+
+        self.assertEqual(out, pcm[10:30])
+
+    def test_gaps_between_windows_are_dropped(self):
+        windows = [
+            Window(start=1.0, end=2.0, segment_type="content"),
+            Window(start=3.0, end=4.0, segment_type="content"),
+        ]
+        self.assertEqual(_collect([self.pcm], windows), self.pcm[10:20] + self.pcm[30:40])
+
+    def test_trailing_ad_past_end_of_stream(self):
+        windows = [
+            Window(start=0.0, end=10.0, segment_type="content"),
+            Window(start=10.0, end=12.0, segment_type="ad"),
+        ]
+        self.assertEqual(_collect(_chunked(self.pcm, 30), windows), self.pcm + b"N")
+
+
+@skipUnless(shutil.which("ffmpeg"), "Requires ffmpeg")
+class TestStreamTrim(TestCase):
+
+    def test_stream_trim(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            out_name = str(Path(tmpdir) / "out.mp3")
+            windows = [
+                Window(start=0.0, end=10.0, segment_type="content"),
+                Window(start=10.0, end=60.0, segment_type="ad"),
+                Window(start=60.0, end=70.0, segment_type="content"),
+            ]
+
+            stream_trim("test/data/test.mp3", windows, out_name=out_name, notif_name=NOTIF_PATH)
+
+            self.assertAlmostEqual(read_frame_index(out_name).duration(), 21.0, delta=0.5)
@@ -0,0 +1,136 @@
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from types import ModuleType, SimpleNamespace
+from unittest import TestCase
+from unittest.mock import Mock, patch
+
+import numpy as np
+
+from ad_begone import utils
+from ad_begone.transcribers import TRANSCRIBER_ENV, LocalWhisperTranscriber, Transcriber, transcriber_name
+from ad_begone.utils import OpenAITranscriber, cached_transcription, get_transcriber
+
+
+def _fake_faster_whisper() -> ModuleType:
+    """A stand-in for faster_whisper whose model returns two fixed segments."""
+    module = ModuleType("faster_whisper")
+    segments = [
+        SimpleNamespace(
+            seek=0, start=0.0, end=2.5, text=" Hello and welcome.", tokens=[1, 2],
+            temperature=0.0, avg_logprob=-0.1, compression_ratio=1.2, no_speech_prob=0.01,
+        ),
+        SimpleNamespace(
+            seek=250, start=2.5, end=6.0, text=" This show is brought to you by Acme.", tokens=[3],
+            temperature=None, avg_logprob=-0.2, compression_ratio=1.3, no_speech_prob=0.02,
+        ),
+    ]
+    model = Mock()
+    model.transcribe.side_effect = lambda audio: (iter(segments), SimpleNamespace(duration=6.0, language="en"))
+    module.WhisperModel = Mock(return_value=model)
+    return module
+
+
+class TestTranscriberSelection(TestCase):
+
+    def tearDown(self):
+        utils._TRANSCRIBERS.clear()
+
+    def test_openai_by_default(self):
+        with patch.dict(os.environ, {TRANSCRIBER_ENV: ""}):
+            self.assertEqual(transcriber_name(), "openai")
+            self.assertIsInstance(get_transcriber(), OpenAITranscriber)
+
+    def test_local_from_environment(self):
+        with patch.dict(os.environ, {TRANSCRIBER_ENV: "local"}):
+            transcriber = get_transcriber()
+
+        self.assertIsInstance(transcriber, LocalWhisperTranscriber)
+        self.assertIs(get_transcriber("local"), transcriber)
+
+    def test_one_backend_per_process(self):
+        def _slow_init():
+            time.sleep(0.05)
+            return Mock(spec=LocalWhisperTranscriber)
+
+        with patch("ad_begone.utils.LocalWhisperTranscriber", side_effect=_slow_init) as init:
+            with ThreadPoolExecutor(max_workers=8) as pool:
+                transcribers = list(pool.map(lambda _: get_transcriber("local"), range(8)))
+
+        init.assert_called_once()
+        self.assertTrue(all(t is transcribers[0] for t in transcribers))
+
+    def test_backends_implement_transcribe(self):
+        with self.assertRaises(TypeError):
+            Transcriber()
+
+    def test_unknown_backend(self):
+        with patch.dict(os.environ, {TRANSCRIBER_ENV: "carrier-pigeon"}):
+            with self.assertRaises(ValueError):
+                transcriber_name()
+
+
+@patch("ad_begone.transcribers.read_pcm", return_value=np.zeros(16000, dtype=np.int16).tobytes())
+class TestLocalWhisperTranscriber(TestCase):
+
+    def setUp(self):
+        self.module = _fake_faster_whisper()
+        patcher = patch.dict(sys.modules, {"faster_whisper": self.module})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(LocalWhisperTranscriber._models.clear)
+
+    def test_segments_are_converted(self, mock_read_pcm):
+        transcription = LocalWhisperTranscriber("tiny").transcribe("episode.mp3")
+
+        self.assertEqual(transcription.duration, 6.0)
+        self.assertEqual(transcription.text, " Hello and welcome. This show is brought to you by Acme.")
+        self.assertEqual([s.id for s in transcription.segments], [0, 1])
+        self.assertEqual(transcription.segments[1].start, 2.5)
+        self.assertEqual(transcription.segments[1].temperature, 0.0)
+        audio = self.module.WhisperModel.return_value.transcribe.call_args[0][0]
+        self.assertEqual(audio.dtype, np.float32)
+        mock_read_pcm.assert_called_once_with("episode.mp3", 16000, 1)
+
+    def test_model_is_loaded_once_per_process(self, mock_read_pcm):
+        LocalWhisperTranscriber("tiny").transcribe("a.mp3")
+        LocalWhisperTranscriber("tiny").transcribe("b.mp3")
+
+        self.module.WhisperModel.assert_called_once_with("tiny", device="cpu", compute_type="int8")
+
+    def test_instances_share_the_model_lock(self, mock_read_pcm):
+        running = []
+        overlapped = []
+
+        def _transcribe(audio):
+            running.append(audio)
+            overlapped.append(len(running) > 1)
+            time.sleep(0.05)
+            running.pop()
+            return iter([]), Mock(duration=1.0, language="en")
+
+        self.module.WhisperModel.return_value.transcribe.side_effect = _transcribe
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            list(pool.map(lambda name: LocalWhisperTranscriber("tiny").transcribe(name), ["a.mp3", "b.mp3"]))
+
+        self.assertEqual(overlapped, [False, False])
+
+    def test_missing_dependency(self, mock_read_pcm):
+        with patch.dict(sys.modules, {"faster_whisper": None}):
+            with self.assertRaises(RuntimeError):
+                LocalWhisperTranscriber("tiny").transcribe("a.mp3")
+
+    def test_cached_transcription_uses_its_own_cache_key(self, mock_read_pcm):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            episode = Path(tmpdir) / "episode.mp3"
+            episode.write_bytes(b"audio")
+            with patch.dict(os.environ, {"AD_BEGONE_CACHE_DIR": str(Path(tmpdir) / "cache")}):
+                transcription = cached_transcription(str(episode), transcriber=LocalWhisperTranscriber("tiny"))
+                store = utils.get_artifact_store()
+                key = utils.artifact_key("transcription", "faster-whisper/tiny", utils.audio_digest(str(episode)))
+                self.assertIsNotNone(store.get("transcription", key))
+
+        self.assertEqual(len(transcription.segments), 2)
@@ -5,9 +5,14 @@ from unittest import TestCase
 from unittest.mock import MagicMock, Mock, mock_open, patch
 
 from openai.types.audio.transcription_verbose import TranscriptionVerbose
+from openai.types.chat.parsed_chat_completion import ParsedChatCompletion
+from openai.types.chat.parsed_function_tool_call import ParsedFunction, ParsedFunctionToolCall
 
 from ad_begone.models import SegmentAnnotation, Window
+from ad_begone.mp3_frames import read_frame_index
 from ad_begone.utils import (
+    UPLOAD_MAX_MB,
+    cached_annotate_transcription,
     cached_transcription,
     find_ad_time_windows,
     get_ordered_annotations,
@@ -16,6 +21,9 @@ from ad_begone.utils import (
     transcription_with_segment_indices,
 )
 
+# MPEG-1 Layer III, 128 kbps, 44.1 kHz, stereo: 417 bytes per frame.
+_MP3_FRAME = b"\xff\xfb\x90\x00" + b"\x01" * 413
+
 
 class TestCachedTranscription(TestCase):
 
@@ -38,6 +46,57 @@ class TestCachedTranscription(TestCase):
         mock_isfile.assert_called_once_with("test.json")
         mock_parse.assert_called_once()
 
+    @patch("ad_begone.utils._get_client")
+    @patch("ad_begone.utils.compact_mp3")
+    def test_uploads_compact_copy(self, mock_compact, mock_get_client):
+        mock_compact.return_value = b"compact"
+        mock_transcription = Mock()
+        mock_transcription.model_dump_json.return_value = "{}"
+        create = mock_get_client.return_value.audio.transcriptions.create
+        create.return_value = mock_transcription
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            test_file = Path(tmpdir) / "test.mp3"
+            test_file.write_bytes(b"original")
+
+            result = cached_transcription(str(test_file))
+
+            self.assertEqual(result, mock_transcription)
+            self.assertEqual(create.call_args[1]["file"], ("test.mp3", b"compact"))
+            self.assertTrue((Path(tmpdir) / "test.json").exists())
+
+    @patch("ad_begone.utils._get_client")
+    @patch("ad_begone.utils.compact_mp3")
+    def test_uploads_original_when_compact_copy_fails(self, mock_compact, mock_get_client):
+        mock_compact.side_effect = RuntimeError("ffmpeg failed")
+        mock_transcription = Mock()
+        mock_transcription.model_dump_json.return_value = "{}"
+        create = mock_get_client.return_value.audio.transcriptions.create
+        create.return_value = mock_transcription
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            test_file = Path(tmpdir) / "test.mp3"
+            test_file.write_bytes(b"original")
+
+            cached_transcription(str(test_file))
+
+            self.assertEqual(create.call_args[1]["file"].name, str(test_file))
+
+    @patch("ad_begone.utils._get_client")
+    @patch("ad_begone.utils.compact_mp3")
+    def test_oversized_original_is_not_uploaded(self, mock_compact, mock_get_client):
+        mock_compact.side_effect = RuntimeError("ffmpeg failed")
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            test_file = Path(tmpdir) / "test.mp3"
+            with open(test_file, "wb") as f:
+                f.truncate(int(UPLOAD_MAX_MB * 1024 * 1024) + 1)
+
+            with self.assertRaises(RuntimeError):
+                cached_transcription(str(test_file))
+
+        mock_get_client.return_value.audio.transcriptions.create.assert_not_called()
+
 
 class TestTranscriptionWithSegmentIndices(TestCase):
 
@@ -75,6 +134,206 @@ class TestTranscriptionWithSegmentIndices(TestCase):
         self.assertIn("Second segment", result)
 
 
+def _completion_with(annotations: list[SegmentAnnotation]) -> ParsedChatCompletion:
+    template = Path(__file__).parent / "data" / "test_annotation_completion.json"
+    completion = ParsedChatCompletion.model_validate_json(template.read_text())
+    completion.choices[0].message.tool_calls = [
+        ParsedFunctionToolCall(
+            id=f"call_{i}",
+            type="function",
+            function=ParsedFunction(
+                name="SegmentAnnotation",
+                arguments=ann.model_dump_json(),
+                parsed_arguments=ann,
+            ),
+        )
+        for i, ann in enumerate(annotations)
+    ]
+    return completion
+
+
+class TestCachedAnnotateTranscriptionChunked(TestCase):
+
+    def _transcription(self, n_segments: int) -> Mock:
+        transcription = Mock(spec=TranscriptionVerbose)
+        transcription.segments = [Mock(text=f"words of segment {i}") for i in range(n_segments)]
+        return transcription
+
+    @staticmethod
+    def _fake_annotate(encoded, model, file_name, start=0, end=None):
+        # Segments 8-12 are an ad; each chunk reports the block starts it sees.
+        end = len(encoded.lines) if end is None else end
+        annotations = []
+        for line in range(start, end):
+            label = "ad" if 8 <= encoded.line_segments[line] <= 12 else "content"
+            if not annotations or annotations[-1].segment_type != label:
+                annotations.append(SegmentAnnotation(segment_type=label, segment_index=line))
+        return _completion_with(annotations)
+
+    @patch("ad_begone.utils._annotate")
+    def test_long_transcript_is_annotated_in_chunks(self, mock_annotate):
+        mock_annotate.side_effect = self._fake_annotate
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache_file = Path(tmpdir) / "segments.json"
+            result = cached_annotate_transcription(
+                self._transcription(20),
+                file_name=str(cache_file),
+                model="gpt-test",
+                chunk_tokens=30,
+                overlap_tokens=10,
+            )
+            reloaded = ParsedChatCompletion.model_validate_json(cache_file.read_text())
+
+        self.assertGreater(mock_annotate.call_count, 2)
+        expected = [
+            SegmentAnnotation(segment_type="content", segment_index=0),
+            SegmentAnnotation(segment_type="ad", segment_index=8),
+            SegmentAnnotation(segment_type="content", segment_index=13),
+        ]
+        self.assertEqual(get_ordered_annotations(result), expected)
+        self.assertEqual(get_ordered_annotations(reloaded), expected)
+
+    @patch("ad_begone.utils._annotate")
+    def test_short_transcript_is_annotated_in_one_request(self, mock_annotate):
+        mock_annotate.side_effect = self._fake_annotate
+        transcription = self._transcription(20)
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cached_annotate_transcription(
+                transcription,
+                file_name=str(Path(tmpdir) / "segments.json"),
+                model="gpt-test",
+            )
+
+        mock_annotate.assert_called_once()
+        self.assertEqual(mock_annotate.call_args[0][0].text, transcription_with_segment_indices(transcription))
+
+    @patch("ad_begone.utils._annotate")
+    def test_block_indices_are_mapped_to_segments(self, mock_annotate):
+        mock_annotate.side_effect = self._fake_annotate
+        transcription = self._transcription(20)
+        # Six words per segment, so each block holds two segments.
+        for i, segment in enumerate(transcription.segments):
+            segment.text = f"these are the words of {i}"
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            result = cached_annotate_transcription(
+                transcription,
+                file_name=str(Path(tmpdir) / "segments.json"),
+                model="gpt-test",
+                encoding="blocks",
+            )
+
+        mock_annotate.assert_called_once()
+        self.assertTrue(mock_annotate.call_args[0][0].lines[0].startswith("[0] "))
+        self.assertEqual(
+            [ann.segment_index for ann in get_ordered_annotations(result)],
+            [0, 8, 14],
+        )
+
+
+class TestCachedAnnotateTranscriptionPrefilter(TestCase):
+
+    def _transcription(self, texts: list[str]) -> Mock:
+        transcription = Mock(spec=TranscriptionVerbose)
+        transcription.segments = [Mock(text=text) for text in texts]
+        return transcription
+
+    @patch("ad_begone.utils._annotate")
+    def test_only_candidate_regions_are_sent(self, mock_annotate):
+        mock_annotate.side_effect = TestCachedAnnotateTranscriptionChunked._fake_annotate
+        texts = [f"story line {i}" for i in range(20)]
+        texts[8] = "This episode is brought to you by Acme."
+        texts[10] = "Use code STORY at acme dot com."
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            result = cached_annotate_transcription(
+                self._transcription(texts),
+                file_name=str(Path(tmpdir) / "segments.json"),
+                model="gpt-test",
+                prefilter=True,
+            )
+
+        mock_annotate.assert_called_once()
+        kwargs = mock_annotate.call_args[1]
+        self.assertEqual((kwargs["start"], kwargs["end"]), (5, 15))
+        self.assertEqual(
+            get_ordered_annotations(result),
+            [
+                SegmentAnnotation(segment_type="content", segment_index=0),
+                SegmentAnnotation(segment_type="ad", segment_index=8),
+                SegmentAnnotation(segment_type="content", segment_index=13),
+            ],
+        )
+
+    @patch("ad_begone.utils._annotate")
+    def test_no_candidates_skips_the_model(self, mock_annotate):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache_file = Path(tmpdir) / "segments.json"
+            cached_annotate_transcription(
+                self._transcription(["Just a story.", "Nothing to sell."]),
+                file_name=str(cache_file),
+                model="gpt-test",
+                prefilter=True,
+            )
+            reloaded = ParsedChatCompletion.model_validate_json(cache_file.read_text())
+
+        mock_annotate.assert_not_called()
+        self.assertEqual(
+            get_ordered_annotations(reloaded),
+            [SegmentAnnotation(segment_type="content", segment_index=0)],
+        )
+
+
+class TestCachedAnnotateTranscriptionKnownAds(TestCase):
+
+    def _transcription(self, n_segments: int) -> Mock:
+        transcription = Mock(spec=TranscriptionVerbose)
+        transcription.segments = [Mock(text=f"words of segment {i}") for i in range(n_segments)]
+        return transcription
+
+    @patch("ad_begone.utils._annotate")
+    def test_known_ads_are_not_sent(self, mock_annotate):
+        mock_annotate.side_effect = TestCachedAnnotateTranscriptionChunked._fake_annotate
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            result = cached_annotate_transcription(
+                self._transcription(20),
+                file_name=str(Path(tmpdir) / "segments.json"),
+                model="gpt-test",
+                known_ad_segments={15, 16, 17},
+            )
+
+        self.assertEqual(
+            [(c[1]["start"], c[1]["end"]) for c in mock_annotate.call_args_list],
+            [(0, 15), (18, 20)],
+        )
+        self.assertEqual(
+            get_ordered_annotations(result),
+            [
+                SegmentAnnotation(segment_type="content", segment_index=0),
+                SegmentAnnotation(segment_type="ad", segment_index=8),
+                SegmentAnnotation(segment_type="content", segment_index=13),
+                SegmentAnnotation(segment_type="ad", segment_index=15),
+                SegmentAnnotation(segment_type="content", segment_index=18),
+            ],
+        )
+
+    @patch("ad_begone.utils._annotate")
+    def test_fully_known_transcript_skips_the_model(self, mock_annotate):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            result = cached_annotate_transcription(
+                self._transcription(3),
+                file_name=str(Path(tmpdir) / "segments.json"),
+                model="gpt-test",
+                known_ad_segments={0, 1, 2},
+            )
+
+        mock_annotate.assert_not_called()
+        self.assertEqual(get_ordered_annotations(result), [SegmentAnnotation(segment_type="ad", segment_index=0)])
+
+
 class TestGetOrderedAnnotations(TestCase):
 
     def test_empty_tool_calls(self):
@@ -253,6 +512,43 @@ class TestSplitFile(TestCase):
             # 60MB / 25MB = 2.4, should ceil to 3 parts
             self.assertEqual(len(result), 3)
 
+    @patch("ad_begone.utils.AudioSegment")
+    def test_split_by_frames_without_decoding(self, mock_audio_segment):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            test_file = Path(tmpdir) / "test.mp3"
+            test_file.write_bytes(_MP3_FRAME * 1000)
+
+            # ~0.4MB of frames with a 0.15MB limit should give 3 parts
+            result = split_file(str(test_file), max_file_size_mb=0.15)
+
+            self.assertEqual(len(result), 3)
+            mock_audio_segment.from_mp3.assert_not_called()
+            frame_counts = [len(read_frame_index(part)) for part in result]
+            self.assertEqual(sum(frame_counts), 1000)
+            for part in result:
+                self.assertLessEqual(os.path.getsize(part), 0.15 * 1024 * 1024)
+
+    def test_split_with_run_id(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            test_file = Path(tmpdir) / "test.mp3"
+            test_file.write_bytes(_MP3_FRAME * 10)
+
+            result = split_file(str(test_file), run_id="abc123")
+
+            self.assertEqual(result, [str(Path(tmpdir) / "part_0_abc123_test.mp3")])
+
+    def test_split_by_upload_bitrate(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            test_file = Path(tmpdir) / "test.mp3"
+            # ~26s at 128 kbps; at 32 kbps the upload copy is ~0.1MB
+            test_file.write_bytes(_MP3_FRAME * 1000)
+
+            self.assertEqual(len(split_file(str(test_file), max_file_size_mb=0.15)), 3)
+            self.assertEqual(
+                len(split_file(str(test_file), max_file_size_mb=0.15, upload_bitrate_kbps=32)),
+                1,
+            )
+
 
 class TestJoinFiles(TestCase):
 
@@ -328,3 +624,38 @@ class TestJoinFiles(TestCase):
 
             self.assertIn("joined_test.mp3", result)
             self.assertNotEqual(result, str(original_file))
+
+    def test_join_explicit_parts_ignores_other_runs(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmpdir_path = Path(tmpdir)
+            original_file = tmpdir_path / "a.mp3"
+            original_file.write_bytes(_MP3_FRAME)
+            ours = tmpdir_path / "part_0_run1_a.mp3"
+            ours.write_bytes(_MP3_FRAME * 2)
+            # Parts of a concurrent run, and of an episode named "b_a.mp3"
+            theirs = [tmpdir_path / "part_0_run2_a.mp3", tmpdir_path / "part_0_b_a.mp3"]
+            for part in theirs:
+                part.write_bytes(_MP3_FRAME * 5)
+
+            join_files(str(original_file), file_parts=[str(ours)])
+
+            self.assertEqual(original_file.read_bytes(), _MP3_FRAME * 2)
+            self.assertFalse(ours.exists())
+            for part in theirs:
+                self.assertTrue(part.exists())
+
+    @patch("ad_begone.utils.AudioSegment")
+    def test_join_by_frames_keeps_original_tag(self, mock_audio_segment):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmpdir_path = Path(tmpdir)
+            tag = b"ID3\x04\x00\x00\x00\x00\x00\x04" + b"\x00" * 4
+            original_file = tmpdir_path / "test.mp3"
+            original_file.write_bytes(tag + _MP3_FRAME * 10)
+            for i, n_frames in enumerate([3, 4]):
+                (tmpdir_path / f"part_{i}_test.mp3").write_bytes(_MP3_FRAME * n_frames)
+
+            result = join_files(str(original_file))
+
+            mock_audio_segment.from_mp3.assert_not_called()
+            self.assertEqual(Path(result).read_bytes(), tag + _MP3_FRAME * 7)
+            self.assertFalse((tmpdir_path / "part_0_test.mp3").exists())
@@ -1,20 +1,29 @@
 import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from unittest import TestCase
 from unittest.mock import Mock, patch
 
-from ad_begone.watch_directory import walk_directory
+from ad_begone.models import EpisodeResult
+from ad_begone.pipeline import StageLimits
+from ad_begone.scanner import LibraryScanner
+from ad_begone.state import StateStore
+from ad_begone.watch_directory import process_files, walk_directory, watch_inotify
+
+
+def _episode_result(file_name, **kwargs) -> EpisodeResult:
+    return EpisodeResult(file_name, elapsed=1.0, ad_seconds=30.0)
 
 
 class TestWalkDirectory(TestCase):
 
-    @patch("ad_begone.watch_directory.remove_ads")
+    @patch("ad_begone.watch_directory.remove_ads", side_effect=_episode_result)
     def test_walk_directory_empty(self, mock_remove_ads):
         with tempfile.TemporaryDirectory() as tmpdir:
             walk_directory(tmpdir)
             mock_remove_ads.assert_not_called()
 
-    @patch("ad_begone.watch_directory.remove_ads")
+    @patch("ad_begone.watch_directory.remove_ads", side_effect=_episode_result)
     def test_walk_directory_with_mp3_files(self, mock_remove_ads):
         with tempfile.TemporaryDirectory() as tmpdir:
             tmpdir_path = Path(tmpdir)
@@ -30,7 +39,7 @@ class TestWalkDirectory(TestCase):
             # Should be called twice, once for each MP3
             self.assertEqual(mock_remove_ads.call_count, 2)
 
-    @patch("ad_begone.watch_directory.remove_ads")
+    @patch("ad_begone.watch_directory.remove_ads", side_effect=_episode_result)
     def test_walk_directory_skips_processed_files(self, mock_remove_ads):
         with tempfile.TemporaryDirectory() as tmpdir:
             tmpdir_path = Path(tmpdir)
@@ -48,7 +57,7 @@ class TestWalkDirectory(TestCase):
             # Should not be called since file was already processed
             mock_remove_ads.assert_not_called()
 
-    @patch("ad_begone.watch_directory.remove_ads")
+    @patch("ad_begone.watch_directory.remove_ads", side_effect=_episode_result)
     def test_walk_directory_overwrite_processes_all(self, mock_remove_ads):
         with tempfile.TemporaryDirectory() as tmpdir:
             tmpdir_path = Path(tmpdir)
@@ -65,7 +74,7 @@ class TestWalkDirectory(TestCase):
             # Should be called even though hit file exists
             self.assertEqual(mock_remove_ads.call_count, 1)
 
-    @patch("ad_begone.watch_directory.remove_ads")
+    @patch("ad_begone.watch_directory.remove_ads", side_effect=_episode_result)
     def test_walk_directory_recursive(self, mock_remove_ads):
         with tempfile.TemporaryDirectory() as tmpdir:
             tmpdir_path = Path(tmpdir)
@@ -85,7 +94,7 @@ class TestWalkDirectory(TestCase):
             # Should find both files recursively
             self.assertEqual(mock_remove_ads.call_count, 2)
 
-    @patch("ad_begone.watch_directory.remove_ads")
+    @patch("ad_begone.watch_directory.remove_ads", side_effect=_episode_result)
     def test_walk_directory_ignores_non_mp3(self, mock_remove_ads):
         with tempfile.TemporaryDirectory() as tmpdir:
             tmpdir_path = Path(tmpdir)
@@ -104,3 +113,147 @@ class TestWalkDirectory(TestCase):
             self.assertEqual(mock_remove_ads.call_count, 1)
             call_args = mock_remove_ads.call_args[1]
             self.assertIn("podcast.mp3", call_args["file_name"])
+
+    @patch("ad_begone.watch_directory.remove_ads", side_effect=_episode_result)
+    def test_walk_directory_skips_work_files(self, mock_remove_ads):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmpdir_path = Path(tmpdir)
+            (tmpdir_path / "podcast.mp3").touch()
+            (tmpdir_path / "part_0_0a1b2c3d_podcast.mp3").touch()
+            (tmpdir_path / ".podcast.mp3.x1y2.mp3").touch()
+
+            walk_directory(tmpdir)
+
+            self.assertEqual(mock_remove_ads.call_count, 1)
+            self.assertIn("podcast.mp3", mock_remove_ads.call_args[1]["file_name"])
+
+    @patch("ad_begone.watch_directory.remove_ads", side_effect=_episode_result)
+    def test_walk_directory_processes_episodes_named_like_parts(self, mock_remove_ads):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            (Path(tmpdir) / "part_1_the_beginning.mp3").touch()
+
+            walk_directory(tmpdir)
+
+            self.assertEqual(mock_remove_ads.call_count, 1)
+
+    @patch("ad_begone.watch_directory.ProcessPoolExecutor")
+    @patch("ad_begone.watch_directory.remove_ads", side_effect=_episode_result)
+    def test_walk_directory_workers_isolate_failures(self, mock_remove_ads, mock_pool):
+        mock_pool.side_effect = lambda max_workers, **kwargs: ThreadPoolExecutor(max_workers)
+
+        def _remove_ads(file_name, **kwargs):
+            if "bad" in file_name:
+                raise RuntimeError("API error")
+
+        mock_remove_ads.side_effect = _remove_ads
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmpdir_path = Path(tmpdir)
+            for name in ("bad.mp3", "good1.mp3", "good2.mp3"):
+                (tmpdir_path / name).touch()
+
+            walk_directory(tmpdir, workers=2)
+
+            self.assertEqual(mock_pool.call_args[1]["max_workers"], 2)
+            processed = sorted(Path(c[1]["file_name"]).name for c in mock_remove_ads.call_args_list)
+            self.assertEqual(processed, ["bad.mp3", "good1.mp3", "good2.mp3"])
+
+    @patch("ad_begone.watch_directory.remove_ads", side_effect=_episode_result)
+    def test_walk_directory_records_state(self, mock_remove_ads):
+        def _remove_ads(file_name, **kwargs):
+            if "bad" in file_name:
+                raise RuntimeError("API error")
+            return EpisodeResult(file_name, elapsed=1.0, ad_seconds=30.0)
+
+        mock_remove_ads.side_effect = _remove_ads
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmpdir_path = Path(tmpdir)
+            for name in ("bad.mp3", "good.mp3"):
+                (tmpdir_path / name).touch()
+            state = StateStore(str(tmpdir_path / ".state.sqlite3"))
+
+            walk_directory(tmpdir, state=state)
+            walk_directory(tmpdir, state=state)
+
+            self.assertEqual(state.status(str(tmpdir_path / "good.mp3")), "done")
+            self.assertEqual(state.status(str(tmpdir_path / "bad.mp3")), "failed")
+            self.assertFalse((tmpdir_path / ".hit.good.mp3.txt").exists())
+            processed = [Path(c[1]["file_name"]).name for c in mock_remove_ads.call_args_list]
+            # The failed episode is retried; the finished one is not.
+            self.assertEqual(processed, ["bad.mp3", "good.mp3", "bad.mp3"])
+            self.assertFalse(mock_remove_ads.call_args[1]["hit_marker"])
+            state.close()
+
+    @patch("ad_begone.watch_directory.run_pipeline")
+    def test_pipeline_failures_record_their_error(self, mock_run_pipeline):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            episode = Path(tmpdir) / "bad.mp3"
+            episode.touch()
+            state = StateStore(str(Path(tmpdir) / ".state.sqlite3"))
+            state.observe([episode])
+            mock_run_pipeline.return_value = ([], [(str(episode), RuntimeError("API error"))])
+
+            process_files([episode], limits=StageLimits(), state=state)
+
+            self.assertEqual(state.status(str(episode)), "failed")
+            error = state._conn.execute("SELECT error FROM episodes WHERE path = ?", (str(episode),)).fetchone()[0]
+            self.assertEqual(error, "RuntimeError('API error')")
+            state.close()
+
+
+class TestWatchInotify(TestCase):
+
+    @patch("ad_begone.watch_directory.remove_ads", side_effect=_episode_result)
+    def test_processes_new_files_and_rescans(self, mock_remove_ads):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmpdir_path = Path(tmpdir)
+            existing = tmpdir_path / "existing.mp3"
+            new = tmpdir_path / "new.mp3"
+            done = tmpdir_path / "done.mp3"
+            for path in (existing, new, done):
+                path.touch()
+            (tmpdir_path / ".hit.done.mp3.txt").touch()
+
+            watcher = Mock()
+            watcher.directory = tmpdir_path
+            watcher.overflowed = False
+            watcher.poll.side_effect = [[new, done], KeyboardInterrupt()]
+
+            with self.assertRaises(KeyboardInterrupt):
+                watch_inotify(watcher, rescan_interval=3600)
+
+            processed = [Path(c[1]["file_name"]).name for c in mock_remove_ads.call_args_list]
+            # Start-up scan finds both unprocessed files; the event only adds new.mp3.
+            self.assertEqual(sorted(processed[:2]), ["existing.mp3", "new.mp3"])
+            self.assertEqual(processed[2:], ["new.mp3"])
+
+    @patch("ad_begone.watch_directory.remove_ads")
+    def test_new_files_with_scanner_and_state(self, mock_remove_ads):
+        mock_remove_ads.side_effect = lambda file_name, **kwargs: EpisodeResult(file_name, elapsed=1.0, ad_seconds=30.0)
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmpdir_path = Path(tmpdir)
+            (tmpdir_path / "existing.mp3").touch()
+            new = tmpdir_path / "new.mp3"
+
+            def _poll(timeout):
+                if new.exists():
+                    raise KeyboardInterrupt()
+                # Arrives after the start-up scan.
+                new.touch()
+                return [new]
+
+            watcher = Mock()
+            watcher.directory = tmpdir_path
+            watcher.overflowed = False
+            watcher.poll.side_effect = _poll
+            state = StateStore(str(tmpdir_path / ".state.sqlite3"))
+            self.addCleanup(state.close)
+
+            with self.assertRaises(KeyboardInterrupt):
+                watch_inotify(watcher, rescan_interval=3600, state=state, scanner=LibraryScanner(tmpdir))
+
+            processed = [Path(c[1]["file_name"]).name for c in mock_remove_ads.call_args_list]
+            self.assertEqual(processed, ["existing.mp3", "new.mp3"])
+            self.assertEqual(state.status(str(new)), "done")